@@ -50,6 +50,18 @@ def create_app(config_name='default'):
     app.config['JWT_REFRESH_COOKIE_PATH'] = '/api/auth'  # Path for refresh token cookie
     app.config['JWT_CSRF_IN_COOKIES'] = True
     
+    # Shopify sync mode: 'inline' syncs inside the request, 'outbox' queues
+    # the sync for the workers started with `flask sync-worker`
+    app.config['SHOPIFY_SYNC_MODE'] = os.getenv('SHOPIFY_SYNC_MODE', 'inline')
+    # While the Shopify circuit breaker is open, inline writes are rejected with
+    # 503 ('fail') or queued to the outbox ('outbox'). Only set 'outbox' where
+    # `flask sync-worker` runs; otherwise queued writes never reach Shopify.
+    app.config['SHOPIFY_BREAKER_FALLBACK'] = os.getenv('SHOPIFY_BREAKER_FALLBACK', 'fail')
+    
+    # Audit events: 'buffered' queues them for a background writer that inserts
+    # them in batches, 'sync' commits each one inside the request
+    app.config['EVENT_WRITE_MODE'] = os.getenv('EVENT_WRITE_MODE', 'buffered')
+    
     # Initialize MongoDB
     mongo_client = MongoClient(os.getenv('MONGODB_URI'))
     app.mongo = mongo_client.dookan
@@ -58,7 +70,7 @@ def create_app(config_name='default'):
     CORS(app, 
          resources={r"/api/*": {
              "origins": [os.getenv('FRONTEND_URL')],
-             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+             "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
              "allow_headers": ["Content-Type", "Authorization", "Accept", "X-CSRF-TOKEN"],
              "supports_credentials": True,
              "expose_headers": ["Content-Type", "Authorization"],
@@ -70,21 +82,51 @@ def create_app(config_name='default'):
     jwt.init_app(app)
     bcrypt.init_app(app)
     
-    # Create unique index on email field
-    with app.app_context():
-        app.mongo.users.create_index([('email', 1)], unique=True)
+    # Indexes are declared in helpers/index_helpers.py. Building missing ones
+    # at startup keeps fresh databases usable; set APPLY_INDEXES_ON_STARTUP=false
+    # where they are built ahead of a deploy with `flask apply-indexes`
+    app.config['APPLY_INDEXES_ON_STARTUP'] = os.getenv('APPLY_INDEXES_ON_STARTUP', 'true').lower() == 'true'
+    if app.config['APPLY_INDEXES_ON_STARTUP']:
+        from .helpers.index_helpers import apply_mongo_indexes
+        with app.app_context():
+            apply_mongo_indexes(app.mongo)
     
     # Register blueprints
     from .routes.auth import auth_bp
     from .routes.shopify import shopify_bp
     from .routes.events import events_bp
+    from .routes.metrics import metrics_bp
+    from .routes.webhooks import webhooks_bp
+    from .routes.thumbnails import thumbnails_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(shopify_bp, url_prefix='/api/products')
     app.register_blueprint(events_bp, url_prefix='/api/events')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+    app.register_blueprint(webhooks_bp, url_prefix='/api/shopify/webhooks')
+    app.register_blueprint(thumbnails_bp, url_prefix='/api/thumbnails')
+    
+    # Register CLI commands
+    from .commands import register_commands
+    register_commands(app)
     
     # Create database tables
     with app.app_context():
         db.create_all()
+        # identifier_events is partitioned by month; make sure inserts have somewhere to go
+        from .helpers.partition_helpers import ensure_event_partitions
+        try:
+            ensure_event_partitions()
+        except Exception as e:
+            app.logger.warning(f"Event partition check failed: {str(e)}")
+    
+    # Build the shared Shopify client now so the schema is loaded and all
+    # operations are validated before the first product write
+    if os.getenv('SHOPIFY_STORE_URL'):
+        from .helpers.shopify_helpers import get_shopify_client
+        try:
+            get_shopify_client()
+        except Exception as e:
+            app.logger.warning(f"Shopify client warm-up failed: {str(e)}")
     
     return app 
\ No newline at end of file
@@ -0,0 +1,166 @@
+import signal
+import threading
+import click
+from datetime import datetime, timezone, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('sync-worker')
+@click.option('--concurrency', default=4, show_default=True, help='Number of worker threads.')
+@with_appcontext
+def sync_worker_command(concurrency):
+    """Drain the product outbox to Shopify until interrupted"""
+    from .helpers.outbox_helpers import run_sync_worker
+
+    app = current_app._get_current_object()
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        app.logger.info("Stopping sync workers")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def target():
+        with app.app_context():
+            run_sync_worker(app.mongo, stop_event)
+
+    threads = [threading.Thread(target=target, name=f'sync-worker-{i}') for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    app.logger.info(f"Started {concurrency} sync workers")
+
+    # Waiting with a timeout keeps the main thread responsive to signals
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=1)
+
+
+@click.command('webhook-worker')
+@with_appcontext
+def webhook_worker_command():
+    """Apply queued Shopify product webhooks until interrupted"""
+    from .helpers.webhook_helpers import run_webhook_worker
+
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        current_app.logger.info("Stopping webhook worker")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    current_app.logger.info("Started webhook worker")
+    run_webhook_worker(current_app.mongo, stop_event)
+
+
+@click.command('reconcile-products')
+@click.option('--full', is_flag=True, help='Reconcile the whole catalog instead of changes since the last run.')
+@with_appcontext
+def reconcile_products_command(full):
+    """Apply product changes made in the Shopify admin to MongoDB"""
+    from .helpers.reconcile_helpers import reconcile_products
+
+    report = reconcile_products(current_app.mongo, full=full)
+    for key, value in report.items():
+        click.echo(f"{key}: {value}")
+
+
+@click.command('reindex-product-search')
+@with_appcontext
+def reindex_product_search_command():
+    """Write search tokens for products created before indexed search"""
+    from .helpers.search_helpers import backfill_search_tokens
+
+    click.echo(f"updated: {backfill_search_tokens(current_app.mongo)}")
+
+
+@click.command('apply-indexes')
+@click.option('--target', type=click.Choice(['all', 'mongo', 'postgres']), default='all', show_default=True)
+@click.pass_context
+@with_appcontext
+def apply_indexes_command(ctx, target):
+    """Build missing MongoDB and PostgreSQL indexes without blocking traffic"""
+    from .helpers.index_helpers import apply_mongo_indexes, apply_postgres_indexes
+
+    report = []
+    if target in ('all', 'mongo'):
+        report += apply_mongo_indexes(current_app.mongo)
+    if target in ('all', 'postgres'):
+        report += apply_postgres_indexes()
+    for row in report:
+        click.echo(f"{row['target']} {row['index']}: {row['status']}")
+    if any(row['status'].startswith('conflict') for row in report):
+        ctx.exit(1)
+
+
+@click.command('verify-indexes')
+@click.option('--target', type=click.Choice(['all', 'mongo', 'postgres']), default='all', show_default=True)
+@click.pass_context
+@with_appcontext
+def verify_indexes_command(ctx, target):
+    """Explain the application's queries and fail if any of them scans a whole collection or table"""
+    from .helpers.index_helpers import verify_mongo_indexes, verify_postgres_indexes
+
+    report = []
+    if target in ('all', 'mongo'):
+        report += verify_mongo_indexes(current_app.mongo)
+    if target in ('all', 'postgres'):
+        report += verify_postgres_indexes()
+    for row in report:
+        click.echo(f"{'ok  ' if row['ok'] else 'SCAN'} {row['query']}: {row['plan']}")
+    if not all(row['ok'] for row in report):
+        ctx.exit(1)
+
+
+@click.command('rebuild-event-counts')
+@click.option('--days', type=int, default=None,
+              help='Rebuild only the last N days instead of every day that has raw events.')
+@with_appcontext
+def rebuild_event_counts_command(days):
+    """Backfill or rebuild the event_daily_counts rollup from the raw events"""
+    from .helpers.postgres_helpers import rebuild_event_daily_counts
+
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).date() if days is not None else None
+    click.echo(f"rows: {rebuild_event_daily_counts(since)}")
+
+
+@click.command('partition-events')
+@click.option('--batch-size', type=int, default=None, help='Events copied per transaction.')
+@click.option('--drop-old', is_flag=True, help='Drop the unpartitioned table once every event has been copied.')
+@with_appcontext
+def partition_events_command(batch_size, drop_old):
+    """Move identifier_events to monthly partitions, copying existing events online"""
+    from .helpers.partition_helpers import EVENT_MIGRATION_BATCH_SIZE, partition_events_table
+
+    report = partition_events_table(batch_size=batch_size or EVENT_MIGRATION_BATCH_SIZE, drop_old=drop_old)
+    for key, value in report.items():
+        click.echo(f"{key}: {value}")
+
+
+@click.command('maintain-event-partitions')
+@click.option('--retention-days', type=int, default=None,
+              help='Drop months older than this; defaults to EVENT_RETENTION_DAYS (0 keeps everything).')
+@with_appcontext
+def maintain_event_partitions_command(retention_days):
+    """Create upcoming event partitions and drop expired ones"""
+    from .helpers.partition_helpers import EVENT_RETENTION_DAYS, maintain_event_partitions
+
+    report = maintain_event_partitions(EVENT_RETENTION_DAYS if retention_days is None else retention_days)
+    for key, value in report.items():
+        click.echo(f"{key}: {value}")
+
+
+def register_commands(app):
+    app.cli.add_command(sync_worker_command)
+    app.cli.add_command(webhook_worker_command)
+    app.cli.add_command(reconcile_products_command)
+    app.cli.add_command(reindex_product_search_command)
+    app.cli.add_command(apply_indexes_command)
+    app.cli.add_command(verify_indexes_command)
+    app.cli.add_command(rebuild_event_counts_command)
+    app.cli.add_command(partition_events_command)
+    app.cli.add_command(maintain_event_partitions_command)
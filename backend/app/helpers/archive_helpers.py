@@ -0,0 +1,161 @@
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+import pandas as pd
+import pyarrow.dataset as ds
+from .. import db
+
+logger = logging.getLogger(__name__)
+
+# Expired events are written here as Parquet, one directory per day and
+# event type, before retention removes them from PostgreSQL
+EVENT_ARCHIVE_ENABLED = os.getenv('EVENT_ARCHIVE_ENABLED', 'true').lower() == 'true'
+EVENT_ARCHIVE_DIR = os.getenv('EVENT_ARCHIVE_DIR', './.event_archive')
+EVENT_ARCHIVE_CHUNK_SIZE = int(os.getenv('EVENT_ARCHIVE_CHUNK_SIZE', 100000))
+
+ARCHIVE_COLUMNS = ['id', 'user_id', 'user_name', 'product_id', 'product_title', 'event_type', 'timestamp']
+_MANIFEST = '_manifest.json'
+
+
+def _manifest_path():
+    return os.path.join(EVENT_ARCHIVE_DIR, _MANIFEST)
+
+
+def archived_events_until():
+    """
+    Exclusive upper bound of the archived events, as a naive UTC datetime, or
+    None when nothing has been archived. Every event before it is read from
+    the archive and none from PostgreSQL, so a range is never counted twice.
+    """
+    try:
+        with open(_manifest_path()) as manifest:
+            return datetime.fromisoformat(json.load(manifest)['archived_until'])
+    except FileNotFoundError:
+        return None
+
+
+def _extend_archive(until):
+    current = archived_events_until()
+    if current is not None and current >= until:
+        return
+    os.makedirs(EVENT_ARCHIVE_DIR, exist_ok=True)
+    # Write then rename, so readers never see a half-written manifest
+    temp_path = _manifest_path() + '.tmp'
+    with open(temp_path, 'w') as manifest:
+        json.dump({'archived_until': until.isoformat()}, manifest)
+    os.replace(temp_path, _manifest_path())
+
+
+def write_archive_chunk(frame, basename):
+    """Append rows to the archive, partitioned into event_date=/event_type= directories"""
+    if frame.empty:
+        return 0
+    frame = frame.assign(event_date=frame['timestamp'].dt.strftime('%Y-%m-%d'))
+    frame.to_parquet(
+        EVENT_ARCHIVE_DIR,
+        engine='pyarrow',
+        compression='zstd',
+        index=False,
+        partition_cols=['event_date', 'event_type'],
+        # The same basename overwrites on a rerun instead of duplicating rows
+        basename_template=f'{basename}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore'
+    )
+    return len(frame)
+
+
+def archive_events(sql, basename, until, params=None):
+    """
+    Export the events a query returns to the archive, then move the archive's
+    upper bound to until. Rows are streamed from a server-side cursor in
+    EVENT_ARCHIVE_CHUNK_SIZE chunks. Returns the number of events written.
+    """
+    written = 0
+    with db.engine.connect().execution_options(stream_results=True) as conn:
+        chunks = pd.read_sql_query(sql, conn, params=params, chunksize=EVENT_ARCHIVE_CHUNK_SIZE)
+        for number, frame in enumerate(chunks):
+            written += write_archive_chunk(frame, f'{basename}-{number:05d}')
+    _extend_archive(until)
+    logger.info(f"Archived {written} events from {basename} to {EVENT_ARCHIVE_DIR}")
+    return written
+
+
+def _archive_dataset():
+    if archived_events_until() is None:
+        return None
+    return ds.dataset(EVENT_ARCHIVE_DIR, format='parquet', partitioning='hive',
+                      exclude_invalid_files=True, ignore_prefixes=['_', '.'])
+
+
+def _archive_filter(start_date, end_date, event_type=None, day=None):
+    """Filter on the partition columns (whole directories are skipped) and the timestamp (row groups are)"""
+    condition = ds.field('timestamp') < end_date
+    if start_date is not None:
+        condition &= ds.field('timestamp') >= start_date
+    if day is not None:
+        condition &= ds.field('event_date') == day.isoformat()
+    else:
+        if start_date is not None:
+            condition &= ds.field('event_date') >= start_date.date().isoformat()
+        condition &= ds.field('event_date') <= end_date.date().isoformat()
+    if event_type:
+        condition &= ds.field('event_type') == event_type
+    return condition
+
+
+def count_archived_events(start_date, end_date, event_type=None):
+    """Archived events with start_date <= timestamp < end_date, counted from Parquet metadata where possible"""
+    dataset = _archive_dataset()
+    if dataset is None:
+        return 0
+    return dataset.count_rows(filter=_archive_filter(start_date, end_date, event_type))
+
+
+def read_archived_events(start_date, end_date, event_type=None, before=None, offset=0, limit=20):
+    """
+    Archived events with start_date <= timestamp < end_date, newest first
+    by (timestamp, id), as event dictionaries.
+
+    before is a (timestamp, id) to continue after, like a page cursor. Days
+    are read newest first, each with its own pushed-down filter, and
+    reading stops as soon as offset + limit rows are found.
+    """
+    dataset = _archive_dataset()
+    if dataset is None:
+        return []
+    if before is not None:
+        end_date = min(end_date, before[0] + timedelta(microseconds=1))
+    wanted = offset + limit
+    frames, found = [], 0
+    day = end_date.date()
+    first_day = start_date.date() if start_date is not None else None
+    while found < wanted and (first_day is None or day >= first_day):
+        table = dataset.to_table(columns=ARCHIVE_COLUMNS, filter=_archive_filter(start_date, end_date, event_type, day))
+        if table.num_rows:
+            frame = table.to_pandas()
+            if before is not None:
+                last_timestamp, last_id = before
+                frame = frame[(frame['timestamp'] < last_timestamp) |
+                              ((frame['timestamp'] == last_timestamp) & (frame['id'] < last_id))]
+            frames.append(frame)
+            found += len(frame)
+        elif first_day is None and not dataset.count_rows(filter=ds.field('event_date') < day.isoformat()):
+            # Open-ended range and nothing older is archived
+            break
+        day -= timedelta(days=1)
+    if not frames:
+        return []
+    events = pd.concat(frames).sort_values(['timestamp', 'id'], ascending=False).iloc[offset:wanted]
+    return [
+        {
+            'id': int(row.id),
+            'user_id': row.user_id,
+            'user_name': row.user_name,
+            'product_id': row.product_id,
+            'product_title': row.product_title,
+            'event_type': str(row.event_type),
+            'timestamp': row.timestamp.to_pydatetime().isoformat()
+        }
+        for row in events.itertuples(index=False)
+    ]
@@ -0,0 +1,471 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from ..validations.product import ProductValidator
+from .mongo_helpers import (
+    insert_mongo_products,
+    remove_mongo_products,
+    backfill_mongo_shopify_ids,
+    fail_unsynced_mongo_products,
+    create_mongo_bulk_job,
+    update_mongo_bulk_job,
+    get_mongo_product_documents,
+    bulk_update_mongo_products
+)
+from .shopify_helpers import (
+    build_bulk_create_line,
+    stage_bulk_variables,
+    run_bulk_mutation,
+    wait_for_bulk_operation,
+    iter_bulk_results,
+    update_shopify_product,
+    delete_shopify_product,
+    shopify_error_status,
+    SHOPIFY_POOL_SIZE,
+    SHOPIFY_REQUEST_BUDGET
+)
+from .throttle_helpers import store_lock
+from .outbox_helpers import outbox_update, outbox_delete
+from .search_helpers import add_search_tokens
+from .thumbnail_helpers import schedule_product_thumbnail
+from .resilience_helpers import Deadline
+from .postgres_helpers import create_events
+from .event_writer_helpers import record_events
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 1000))
+# Shopify rejects bulk mutation variable files larger than 20MB
+BULK_MAX_FILE_BYTES = int(os.getenv('BULK_MAX_FILE_BYTES', 20 * 1024 * 1024))
+MAX_REPORTED_ERRORS = 100
+# Bulk update/delete: items per request, and Shopify calls in flight at once.
+# Every call still waits on the shared cost bucket, so concurrency never
+# outruns Shopify's rate limit; it only stops one slow call holding up the rest
+BULK_EDIT_MAX_ITEMS = int(os.getenv('BULK_EDIT_MAX_ITEMS', 500))
+BULK_SHOPIFY_CONCURRENCY = int(os.getenv('BULK_SHOPIFY_CONCURRENCY', SHOPIFY_POOL_SIZE))
+UPDATABLE_FIELDS = ['title', 'description', 'price', 'sku', 'image_url', 'status']
+
+
+
+def _bulk_mutation_lock():
+    """
+    Shopify runs one bulk mutation per shop at a time. This serializes imports
+    across every web process and worker on the host; imports started on
+    several hosts at once still race, and the loser's mutation is rejected.
+    """
+    return store_lock(os.getenv('SHOPIFY_STORE_URL', ''), 'bulk-mutation')
+
+
+class _ChunkWriter:
+    """Writes staged JSONL variable files, rolling over before Shopify's size limit"""
+
+    def __init__(self):
+        self.chunks = []
+        self._file = None
+        self._size = 0
+
+    def write(self, product_id, title, line):
+        encoded = line.encode('utf-8')
+        if self._file is None or self._size + len(encoded) > BULK_MAX_FILE_BYTES:
+            self._open()
+        self._file.write(encoded)
+        self._size += len(encoded)
+        self.chunks[-1]['product_ids'].append(str(product_id))
+        self.chunks[-1]['titles'].append(title)
+
+    def _open(self):
+        self.close()
+        self._file = tempfile.NamedTemporaryFile(prefix='bulk-products-', suffix='.jsonl', delete=False)
+        self._size = 0
+        self.chunks.append({'path': self._file.name, 'product_ids': [], 'titles': []})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        self.close()
+        for chunk in self.chunks:
+            _remove_file(chunk['path'])
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def stage_bulk_import(mongo, lines):
+    """
+    Validate a JSONL catalog in batches, insert valid products into MongoDB and
+    write them to staged Shopify variable files
+
+    Args:
+        mongo: MongoDB database handle
+        lines (iterable): Raw JSONL lines, e.g. the request stream
+
+    Returns:
+        dict: Accepted/rejected counts, the first rejection errors and the staged chunks
+    """
+    writer = _ChunkWriter()
+    summary = {'accepted': 0, 'rejected': 0, 'errors': []}
+    batch = []
+    inserted_ids = []
+
+    def reject(line_number, errors):
+        summary['rejected'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line_number, 'errors': errors})
+
+    def flush():
+        valid = []
+        for line_number, data in batch:
+            errors = ProductValidator.validate_create_data(data)
+            if errors:
+                reject(line_number, errors)
+            else:
+                valid.append(data)
+        batch.clear()
+
+        product_ids = insert_mongo_products(mongo, valid)
+        inserted_ids.extend(product_ids)
+        for product_id, data in zip(product_ids, valid):
+            writer.write(product_id, data['title'], build_bulk_create_line(data))
+        summary['accepted'] += len(product_ids)
+
+    try:
+        for line_number, raw_line in enumerate(lines, start=1):
+            raw_line = raw_line.strip()
+            if not raw_line:
+                continue
+            try:
+                data = json.loads(raw_line)
+            except ValueError:
+                reject(line_number, ["Line is not valid JSON"])
+                continue
+            if not isinstance(data, dict):
+                reject(line_number, ["Line must be a JSON object"])
+                continue
+
+            batch.append((line_number, data))
+            if len(batch) >= BULK_BATCH_SIZE:
+                flush()
+        flush()
+    except Exception as e:
+        writer.discard()
+        # Nothing was handed to Shopify yet, so remove the batches already inserted
+        try:
+            removed = remove_mongo_products(mongo, inserted_ids)
+        except Exception as rollback_error:
+            raise Exception(f"{str(e)}; rolling back {len(inserted_ids)} inserted products failed: {str(rollback_error)}")
+        if removed:
+            logger.info(f"Rolled back {removed} products from a failed bulk import")
+        raise
+    finally:
+        writer.close()
+
+    summary['chunks'] = writer.chunks
+    return summary
+
+
+def run_bulk_import(mongo, job_id, chunks, user_id, user_name):
+    """
+    Push staged chunks through Shopify bulk productCreate, back-fill shopify_ids
+    in MongoDB and record one create event per synced product.
+
+    If a chunk fails, the import stops: products in it and in every later chunk
+    that have no shopify_id are marked failed and counted in the job.
+    """
+    processed = 0
+    try:
+        for chunk in chunks:
+            with _bulk_mutation_lock():
+                staged_path = stage_bulk_variables(chunk['path'])
+                operation_id = run_bulk_mutation('bulkProductCreate', staged_path)
+                update_mongo_bulk_job(mongo, job_id, {'status': 'running', 'shopify_operation_id': operation_id})
+                operation = wait_for_bulk_operation(operation_id)
+
+            if operation['status'] != 'COMPLETED':
+                raise Exception(f"Bulk operation {operation_id} ended as {operation['status']} ({operation.get('errorCode')})")
+
+            product_ids = chunk['product_ids']
+            titles = dict(zip(product_ids, chunk['titles']))
+            synced = {}
+            for result in iter_bulk_results(operation.get('url')):
+                # __lineNumber is the zero-based line of the staged variables file
+                product_id = product_ids[result['__lineNumber']]
+                created = (result.get('data') or {}).get('productCreate') or {}
+                if created.get('product') and not created.get('userErrors'):
+                    synced[product_id] = created['product']['id']
+            failed = [product_id for product_id in product_ids if product_id not in synced]
+
+            backfill_mongo_shopify_ids(mongo, synced, failed)
+            try:
+                create_events([
+                    {
+                        'user_id': user_id,
+                        'user_name': user_name,
+                        'product_id': product_id,
+                        'product_title': titles[product_id],
+                        'event_type': 'create'
+                    }
+                    for product_id in synced
+                ])
+            except Exception as event_error:
+                logger.error(f"Failed to create bulk import events: {str(event_error)}")
+
+            update_mongo_bulk_job(mongo, job_id, {}, increments={'synced': len(synced), 'failed': len(failed)})
+            processed += 1
+            _remove_file(chunk['path'])
+
+        update_mongo_bulk_job(mongo, job_id, {'status': 'completed'})
+    except Exception as e:
+        logger.error(f"Bulk import {job_id} failed: {str(e)}")
+        abandoned = 0
+        error = str(e)
+        try:
+            for chunk in chunks[processed:]:
+                abandoned += fail_unsynced_mongo_products(mongo, chunk['product_ids'])
+        except Exception as mark_error:
+            logger.error(f"Failed to mark bulk import {job_id} products failed: {str(mark_error)}")
+            error = f"{error}; marking unprocessed products failed also failed: {str(mark_error)}"
+        update_mongo_bulk_job(mongo, job_id, {'status': 'failed', 'error': error}, increments={'failed': abandoned})
+        for chunk in chunks:
+            _remove_file(chunk['path'])
+
+
+def start_bulk_import(app, summary, user_id, user_name):
+    """Record a bulk import job and run the Shopify side in a background thread"""
+    job = create_mongo_bulk_job(app.mongo, {
+        'type': 'import',
+        'status': 'staged',
+        'accepted': summary['accepted'],
+        'rejected': summary['rejected'],
+        'synced': 0,
+        'failed': 0
+    })
+
+    def target():
+        with app.app_context():
+            run_bulk_import(app.mongo, job['_id'], summary['chunks'], user_id, user_name)
+
+    threading.Thread(target=target, name=f"bulk-import-{job['_id']}", daemon=True).start()
+    return job
+
+
+def product_update_fields(data):
+    """Stored fields for a product update request; empty when it has nothing to update"""
+    update_fields = {}
+    for field in UPDATABLE_FIELDS:
+        if field in data:
+            if field == 'price' and data[field] is not None:
+                update_fields[field] = float(data[field])
+            else:
+                update_fields[field] = data[field]
+    
+    # Show the full image until the new thumbnail is ready
+    if 'image_url' in update_fields:
+        update_fields['thumbnail_url'] = update_fields['image_url']
+    return update_fields
+
+
+def _fan_out_to_shopify(app, calls, failure_message):
+    """
+    Run one Shopify call per product concurrently.
+
+    Each call gets its own request budget, counted from when it starts, and
+    fails when it returns nothing. Returns product ID -> exception (None on success).
+    """
+    if not calls:
+        return {}
+
+    def run(call):
+        with app.app_context():
+            try:
+                if not call(Deadline(SHOPIFY_REQUEST_BUDGET)):
+                    raise Exception(failure_message)
+                return None
+            except Exception as e:
+                return e
+
+    workers = max(1, min(BULK_SHOPIFY_CONCURRENCY, len(calls)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-shopify') as executor:
+        futures = {product_id: executor.submit(run, call) for product_id, call in calls.items()}
+    return {product_id: future.result() for product_id, future in futures.items()}
+
+
+def _find_live_products(mongo, accepted, results):
+    """Load the accepted products with one query, turning missing or deleted ones into 404 results"""
+    stored = get_mongo_product_documents(mongo, list(accepted))
+    for product_id, index in list(accepted.items()):
+        document = stored.get(product_id)
+        if not document or document.get('is_deleted'):
+            results[index] = {'id': product_id, 'status': 404, 'error': 'Product not found'}
+            del accepted[product_id]
+    return stored
+
+
+def _record_bulk_events(user_id, user_name, event_type, titles):
+    try:
+        record_events([
+            {
+                'user_id': user_id,
+                'user_name': user_name,
+                'product_id': product_id,
+                'product_title': title,
+                'event_type': event_type
+            }
+            for product_id, title in titles.items()
+        ])
+    except Exception as event_error:
+        logger.error(f"Failed to record bulk {event_type} events: {str(event_error)}")
+
+
+def apply_bulk_update(app, items, user_id, user_name, queue_sync):
+    """
+    Update many products: validate every item, write all valid ones with one
+    bulk_write, sync them to Shopify concurrently and record their events
+    with one INSERT.
+
+    Args:
+        app: Flask application, for the Shopify worker threads
+        items (list): Objects with the product 'id' and the fields to update
+        user_id (str): Acting user's ID for the audit events
+        user_name (str): Acting user's name for the audit events
+        queue_sync (bool): Queue the Shopify side in the outbox instead of calling it
+
+    Returns:
+        list: One {'id', 'status'[, 'error' | 'errors']} result per item, in order
+    """
+    results = [None] * len(items)
+    accepted = {}
+    fields_by_id = {}
+    
+    # Step 1: Validate everything before writing anything
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {'id': None, 'status': 400, 'errors': ["Item must be a JSON object"]}
+            continue
+        product_id = item.get('id')
+        errors = ProductValidator.validate_product_id(product_id)
+        if not errors and product_id in accepted:
+            errors = ["Product is listed more than once"]
+        if not errors:
+            errors = ProductValidator.validate_update_data(item)
+        update_fields = product_update_fields(item) if not errors else {}
+        if not errors and not update_fields:
+            errors = ["No fields to update"]
+        if errors:
+            results[index] = {'id': product_id, 'status': 400, 'errors': errors}
+            continue
+        accepted[product_id] = index
+        fields_by_id[product_id] = update_fields
+    
+    stored = _find_live_products(app.mongo, accepted, results)
+    
+    # Step 2: One unordered bulk_write for every product that passed
+    now = datetime.now(timezone.utc)
+    if queue_sync:
+        updates = {product_id: outbox_update(fields_by_id[product_id], now) for product_id in accepted}
+    else:
+        updates = {
+            product_id: {'$set': add_search_tokens(dict(fields_by_id[product_id], updated_at=now))}
+            for product_id in accepted
+        }
+    for product_id, error in bulk_update_mongo_products(app.mongo, updates).items():
+        results[accepted.pop(product_id)] = {'id': product_id, 'status': 500, 'error': f"MongoDB update failed: {error}"}
+    
+    # Step 3: Shopify, concurrently; failed products are rolled back together
+    if not queue_sync:
+        calls = {
+            product_id: (lambda deadline, document=stored[product_id], fields=fields_by_id[product_id]:
+                         update_shopify_product(document['shopify_id'], fields, document, deadline=deadline))
+            for product_id in accepted if stored[product_id].get('shopify_id')
+        }
+        rollback = {}
+        for product_id, error in _fan_out_to_shopify(app, calls, "Failed to update product in Shopify").items():
+            if error is None:
+                continue
+            document = stored[product_id]
+            restored = {field: document.get(field) for field in fields_by_id[product_id]}
+            rollback[product_id] = {'$set': add_search_tokens(dict(restored, updated_at=document.get('updated_at')))}
+            results[accepted.pop(product_id)] = {
+                'id': product_id, 'status': shopify_error_status(error), 'error': f"Shopify update failed: {str(error)}"
+            }
+        for product_id, error in bulk_update_mongo_products(app.mongo, rollback).items():
+            logger.error(f"Failed to roll back bulk update of product {product_id}: {error}")
+    
+    # Step 4: Results, thumbnails and one INSERT for all audit events
+    titles = {}
+    for product_id, index in accepted.items():
+        fields = fields_by_id[product_id]
+        results[index] = {'id': product_id, 'status': 202 if queue_sync else 200}
+        if 'image_url' in fields:
+            schedule_product_thumbnail(app.mongo, product_id, fields['image_url'])
+        titles[product_id] = fields.get('title', stored[product_id].get('title'))
+    _record_bulk_events(user_id, user_name, 'update', titles)
+    return results
+
+
+def apply_bulk_delete(app, product_ids, user_id, user_name, queue_sync):
+    """
+    Soft delete many products the same way apply_bulk_update updates them.
+
+    Returns:
+        list: One {'id', 'status'[, 'error' | 'errors']} result per ID, in order
+    """
+    results = [None] * len(product_ids)
+    accepted = {}
+    
+    # Step 1: Validate everything before writing anything
+    for index, product_id in enumerate(product_ids):
+        errors = ProductValidator.validate_product_id(product_id)
+        if not errors and product_id in accepted:
+            errors = ["Product is listed more than once"]
+        if errors:
+            results[index] = {'id': product_id, 'status': 400, 'errors': errors}
+            continue
+        accepted[product_id] = index
+    
+    stored = _find_live_products(app.mongo, accepted, results)
+    
+    # Step 2: One unordered bulk_write for every product that passed
+    now = datetime.now(timezone.utc)
+    if queue_sync:
+        updates = {product_id: outbox_delete(now) for product_id in accepted}
+    else:
+        updates = {product_id: {'$set': {'is_deleted': True, 'updated_at': now}} for product_id in accepted}
+    for product_id, error in bulk_update_mongo_products(app.mongo, updates).items():
+        results[accepted.pop(product_id)] = {'id': product_id, 'status': 500, 'error': f"MongoDB deletion failed: {error}"}
+    
+    # Step 3: Shopify, concurrently; failed deletes are rolled back together
+    if not queue_sync:
+        calls = {
+            product_id: (lambda deadline, shopify_id=stored[product_id]['shopify_id']:
+                         delete_shopify_product(shopify_id, deadline=deadline))
+            for product_id in accepted if stored[product_id].get('shopify_id')
+        }
+        rollback = {}
+        for product_id, error in _fan_out_to_shopify(app, calls, "Failed to delete product from Shopify").items():
+            if error is None:
+                continue
+            rollback[product_id] = {'$set': {'is_deleted': False, 'updated_at': stored[product_id].get('updated_at')}}
+            results[accepted.pop(product_id)] = {
+                'id': product_id, 'status': shopify_error_status(error), 'error': f"Shopify deletion failed: {str(error)}"
+            }
+        for product_id, error in bulk_update_mongo_products(app.mongo, rollback, only_live=False).items():
+            logger.error(f"Failed to roll back bulk deletion of product {product_id}: {error}")
+    
+    # Step 4: Results and one INSERT for all audit events
+    titles = {}
+    for product_id, index in accepted.items():
+        results[index] = {'id': product_id, 'status': 202 if queue_sync else 200}
+        titles[product_id] = stored[product_id].get('title')
+    _record_bulk_events(user_id, user_name, 'delete', titles)
+    return results
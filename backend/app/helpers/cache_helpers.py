@@ -0,0 +1,241 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import bson
+from bson import json_util
+from pymongo.errors import OperationFailure, PyMongoError
+from .metrics_helpers import increment, register_gauge
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_COUNT_CACHE_TTL = float(os.getenv('PRODUCT_COUNT_CACHE_TTL', 30))
+PRODUCT_COUNT_CACHE_SIZE = int(os.getenv('PRODUCT_COUNT_CACHE_SIZE', 1024))
+# Memory cap for cached product documents (raw BSON bytes); 0 disables the cache
+PRODUCT_CACHE_MAX_BYTES = int(os.getenv('PRODUCT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+PRODUCT_CACHE_TTL = float(os.getenv('PRODUCT_CACHE_TTL', 60))
+PRODUCT_CACHE_CHANGE_STREAM = os.getenv('PRODUCT_CACHE_CHANGE_STREAM', 'true').lower() == 'true'
+# Approximate per-entry bookkeeping cost on top of the document bytes
+_ENTRY_OVERHEAD = 200
+# How many recent invalidations are remembered to reject racing fills
+_TOMBSTONES = 10000
+
+_product_cache = None
+_product_cache_pid = None
+_product_cache_lock = threading.Lock()
+
+
+class CountCache:
+    """
+    Query counts keyed by the normalized filter.
+
+    Writes in this process bump the generation, which drops every entry at
+    once; writes made by other processes are picked up when entries expire.
+    """
+
+    def __init__(self, name, ttl=PRODUCT_COUNT_CACHE_TTL, max_entries=PRODUCT_COUNT_CACHE_SIZE):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query):
+        return json_util.dumps(query, sort_keys=True)
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != self._generation or entry[2] < time.monotonic():
+                increment(f'{self.name}.misses')
+                return None
+            self._entries.move_to_end(key)
+        increment(f'{self.name}.hits')
+        return entry[0]
+
+    def set(self, key, count, generation):
+        """Store a count computed while generation was current; stale results are dropped"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (count, generation, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+product_counts = CountCache('products.count_cache')
+
+
+def invalidate_product_counts():
+    """Call after any write that can change which products a list query matches"""
+    product_counts.invalidate()
+
+
+class ProductCache:
+    """
+    LRU + TTL cache of product documents keyed by ObjectId.
+
+    Entries hold the raw BSON bytes, so the memory cap is measured exactly and
+    every hit decodes a fresh dict that callers are free to modify.
+    Invalidations come from writes in this process and, through a change
+    stream, from every other process writing to the collection.
+    """
+
+    def __init__(self, max_bytes=PRODUCT_CACHE_MAX_BYTES, ttl=PRODUCT_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # A fill racing an invalidation of the same key must not store the
+        # value it read before the write: each invalidation leaves a tombstone
+        self._sequence = 0
+        self._tombstones = OrderedDict()
+        self._tombstone_floor = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, product_id):
+        """Return a fresh dict for a cached document, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is not None and entry[1] < time.monotonic():
+                self._drop(product_id)
+                entry = None
+            if entry is None:
+                increment('product_cache.misses')
+                return None
+            self._entries.move_to_end(product_id)
+        increment('product_cache.hits')
+        return bson.decode(entry[0])
+
+    def begin_fill(self):
+        """Token to pass to put() for a document about to be read from MongoDB"""
+        with self._lock:
+            return self._sequence
+
+    def put(self, product_id, raw, token):
+        with self._lock:
+            invalidated_at = self._tombstones.get(product_id)
+            if token < self._tombstone_floor or (invalidated_at is not None and invalidated_at > token):
+                return
+            self._drop(product_id)
+            self._entries[product_id] = (raw, time.monotonic() + self.ttl)
+            self.bytes += len(raw) + _ENTRY_OVERHEAD
+            while self.bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                increment('product_cache.evictions')
+
+    def invalidate(self, product_id):
+        with self._lock:
+            self._sequence += 1
+            self._tombstones[product_id] = self._sequence
+            self._tombstones.move_to_end(product_id)
+            while len(self._tombstones) > _TOMBSTONES:
+                _, sequence = self._tombstones.popitem(last=False)
+                self._tombstone_floor = max(self._tombstone_floor, sequence)
+            self._drop(product_id)
+        increment('product_cache.invalidations')
+
+    def clear(self):
+        with self._lock:
+            self._sequence += 1
+            # Every fill started before now is suspect
+            self._tombstone_floor = self._sequence
+            self._tombstones.clear()
+            self._entries.clear()
+            self.bytes = 0
+        increment('product_cache.invalidations')
+
+    def _drop(self, product_id):
+        entry = self._entries.pop(product_id, None)
+        if entry is not None:
+            self.bytes -= len(entry[0]) + _ENTRY_OVERHEAD
+
+    def watch(self, mongo, stop_event=None):
+        """Invalidate entries from the products change stream until stop_event is set"""
+        resume_token = None
+        while stop_event is None or not stop_event.is_set():
+            try:
+                with mongo.products.watch(
+                    [{'$project': {'documentKey': 1}}],
+                    resume_after=resume_token,
+                    max_await_time_ms=1000
+                ) as stream:
+                    while stream.alive and (stop_event is None or not stop_event.is_set()):
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        if 'documentKey' in change:
+                            self.invalidate(change['documentKey']['_id'])
+                        else:
+                            # drop/rename/invalidate events
+                            self.clear()
+                        invalidate_product_counts()
+            except OperationFailure as e:
+                if e.code == 40573:
+                    # Standalone server: no change streams, entries only expire by TTL
+                    logger.warning("Product cache: change streams need a replica set; relying on TTL")
+                    return
+                logger.error(f"Product cache change stream failed: {str(e)}")
+                resume_token = None
+                self.clear()
+            except PyMongoError as e:
+                logger.error(f"Product cache change stream failed: {str(e)}")
+                # Events may have been missed while disconnected
+                self.clear()
+            if stop_event is not None:
+                stop_event.wait(1)
+            else:
+                time.sleep(1)
+
+
+def get_product_cache(mongo=None):
+    """Return the process-wide product cache, starting its change stream listener on first use"""
+    global _product_cache, _product_cache_pid
+
+    pid = os.getpid()
+    if _product_cache is not None and _product_cache_pid == pid:
+        return _product_cache
+
+    with _product_cache_lock:
+        # A forked worker gets its own cache and listener thread
+        if _product_cache is None or _product_cache_pid != pid:
+            cache = ProductCache()
+            if cache.enabled and PRODUCT_CACHE_CHANGE_STREAM and mongo is not None:
+                threading.Thread(
+                    target=cache.watch, args=(mongo,), name='product-cache-watch', daemon=True
+                ).start()
+            _product_cache = cache
+            _product_cache_pid = pid
+    return _product_cache
+
+
+def invalidate_cached_product(product_id=None):
+    """Drop one product (or, with no ID, all products) from this process's cache"""
+    if _product_cache is None or _product_cache_pid != os.getpid():
+        return
+    if product_id is None:
+        _product_cache.clear()
+    else:
+        _product_cache.invalidate(product_id)
+
+
+register_gauge('product_cache.bytes', lambda: _product_cache.bytes if _product_cache else 0)
+register_gauge('product_cache.entries', lambda: len(_product_cache._entries) if _product_cache else 0)
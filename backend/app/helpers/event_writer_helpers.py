@@ -0,0 +1,203 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from flask import current_app
+from .metrics_helpers import increment, observe, register_gauge
+from .resilience_helpers import backoff_delay
+from .postgres_helpers import create_events
+
+logger = logging.getLogger(__name__)
+
+# Events are flushed when this many are queued or the oldest has waited
+# EVENT_FLUSH_INTERVAL seconds, whichever comes first
+EVENT_BATCH_SIZE = int(os.getenv('EVENT_BATCH_SIZE', 500))
+EVENT_FLUSH_INTERVAL = float(os.getenv('EVENT_FLUSH_INTERVAL', 1))
+# Past this many queued events, callers write their own events inline
+EVENT_QUEUE_MAX = int(os.getenv('EVENT_QUEUE_MAX', 10000))
+EVENT_FLUSH_RETRIES = int(os.getenv('EVENT_FLUSH_RETRIES', 3))
+# How long a sync=True caller waits for its batch to commit
+EVENT_SYNC_TIMEOUT = float(os.getenv('EVENT_SYNC_TIMEOUT', 5))
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+class EventWriter:
+    """
+    Queues audit events in memory and writes them from a background thread
+    with one multi-row INSERT per batch, instead of a commit per event on the
+    request thread.
+
+    A caller that needs the event durable before it responds passes
+    sync=True: its event joins the next batch, which is flushed right away,
+    and the call returns once that batch has committed.
+    """
+
+    def __init__(self, app, batch_size=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL,
+                 max_queue=EVENT_QUEUE_MAX):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue = deque()
+        self._lock = threading.Lock()
+        # Only one batch is written at a time, so events commit in queue order
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='event-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def submit(self, events, sync=False, timeout=EVENT_SYNC_TIMEOUT):
+        """Queue events for the next flush; with sync=True, wait until they are committed"""
+        if not events:
+            return
+        future = Future() if sync else None
+        with self._lock:
+            accepted = not self._stop.is_set() and len(self._queue) + len(events) <= self.max_queue
+            if accepted:
+                for event in events[:-1]:
+                    self._queue.append((event, None))
+                # The last event carries the future: its batch commits after every earlier one
+                self._queue.append((events[-1], future))
+        if not accepted:
+            # Full (the database is slow or down) or shutting down: write inline
+            # rather than grow without bound or lose the events
+            increment('events.writer.overflow')
+            create_events(events)
+            return
+        if sync or self.depth >= self.batch_size:
+            self._wake.set()
+        if future is not None:
+            try:
+                future.result(timeout)
+            except FutureTimeoutError:
+                raise Exception(f"Event write not committed within {timeout}s")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Event writer flush failed: {str(e)}")
+        self.flush()
+
+    def flush(self):
+        """Write everything queued so far; returns the number of events committed"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    return written
+                written += self._write(batch)
+
+    def _write(self, batch):
+        events = [event for event, _ in batch]
+        futures = [future for _, future in batch if future is not None]
+        started = time.monotonic()
+        for attempt in range(EVENT_FLUSH_RETRIES + 1):
+            try:
+                with self.app.app_context():
+                    create_events(events)
+                break
+            except Exception as e:
+                if attempt < EVENT_FLUSH_RETRIES:
+                    time.sleep(backoff_delay(attempt, 0.1, 2))
+                    continue
+                increment('events.writer.dropped', len(events))
+                logger.error(f"Dropping {len(events)} audit events after {attempt + 1} failed writes: {str(e)}")
+                for future in futures:
+                    future.set_exception(e)
+                return 0
+        observe('events.writer.flush_seconds', time.monotonic() - started)
+        increment('events.writer.batches')
+        increment('events.writer.written', len(events))
+        for future in futures:
+            future.set_result(len(events))
+        return len(events)
+
+    def close(self, timeout=10):
+        """Stop accepting events and write out everything still queued"""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Event writer still flushing after {timeout}s; {self.depth} events queued")
+        else:
+            # Events that raced the stop signal
+            self.flush()
+
+
+def get_event_writer(app=None):
+    """Return the process-wide event writer, starting its flush thread on first use"""
+    global _writer, _writer_pid
+
+    pid = os.getpid()
+    if _writer is not None and _writer_pid == pid:
+        return _writer
+
+    with _writer_lock:
+        # A forked worker starts its own writer; the parent's queue is not ours to flush
+        if _writer is None or _writer_pid != pid:
+            _writer = EventWriter(app or current_app._get_current_object())
+            _writer_pid = pid
+    return _writer
+
+
+def flush_events():
+    """Write out this process's queued events now; returns the number written"""
+    if _writer is None or _writer_pid != os.getpid():
+        return 0
+    return _writer.flush()
+
+
+def _close_at_exit():
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.close()
+
+
+atexit.register(_close_at_exit)
+register_gauge('events.writer.queue_depth', lambda: _writer.depth if _writer else 0)
+
+
+def record_events(events, sync=False):
+    """
+    Record audit events through the buffered writer, or directly when
+    EVENT_WRITE_MODE is 'sync'
+
+    Args:
+        events (list): Dictionaries with the same keys as create_event's arguments
+        sync (bool): Return only once the events are committed
+    """
+    # Stamp now: a buffered event is inserted up to a flush interval later
+    now = datetime.now(timezone.utc)
+    events = [event if event.get('timestamp') else dict(event, timestamp=now) for event in events]
+    if current_app.config.get('EVENT_WRITE_MODE', 'buffered') == 'sync':
+        create_events(events)
+        return
+    get_event_writer().submit(events, sync=sync)
+
+
+def record_event(user_id, product_id, event_type, user_name=None, product_title=None, sync=False):
+    """Record one audit event; see record_events"""
+    record_events([{
+        'user_id': user_id,
+        'user_name': user_name,
+        'product_id': product_id,
+        'product_title': product_title,
+        'event_type': event_type
+    }], sync=sync)
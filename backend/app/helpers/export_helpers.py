@@ -0,0 +1,85 @@
+import io
+import os
+import csv
+import zlib
+import logging
+import itertools
+from .json_helpers import PRODUCT_JSON_VIEWS, iter_product_rows, products_to_ndjson
+
+logger = logging.getLogger(__name__)
+
+# Documents per cursor round trip, and rows per chunk written to the response
+PRODUCT_EXPORT_BATCH_SIZE = int(os.getenv('PRODUCT_EXPORT_BATCH_SIZE', 1000))
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def ndjson_chunks(rows, chunk_rows=PRODUCT_EXPORT_BATCH_SIZE):
+    """Encode rows as NDJSON, chunk_rows per yielded bytes chunk"""
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk:
+            return
+        yield products_to_ndjson(chunk)
+
+
+def csv_chunks(rows, columns, chunk_rows=PRODUCT_EXPORT_BATCH_SIZE):
+    """Encode rows as CSV with a header line, chunk_rows per yielded bytes chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        # Rows are built in column order, so their values line up with the header
+        writer.writerows(row.values() for row in chunk)
+        data = buffer.getvalue()
+        if data:
+            yield data.encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if not chunk:
+            return
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into one gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_product_export(cursor, export_format, view='full', compress=False):
+    """
+    Turn a product cursor into a generator of response chunks.
+
+    The first document is fetched before returning, so a failing query is
+    raised here, while an error status can still be sent. The cursor is
+    closed when the stream ends or the client goes away.
+    """
+    try:
+        first = next(cursor, None)
+    except Exception:
+        cursor.close()
+        raise
+    documents = itertools.chain([first], cursor) if first is not None else iter(())
+    rows = iter_product_rows(documents, view)
+    if export_format == 'csv':
+        chunks = csv_chunks(rows, PRODUCT_JSON_VIEWS[view])
+    else:
+        chunks = ndjson_chunks(rows)
+    if compress:
+        chunks = gzip_chunks(chunks)
+
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            # Headers are gone; dropping the connection is the only way left to signal it
+            logger.error(f"Product export failed mid-stream: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+    return generate()
@@ -0,0 +1,252 @@
+from datetime import datetime, timezone, timedelta
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+from sqlalchemy import select, desc, func, or_
+from .. import db
+from ..models.event import Event, EventDailyCount
+from .mongo_helpers import PRODUCT_SORT_FIELDS, product_seek_query
+from .search_helpers import SEARCH_TEXT_WEIGHTS, build_search_query
+from .outbox_helpers import outbox_due_query
+from .partition_helpers import table_kind, list_partitions
+from .webhook_helpers import WEBHOOK_RETENTION_SECONDS, webhook_due_query
+
+# MongoDB error codes for an index that exists with other options or another name
+_INDEX_CONFLICT_CODES = {85, 86}
+
+
+def _mongo_index(collection, keys, **options):
+    return {'collection': collection, 'keys': keys, 'options': options}
+
+
+# Every index the application's queries rely on. Names are left to MongoDB
+# (except the text index) so the spec matches indexes built before it existed.
+MONGO_INDEXES = [
+    _mongo_index('users', [('email', 1)], unique=True),
+    _mongo_index('products', [('outbox.next_attempt_at', 1)], sparse=True),
+    _mongo_index('products', [('shopify_id', 1)], sparse=True),
+    *[_mongo_index('products', [('is_deleted', 1), (field, 1), ('_id', 1)]) for field in PRODUCT_SORT_FIELDS],
+    _mongo_index(
+        'products',
+        [(field, 'text') for field in SEARCH_TEXT_WEIGHTS],
+        weights=SEARCH_TEXT_WEIGHTS,
+        name='product_search_text'
+    ),
+    _mongo_index('products', [('sku_ngrams', 1)]),
+    _mongo_index('products', [('sku', 1)]),
+    _mongo_index('webhook_events', [('webhook_id', 1)], unique=True),
+    _mongo_index('webhook_events', [('status', 1), ('received_at', 1)]),
+    _mongo_index('webhook_events', [('received_at', 1)], expireAfterSeconds=WEBHOOK_RETENTION_SECONDS),
+]
+
+# Mirrors Event.__table_args__: create_all builds these with a fresh table,
+# apply_postgres_indexes builds them without locking an existing one. On the
+# partitioned table each partition gets its own copy, named after it.
+POSTGRES_INDEXES = [
+    {'name': 'idx_events_user_timestamp', 'table': 'identifier_events', 'columns': 'user_id, timestamp DESC'},
+    {'name': 'idx_events_type_timestamp', 'table': 'identifier_events', 'columns': 'event_type, timestamp DESC'},
+    {'name': 'idx_events_timestamp', 'table': 'identifier_events', 'columns': 'timestamp DESC'},
+]
+
+
+def apply_mongo_indexes(mongo):
+    """
+    Build any missing MongoDB indexes from MONGO_INDEXES.
+
+    Existing indexes with the same keys and options are left alone, so this
+    is safe to run on every deploy. Builds run in the background and do not
+    block reads or writes. Returns one report row per index; an index that
+    exists with different options is reported as 'conflict', not rebuilt.
+    """
+    report = []
+    for spec in MONGO_INDEXES:
+        collection = mongo[spec['collection']]
+        existing = {tuple(info['key']) for info in collection.index_information().values()}
+        keys = spec['keys']
+        try:
+            name = collection.create_index(keys, background=True, **spec['options'])
+            status = 'exists' if tuple(keys) in existing else 'created'
+        except OperationFailure as e:
+            if e.code not in _INDEX_CONFLICT_CODES:
+                raise Exception(f"MongoDB index build failed: {str(e)}")
+            name, status = str(keys), f"conflict: {str(e)}"
+        report.append({'target': f"mongo.{spec['collection']}", 'index': name, 'status': status})
+    return report
+
+
+def _index_validity(conn, name):
+    """True or False for an index's pg_index.indisvalid, None if it does not exist"""
+    return conn.exec_driver_sql(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %(name)s",
+        {'name': name}
+    ).scalar()
+
+
+def _create_index_concurrently(conn, name, table, columns):
+    valid = _index_validity(conn, name)
+    if valid is False:
+        conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    conn.exec_driver_sql(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+    return valid
+
+
+def _create_partitioned_index(conn, spec):
+    """
+    CONCURRENTLY is not supported on a partitioned table, so the parent index
+    is created ON ONLY the parent, where it stays invalid, then each
+    partition's index is built concurrently and attached. Once every
+    partition has one, the parent index becomes valid.
+    """
+    conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {spec['name']} ON ONLY {spec['table']} ({spec['columns']})")
+    for partition, _ in list_partitions(conn, spec['table']):
+        # Partitions created after the parent index get their own copy of it
+        attached = conn.exec_driver_sql(
+            "SELECT 1 FROM pg_inherits i JOIN pg_index x ON x.indexrelid = i.inhrelid "
+            "WHERE i.inhparent = %(parent)s::regclass AND x.indrelid = %(partition)s::regclass",
+            {'parent': spec['name'], 'partition': partition}
+        ).scalar()
+        if attached:
+            continue
+        child = f"{partition}_{spec['name']}"
+        _create_index_concurrently(conn, child, partition, spec['columns'])
+        conn.exec_driver_sql(f"ALTER INDEX {spec['name']} ATTACH PARTITION {child}")
+
+
+def apply_postgres_indexes():
+    """
+    Build any missing PostgreSQL indexes from POSTGRES_INDEXES with CREATE INDEX CONCURRENTLY.
+
+    A concurrent build that failed leaves an invalid index behind, which IF
+    NOT EXISTS would then skip, so invalid ones are dropped and rebuilt. On a
+    partitioned table the index is built partition by partition.
+    """
+    report = []
+    # CONCURRENTLY cannot run inside a transaction block
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for spec in POSTGRES_INDEXES:
+            valid = _index_validity(conn, spec['name'])
+            if valid:
+                report.append({'target': f"postgres.{spec['table']}", 'index': spec['name'], 'status': 'exists'})
+                continue
+            if table_kind(conn, spec['table']) == 'p':
+                _create_partitioned_index(conn, spec)
+            else:
+                _create_index_concurrently(conn, spec['name'], spec['table'], spec['columns'])
+            status = 'rebuilt' if valid is False else 'created'
+            report.append({'target': f"postgres.{spec['table']}", 'index': spec['name'], 'status': status})
+    return report
+
+
+def canonical_mongo_queries():
+    """(name, collection, filter, sort) for the queries the API and workers run"""
+    now = datetime.now(timezone.utc)
+    listed = {'is_deleted': False}
+    queries = [
+        (f'products.list.{field}', 'products', listed, [(field, -1), ('_id', -1)])
+        for field in PRODUCT_SORT_FIELDS
+    ]
+    queries += [
+        ('products.list.cursor', 'products',
+         {'$and': [listed, product_seek_query('created_at', -1, now, ObjectId())]},
+         [('created_at', -1), ('_id', -1)]),
+        ('products.search', 'products', dict(listed, **build_search_query('shirt')), [('created_at', -1), ('_id', -1)]),
+        ('products.search.short', 'products', dict(listed, **build_search_query('ab')), [('created_at', -1), ('_id', -1)]),
+        ('products.by_id', 'products', {'_id': ObjectId()}, None),
+        ('products.by_shopify_id', 'products', {'shopify_id': 'gid://shopify/Product/0'}, None),
+        ('products.outbox_claim', 'products', outbox_due_query(now), [('outbox.next_attempt_at', 1)]),
+        ('users.by_email', 'users', {'email': 'someone@example.com'}, None),
+        ('webhook_events.claim', 'webhook_events', webhook_due_query(now), [('received_at', 1)]),
+    ]
+    return queries
+
+
+def canonical_postgres_queries():
+    """(name, statement) for the event queries built in postgres_helpers"""
+    now = datetime.now(timezone.utc)
+    week_ago = now - timedelta(days=7)
+    return [
+        ('events.user', select(Event).where(Event.user_id == 'user').order_by(desc(Event.timestamp)).limit(20)),
+        ('events.user.type_range', select(Event).where(
+            Event.user_id == 'user', Event.event_type == 'update', Event.timestamp.between(week_ago, now)
+        ).order_by(desc(Event.timestamp)).limit(20)),
+        ('events.timerange', select(Event).where(
+            Event.timestamp.between(week_ago, now)
+        ).order_by(desc(Event.timestamp)).limit(20)),
+        ('events.timerange.cursor', select(Event).where(
+            Event.timestamp.between(week_ago, now), Event.timestamp <= now,
+            or_(Event.timestamp < now, Event.id < 1000)
+        ).order_by(desc(Event.timestamp), desc(Event.id)).limit(21)),
+        ('events.timerange.type', select(Event).where(
+            Event.event_type == 'update', Event.timestamp.between(week_ago, now)
+        ).order_by(desc(Event.timestamp)).limit(20)),
+        ('events.daily_counts', select(EventDailyCount).where(
+            EventDailyCount.date >= week_ago.date(), EventDailyCount.date < now.date()
+        )),
+        ('events.daily_counts.today', select(Event.event_type, func.count(Event.id)).where(
+            Event.timestamp >= now - timedelta(hours=1)
+        ).group_by(Event.event_type)),
+        ('events.expired', select(func.count()).select_from(Event).where(Event.timestamp < week_ago)),
+    ]
+
+
+def _mongo_stages(plan):
+    """Stage names of a winning plan, outermost first, with the index each scan used"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(f"{plan['stage']}({plan['indexName']})" if 'indexName' in plan else plan['stage'])
+        for value in plan.values():
+            stages.extend(_mongo_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_mongo_stages(value))
+    return stages
+
+
+def _postgres_nodes(plan):
+    node = plan['Node Type'] + (f"({plan['Index Name']})" if 'Index Name' in plan else '')
+    nodes = [node]
+    for child in plan.get('Plans', []):
+        nodes.extend(_postgres_nodes(child))
+    return nodes
+
+
+def verify_mongo_indexes(mongo):
+    """Explain each canonical MongoDB query; a row is not ok when its plan contains a COLLSCAN"""
+    report = []
+    for name, collection, query, sort in canonical_mongo_queries():
+        cursor = mongo[collection].find(query).limit(21)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = _mongo_stages(plan)
+        report.append({
+            'query': name,
+            'ok': not any(stage.startswith('COLLSCAN') for stage in stages),
+            'plan': ' > '.join(stages)
+        })
+    return report
+
+
+def verify_postgres_indexes():
+    """
+    Explain each canonical event query; a row is not ok when its plan contains a Seq Scan.
+
+    Sequential scans are disabled for the check, because on a small table the
+    planner picks one even where an index exists; what is verified is that
+    some index can serve the query once the table is large.
+    """
+    report = []
+    with db.engine.connect() as conn:
+        with conn.begin() as transaction:
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            for name, statement in canonical_postgres_queries():
+                compiled = statement.compile(dialect=conn.dialect)
+                plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+                nodes = _postgres_nodes(plan[0]['Plan'])
+                report.append({
+                    'query': name,
+                    'ok': not any(node.startswith('Seq Scan') for node in nodes),
+                    'plan': ' > '.join(nodes)
+                })
+            transaction.rollback()
+    return report
@@ -0,0 +1,122 @@
+import json
+from datetime import timezone
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+# Read product pages as RawBSONDocument and go straight from BSON to JSON,
+# without Product objects or Flask's per-value type dispatch
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+_DAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _http_date(value):
+    """
+    The HTTP-date jsonify writes for a datetime, so the list matches the
+    other product responses; werkzeug's http_date is several times slower.
+    Stored datetimes are UTC (naive unless the client is tz_aware).
+    """
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return (f"{_DAY_NAMES[value.weekday()]}, {value.day:02d} {_MONTH_NAMES[value.month - 1]} "
+            f"{value.year:04d} {value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT")
+
+
+def _str(value):
+    return str(value) if value is not None else None
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+# output key -> (stored key, default when missing, converter). A default of
+# ('field', name) falls back to another stored field, as Product.from_dict does.
+# Mirrors Product.to_dict / to_table_dict / to_modal_dict for stored documents.
+PRODUCT_JSON_FIELDS = {
+    'id': ('_id', None, _str),
+    'mongo_id': ('_id', None, _str),
+    'title': ('title', None, None),
+    'description': ('description', None, None),
+    'price': ('price', None, _float),
+    'currency': ('currency', 'USD', None),
+    'price_text': ('price_text', None, None),
+    'sku': ('sku', None, None),
+    'image_url': ('image_url', None, None),
+    'thumbnail_url': ('thumbnail_url', ('field', 'image_url'), None),
+    'shopify_id': ('shopify_id', None, None),
+    'status': ('status', 'draft', None),
+    'created_at': ('created_at', None, _http_date),
+    'updated_at': ('updated_at', None, _http_date),
+    'last_sync': ('last_sync', None, _http_date),
+    'is_deleted': ('is_deleted', False, None),
+}
+PRODUCT_JSON_VIEWS = {
+    'full': list(PRODUCT_JSON_FIELDS),
+    'table': ['id', 'title', 'sku', 'price', 'currency', 'thumbnail_url', 'status'],
+    'modal': ['id', 'title', 'description', 'price', 'currency', 'image_url'],
+}
+
+
+def compile_row_mapper(keys, fields=PRODUCT_JSON_FIELDS):
+    """
+    Build a function mapping a stored document to its JSON-ready dict.
+
+    The mapping is generated as a single dict display, like namedtuple does
+    for its classes, so a row costs one call instead of a loop over fields.
+    """
+    namespace = {}
+    items = []
+    for i, key in enumerate(keys):
+        source, default, convert = fields[key]
+        if isinstance(default, tuple):
+            expr = f"get({source!r}, get({default[1]!r}))"
+        elif default is not None:
+            expr = f"get({source!r}, {default!r})"
+        else:
+            expr = f"get({source!r})"
+        if convert is not None:
+            namespace[f'convert_{i}'] = convert
+            expr = f"convert_{i}({expr})"
+        items.append(f"{key!r}: {expr}")
+    source_code = "def map_row(document):\n    get = document.get\n    return {" + ", ".join(items) + "}\n"
+    exec(source_code, namespace)
+    return namespace['map_row']
+
+
+_ROW_MAPPERS = {view: compile_row_mapper(keys) for view, keys in PRODUCT_JSON_VIEWS.items()}
+
+
+def iter_product_rows(documents, view='full'):
+    """Map stored product documents (raw or decoded) to JSON-ready dicts, one at a time"""
+    map_row = _ROW_MAPPERS[view]
+    for document in documents:
+        if isinstance(document, RawBSONDocument):
+            # One C-level decode of the bytes; RawBSONDocument's own lazy
+            # inflation builds the dict element by element in Python
+            document = bson.decode(document.raw)
+        yield map_row(document)
+
+
+def products_to_json(documents, view='full'):
+    """Transcode stored product documents (raw or decoded) to a JSON array as bytes"""
+    return _encoder.encode(list(iter_product_rows(documents, view))).encode('utf-8')
+
+
+def products_to_ndjson(rows):
+    """Encode JSON-ready rows as newline-delimited JSON bytes"""
+    return ''.join(_encoder.encode(row) + '\n' for row in rows).encode('utf-8')
+
+
+def json_object_with(raw_key, raw_value, fields):
+    """Encode fields as a JSON object with one member spliced in from pre-encoded bytes"""
+    rest = _encoder.encode(fields).encode('utf-8')
+    member = _encoder.encode(raw_key).encode('utf-8') + b':' + raw_value
+    return b'{' + member + (b',' + rest[1:] if len(rest) > 2 else b'}')
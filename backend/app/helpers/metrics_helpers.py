@@ -0,0 +1,67 @@
+import threading
+from collections import defaultdict
+
+# In-process metrics registry. Each web process and worker keeps its own
+# numbers; GET /api/metrics returns the snapshot of the process that served it.
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_timings = {}
+_gauge_callbacks = {}
+
+
+def increment(name, value=1):
+    """Add to a monotonically increasing counter"""
+    with _lock:
+        _counters[name] += value
+
+
+def get_counter(name):
+    """Read the current value of a counter"""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def set_gauge(name, value):
+    """Record the current value of a gauge"""
+    with _lock:
+        _gauges[name] = value
+
+
+def register_gauge(name, callback):
+    """Register a gauge whose value is read from callback at snapshot time"""
+    with _lock:
+        _gauge_callbacks[name] = callback
+
+
+def observe(name, value):
+    """Record one observation (usually seconds) of a timing series"""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {'count': 0, 'sum': 0.0, 'max': 0.0}
+        timing['count'] += 1
+        timing['sum'] += value
+        if value > timing['max']:
+            timing['max'] = value
+
+
+def snapshot():
+    """Return a JSON-serializable copy of all metrics"""
+    with _lock:
+        gauges = dict(_gauges)
+        callbacks = dict(_gauge_callbacks)
+        result = {
+            'counters': dict(_counters),
+            'timings': {
+                name: dict(timing, avg=timing['sum'] / timing['count'] if timing['count'] else 0.0)
+                for name, timing in _timings.items()
+            }
+        }
+    for name, callback in callbacks.items():
+        try:
+            gauges[name] = callback()
+        except Exception:
+            gauges[name] = None
+    result['gauges'] = gauges
+    return result
@@ -1,7 +1,16 @@
+import os
+import base64
 from datetime import datetime, timezone
+import bson
+from bson import json_util
 from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from ..models.product import Product
 from ..models.user import User
+from .search_helpers import add_search_tokens, build_search_query, search_term
+from .cache_helpers import product_counts, invalidate_product_counts, get_product_cache, invalidate_cached_product
+from .json_helpers import RAW_CODEC_OPTIONS
 
 def create_mongo_product(mongo, product_data):
     """Create a product in MongoDB"""
@@ -13,7 +22,8 @@ def create_mongo_product(mongo, product_data):
             sku=product_data['sku'],
             image_url=product_data.get('image_url')
         )
-        result = mongo.products.insert_one(product.to_dict())
+        result = mongo.products.insert_one(add_search_tokens(product.to_dict()))
+        invalidate_product_counts()
         product._id = result.inserted_id
         return product
     except Exception as e:
@@ -23,11 +33,14 @@ def update_mongo_product(mongo, product_id, update_fields):
     """Update a product in MongoDB"""
     try:
         update_fields['updated_at'] = datetime.now(timezone.utc)
+        add_search_tokens(update_fields)
         
         result = mongo.products.update_one(
             {'_id': ObjectId(product_id)},
             {'$set': update_fields}
         )
+        invalidate_product_counts()
+        invalidate_cached_product(ObjectId(product_id))
         
         if result.modified_count == 0:
             raise Exception("No document was updated")
@@ -55,6 +68,8 @@ def delete_mongo_product(mongo, product_id):
             {'_id': ObjectId(product_id)},
             {'$set': product.to_dict()}
         )
+        invalidate_product_counts()
+        invalidate_cached_product(ObjectId(product_id))
         
         if result.modified_count == 0:
             raise Exception("No document was deleted")
@@ -63,53 +78,438 @@ def delete_mongo_product(mongo, product_id):
     except Exception as e:
         raise Exception(f"MongoDB deletion failed: {str(e)}")
 
-def get_mongo_products(mongo, sort_field='created_at', sort_order='desc', page=1, per_page=20, search_query=None):
-    """Get paginated and sorted products from MongoDB with optional search"""
+def insert_mongo_products(mongo, products_data):
+    """
+    Create many products in MongoDB with a single insert_many and return their IDs.
+    All or nothing: if the insert fails part way, the documents it did insert are removed.
+    """
+    try:
+        documents = [
+            add_search_tokens(Product(
+                title=data['title'],
+                description=data['description'],
+                price=data['price'],
+                sku=data['sku'],
+                image_url=data.get('image_url')
+            ).to_dict())
+            for data in products_data
+        ]
+        if not documents:
+            return []
+        # IDs are assigned up front so a partial insert can be removed by ID
+        product_ids = [ObjectId() for _ in documents]
+        for document, product_id in zip(documents, product_ids):
+            document['_id'] = product_id
+        try:
+            mongo.products.insert_many(documents, ordered=True)
+        except Exception as insert_error:
+            try:
+                remove_mongo_products(mongo, product_ids)
+            except Exception as rollback_error:
+                raise Exception(f"{str(insert_error)}; rollback failed: {str(rollback_error)}")
+            raise
+        invalidate_product_counts()
+        return product_ids
+    except Exception as e:
+        raise Exception(f"MongoDB bulk creation failed: {str(e)}")
+
+def remove_mongo_products(mongo, product_ids):
+    """
+    Permanently remove products that never reached Shopify, to roll back a failed
+    import. Products that have a shopify_id are left alone. Returns the number removed.
+    """
+    try:
+        object_ids = [ObjectId(product_id) for product_id in product_ids]
+        if not object_ids:
+            return 0
+        result = mongo.products.delete_many({'_id': {'$in': object_ids}, 'shopify_id': None})
+        invalidate_product_counts()
+        return result.deleted_count
+    except Exception as e:
+        raise Exception(f"MongoDB bulk removal failed: {str(e)}")
+
+def backfill_mongo_shopify_ids(mongo, synced, failed):
+    """Record bulk sync results: synced maps product ID to shopify_id, failed lists product IDs"""
+    try:
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne(
+                {'_id': ObjectId(product_id)},
+                {'$set': {'shopify_id': shopify_id, 'status': 'synced', 'last_sync': now, 'updated_at': now}}
+            )
+            for product_id, shopify_id in synced.items()
+        ]
+        operations.extend(
+            UpdateOne({'_id': ObjectId(product_id)}, {'$set': {'status': 'failed', 'updated_at': now}})
+            for product_id in failed
+        )
+        if not operations:
+            return 0
+        result = mongo.products.bulk_write(operations, ordered=False)
+        for product_id in list(synced) + list(failed):
+            invalidate_cached_product(ObjectId(product_id))
+        return result.modified_count
+    except Exception as e:
+        raise Exception(f"MongoDB bulk update failed: {str(e)}")
+
+def fail_unsynced_mongo_products(mongo, product_ids):
+    """Mark products of an abandoned bulk sync failed, skipping any already given a shopify_id"""
+    try:
+        object_ids = [ObjectId(product_id) for product_id in product_ids]
+        if not object_ids:
+            return 0
+        result = mongo.products.update_many(
+            {'_id': {'$in': object_ids}, 'shopify_id': None},
+            {'$set': {'status': 'failed', 'updated_at': datetime.now(timezone.utc)}}
+        )
+        for object_id in object_ids:
+            invalidate_cached_product(object_id)
+        return result.modified_count
+    except Exception as e:
+        raise Exception(f"MongoDB bulk update failed: {str(e)}")
+
+def get_mongo_product_documents(mongo, product_ids):
+    """Get many product documents with one query, keyed by ID string; deleted products included"""
+    try:
+        object_ids = [ObjectId(product_id) for product_id in product_ids]
+        return {str(document['_id']): document for document in mongo.products.find({'_id': {'$in': object_ids}})}
+    except Exception as e:
+        raise Exception(f"MongoDB fetch failed: {str(e)}")
+
+def bulk_update_mongo_products(mongo, updates, only_live=True):
+    """
+    Apply one update document per product with a single unordered bulk_write.
+
+    Args:
+        updates (dict): Product ID string -> update document
+        only_live (bool): Skip products that are soft deleted
+
+    Returns:
+        dict: Product ID -> error message for the writes that failed
+    """
+    if not updates:
+        return {}
+    product_ids = list(updates)
+    live = {'is_deleted': False} if only_live else {}
+    operations = [UpdateOne({'_id': ObjectId(product_id), **live}, updates[product_id]) for product_id in product_ids]
+    failed = {}
+    try:
+        mongo.products.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Unordered: every other operation was still applied
+        for error in e.details.get('writeErrors', []):
+            failed[product_ids[error['index']]] = error.get('errmsg', 'Write failed')
+    except Exception as e:
+        raise Exception(f"MongoDB bulk update failed: {str(e)}")
+    finally:
+        invalidate_product_counts()
+        for product_id in product_ids:
+            invalidate_cached_product(ObjectId(product_id))
+    return failed
+
+def create_mongo_bulk_job(mongo, job_data):
+    """Create a bulk job status record in MongoDB"""
+    try:
+        now = datetime.now(timezone.utc)
+        job = dict(job_data, created_at=now, updated_at=now)
+        result = mongo.bulk_jobs.insert_one(job)
+        job['_id'] = result.inserted_id
+        return job
+    except Exception as e:
+        raise Exception(f"MongoDB bulk job creation failed: {str(e)}")
+
+def update_mongo_bulk_job(mongo, job_id, update_fields, increments=None):
+    """Update a bulk job status record in MongoDB"""
+    try:
+        update = {'$set': dict(update_fields, updated_at=datetime.now(timezone.utc))}
+        if increments:
+            update['$inc'] = increments
+        mongo.bulk_jobs.update_one({'_id': ObjectId(job_id)}, update)
+    except Exception as e:
+        raise Exception(f"MongoDB bulk job update failed: {str(e)}")
+
+def get_mongo_bulk_job(mongo, job_id):
+    """Get a bulk job status record by ID from MongoDB"""
+    try:
+        job = mongo.bulk_jobs.find_one({'_id': ObjectId(job_id)})
+        if not job:
+            raise Exception("Bulk job not found")
+        return job
+    except Exception as e:
+        raise Exception(f"MongoDB fetch failed: {str(e)}")
+
+def _reconcile_update(fields, now):
+    """
+    Pipeline update setting Shopify's values, and updated_at only when one of
+    them differs, so unchanged documents stay unmodified
+    """
+    values = {field: {'$literal': value} for field, value in fields.items()}
+    changed = {'$or': [{'$ne': [f'${field}', value]} for field, value in values.items()]}
+    return [{'$set': dict(values, updated_at={'$cond': [changed, now, '$updated_at']})}]
+
+def reconcile_mongo_products(mongo, product_updates, variant_updates):
+    """
+    Apply Shopify field values to products keyed by shopify_id.
+    Only changed documents are modified, so modified counts measure drift.
+    Products with an unsynced local edit in the outbox, and deleted
+    products, are left alone: the outbox will push the edit to Shopify.
+    """
+    try:
+        now = datetime.now(timezone.utc)
+        counts = {'products_matched': 0, 'products_drifted': 0, 'variants_drifted': 0}
+
+        def query(shopify_id):
+            return {'shopify_id': shopify_id, 'outbox': {'$exists': False}, 'is_deleted': {'$ne': True}}
+
+        if product_updates:
+            result = mongo.products.bulk_write(
+                [UpdateOne(query(shopify_id), _reconcile_update(fields, now)) for shopify_id, fields in product_updates],
+                ordered=False
+            )
+            counts['products_matched'] = result.matched_count
+            counts['products_drifted'] = result.modified_count
+        if variant_updates:
+            result = mongo.products.bulk_write(
+                [
+                    UpdateOne(query(shopify_id), _reconcile_update(add_search_tokens(fields), now))
+                    for shopify_id, fields in variant_updates
+                ],
+                ordered=False
+            )
+            counts['variants_drifted'] = result.modified_count
+        if counts['products_drifted'] or counts['variants_drifted']:
+            invalidate_product_counts()
+            # Keyed by shopify_id, so the affected ObjectIds are unknown here
+            invalidate_cached_product()
+        return counts
+    except Exception as e:
+        raise Exception(f"MongoDB reconcile failed: {str(e)}")
+
+def get_mongo_sync_state(mongo, key):
+    """Get a stored sync watermark/state document"""
+    try:
+        return mongo.sync_state.find_one({'_id': key}) or {}
+    except Exception as e:
+        raise Exception(f"MongoDB fetch failed: {str(e)}")
+
+def set_mongo_sync_state(mongo, key, fields):
+    """Upsert a sync watermark/state document"""
+    try:
+        mongo.sync_state.update_one({'_id': key}, {'$set': fields}, upsert=True)
+    except Exception as e:
+        raise Exception(f"MongoDB sync state update failed: {str(e)}")
+
+# Fields the product list can be sorted by; each has an (is_deleted, field, _id)
+# index so both page and cursor mode are served without an in-memory sort
+PRODUCT_SORT_FIELDS = ['title', 'price', 'created_at', 'updated_at', 'sku']
+
+def encode_product_cursor(sort_field, sort_order, product_data):
+    """Build the opaque cursor pointing just after product_data in the given order"""
+    payload = {'f': sort_field, 'o': sort_order, 'v': product_data.get(sort_field), 'id': product_data['_id']}
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_product_cursor(cursor, sort_field, sort_order):
+    """Return the (sort value, _id) a cursor points after; raises ValueError if it is invalid"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        value, last_id = payload['v'], payload['id']
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if payload.get('f') != sort_field or payload.get('o') != sort_order or not isinstance(last_id, ObjectId):
+        raise ValueError("Cursor does not match the requested sort")
+    return value, last_id
+
+def product_seek_query(sort_field, sort_direction, value, last_id):
+    """Range predicate selecting products strictly after (value, last_id) in sort order"""
+    op = '$lt' if sort_direction == -1 else '$gt'
+    return {'$or': [
+        {sort_field: {op: value}},
+        {sort_field: value, '_id': {op: last_id}}
+    ]}
+
+# total_mode='estimated' counts at most this many matches
+ESTIMATED_COUNT_LIMIT = int(os.getenv('PRODUCT_ESTIMATED_COUNT_LIMIT', 10000))
+
+def count_mongo_products(mongo, query, total_mode='exact'):
+    """
+    Return (total, is_exact) for a product list query.
+
+    'exact' counts every match, reusing a cached count while no product has
+    been written; 'estimated' reads collection metadata for the unfiltered
+    list (soft-deleted products included) and stops counting filtered lists
+    at ESTIMATED_COUNT_LIMIT; 'none' skips counting.
+    """
+    if total_mode == 'none':
+        return None, False
+    
+    key = product_counts.key(query)
+    cached = product_counts.get(key)
+    if cached is not None:
+        return cached, True
+    
+    # Read before counting so a write that lands mid-count discards the result
+    generation = product_counts.generation
+    if total_mode == 'estimated':
+        if query == {'is_deleted': False}:
+            return mongo.products.estimated_document_count(), False
+        total = mongo.products.count_documents(query, limit=ESTIMATED_COUNT_LIMIT)
+        if total >= ESTIMATED_COUNT_LIMIT:
+            return total, False
+        # Fewer matches than the cap: the count is exact after all
+        product_counts.set(key, total, generation)
+        return total, True
+    
+    total = mongo.products.count_documents(query)
+    product_counts.set(key, total, generation)
+    return total, True
+
+def product_list_query(search_query=None, search_mode='indexed'):
+    """Filter for the live products matching an optional search"""
+    query = {'is_deleted': False}
+    if search_query:
+        query.update(build_search_query(search_query, search_mode))
+    return query
+
+def get_mongo_products(mongo, sort_field='created_at', sort_order='desc', page=1, per_page=20, search_query=None,
+                       cursor=None, search_mode='indexed', total_mode='exact', view='full', raw=False):
+    """
+    Get paginated and sorted products from MongoDB with optional search.
+
+    With a cursor (from a previous response's next_cursor) the page is found
+    with an index seek instead of skipping over every earlier product; page
+    is ignored then. search_mode 'indexed' matches title/description words and
+    SKU substrings through indexes and allows sort_field='relevance'; 'regex'
+    is the original unindexed substring match. view limits the fields read
+    to what Product.to_view_dict(view) needs. With raw=True the products are
+    returned as RawBSONDocuments for json_helpers.products_to_json instead of
+    Product objects.
+    """
     try:
         # Convert sort order to MongoDB format (1 for ascending, -1 for descending)
         sort_direction = -1 if sort_order == 'desc' else 1
         
-        # Build query
-        query = {'is_deleted': False}
-        if search_query:
-            # Use regex for case-insensitive substring matching
-            regex_pattern = {'$regex': search_query, '$options': 'i'}
-            query = {
-                'is_deleted': False,
-                '$or': [
-                    {'title': regex_pattern},
-                    {'sku': regex_pattern},
-                    {'price_text': regex_pattern},
-                    {'currency': regex_pattern}
-                ]
-            }
+        # Build query; a blank search is no search
+        search_query = search_term(search_query)
+        query = product_list_query(search_query, search_mode)
+        
+        relevance = sort_field == 'relevance'
+        if relevance and not (search_query and search_mode == 'indexed'):
+            raise ValueError("Sorting by relevance needs an indexed search query")
+        if relevance and cursor:
+            raise ValueError("Cursor pagination is not available when sorting by relevance")
         
         # Get total count for pagination
-        total_count = mongo.products.count_documents(query)
+        total_count, total_exact = count_mongo_products(mongo, query, total_mode)
+        
+        projection = Product.projection(view)
+        if projection and not relevance:
+            # The next cursor is built from the sort value of the last row
+            projection[sort_field] = 1
+        
+        collection = mongo.products.with_options(codec_options=RAW_CODEC_OPTIONS) if raw else mongo.products
         
-        # Get paginated and sorted results
-        products = mongo.products.find(query) \
-            .sort(sort_field, sort_direction) \
-            .skip((page - 1) * per_page) \
-            .limit(per_page)
+        # _id breaks ties so the order is total and cursors never skip or repeat rows
+        sort = [(sort_field, sort_direction), ('_id', sort_direction)]
+        if relevance:
+            # Best text matches first; SKU-only matches have no text score and follow
+            products = collection.find(query, dict(projection or {}, score={'$meta': 'textScore'})) \
+                .sort([('score', {'$meta': 'textScore'}), ('_id', -1)]) \
+                .skip((page - 1) * per_page)
+        elif cursor:
+            value, last_id = decode_product_cursor(cursor, sort_field, sort_order)
+            seek = product_seek_query(sort_field, sort_direction, value, last_id)
+            products = collection.find({'$and': [query, seek]}, projection).sort(sort)
+            page = None
+        else:
+            products = collection.find(query, projection).sort(sort).skip((page - 1) * per_page)
+        
+        # One extra row tells us whether there is a next page
+        rows = list(products.limit(per_page + 1))
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            if not relevance:
+                next_cursor = encode_product_cursor(sort_field, sort_order, rows[-1])
         
         return {
-            'products': [Product.from_dict(p) for p in products],
+            'products': rows if raw else [Product.from_dict(p) for p in rows],
             'total': total_count,
+            'total_exact': total_exact,
             'page': page,
             'per_page': per_page,
-            'total_pages': (total_count + per_page - 1) // per_page
+            'total_pages': (total_count + per_page - 1) // per_page if total_count is not None else None,
+            'next_cursor': next_cursor
         }
+    except ValueError:
+        raise
     except Exception as e:
         raise Exception(f"MongoDB fetch failed: {str(e)}")
 
-def get_mongo_product_by_id(mongo, product_id):
-    """Get a single product by ID from MongoDB"""
+def iter_mongo_products(mongo, sort_field='created_at', sort_order='desc', search_query=None,
+                        search_mode='indexed', view='full', batch_size=1000):
+    """
+    Cursor over every product a list query matches, as RawBSONDocuments.
+
+    Documents arrive batch_size at a time, so memory stays flat however many
+    products match. The caller must close() the cursor if it stops early.
+    """
+    sort_direction = -1 if sort_order == 'desc' else 1
+    search_query = search_term(search_query)
+    if sort_field == 'relevance' and not (search_query and search_mode == 'indexed'):
+        raise ValueError("Sorting by relevance needs an indexed search query")
+    
+    query = product_list_query(search_query, search_mode)
+    projection = Product.projection(view)
+    collection = mongo.products.with_options(codec_options=RAW_CODEC_OPTIONS)
+    if sort_field == 'relevance':
+        cursor = collection.find(query, dict(projection or {}, score={'$meta': 'textScore'})) \
+            .sort([('score', {'$meta': 'textScore'}), ('_id', -1)])
+    else:
+        cursor = collection.find(query, projection).sort([(sort_field, sort_direction), ('_id', sort_direction)])
+    # Searches sorted by a field may sort more matches than fit in the in-memory limit
+    return cursor.batch_size(batch_size).allow_disk_use(True)
+
+def get_mongo_product_document(mongo, product_id, cached=True):
+    """
+    Get a product document by ID, or None; deleted products included.
+    Goes through the product cache unless cached is False, which reads before
+    a write need: a cached entry can lag writes made by other processes.
+    """
     try:
-        product_data = mongo.products.find_one({
-            '_id': ObjectId(product_id),
-            'is_deleted': False
-        })
+        object_id = ObjectId(product_id)
+        cache = get_product_cache(mongo)
+        if not cached or not cache.enabled:
+            return mongo.products.find_one({'_id': object_id})
+        
+        product_data = cache.get(object_id)
+        if product_data is None:
+            token = cache.begin_fill()
+            raw = mongo.products.with_options(codec_options=RAW_CODEC_OPTIONS).find_one({'_id': object_id})
+            if raw is None:
+                return None
+            cache.put(object_id, raw.raw, token)
+            product_data = bson.decode(raw.raw)
+        return product_data
+    except Exception as e:
+        raise Exception(f"MongoDB fetch failed: {str(e)}")
+
+def get_mongo_product_by_id(mongo, product_id, view='full', cached=True):
+    """
+    Get a single product by ID from MongoDB. Served from the product cache
+    when it is enabled and cached is True, otherwise reading only the fields
+    the view needs.
+    """
+    try:
+        if cached and get_product_cache(mongo).enabled:
+            product_data = get_mongo_product_document(mongo, product_id)
+            if product_data and product_data.get('is_deleted'):
+                product_data = None
+        else:
+            product_data = mongo.products.find_one({
+                '_id': ObjectId(product_id),
+                'is_deleted': False
+            }, Product.projection(view))
         
         if not product_data:
             raise Exception("Product not found")
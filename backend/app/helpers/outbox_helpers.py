@@ -0,0 +1,262 @@
+import os
+import random
+import socket
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from ..models.product import Product
+from .shopify_helpers import (
+    SHOPIFY_PRODUCT_FIELDS as SYNCED_FIELDS,
+    create_shopify_product,
+    update_shopify_product,
+    delete_shopify_product,
+    shopify_available,
+    SHOPIFY_BREAKER_RESET
+)
+from .resilience_helpers import Deadline, CircuitOpenError
+from .search_helpers import add_search_tokens
+from .cache_helpers import invalidate_product_counts, invalidate_cached_product
+
+logger = logging.getLogger(__name__)
+
+# The outbox entry is embedded in the product document, so the product write
+# and its pending Shopify sync are committed atomically without needing a
+# replica set for multi-document transactions.
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 60))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', 2))
+OUTBOX_BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', 15 * 60))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 1))
+# Shopify time allowed per entry; kept well inside the lease so a slow sync
+# is abandoned before another worker can claim the same entry
+OUTBOX_SYNC_BUDGET = float(os.getenv('OUTBOX_SYNC_BUDGET', OUTBOX_LEASE_SECONDS / 2))
+
+
+def _enqueue(now, op, fields=None):
+    """Build the update that (re)arms a product's outbox entry"""
+    update = {
+        '$set': {
+            'outbox.op': op,
+            'outbox.attempts': 0,
+            'outbox.next_attempt_at': now,
+            'outbox.dead': False,
+            'outbox.error': None
+        },
+        # Bumped on every write so a worker never clears an entry it did not fully sync
+        '$inc': {'outbox.version': 1}
+    }
+    if fields:
+        update['$addToSet'] = {'outbox.fields': {'$each': fields}}
+    return update
+
+
+def outbox_update(update_fields, now):
+    """Build the update that writes update_fields and queues the synced ones for Shopify"""
+    update = _enqueue(now, 'upsert', [f for f in update_fields if f in SYNCED_FIELDS])
+    update['$set'].update(add_search_tokens(dict(update_fields)))
+    update['$set']['status'] = 'draft'
+    update['$set']['updated_at'] = now
+    return update
+
+
+def outbox_delete(now):
+    """Build the update that soft deletes a product and queues its removal from Shopify"""
+    update = _enqueue(now, 'delete')
+    update['$set'].update({'is_deleted': True, 'status': 'draft', 'updated_at': now})
+    return update
+
+
+def create_mongo_product_with_outbox(mongo, product_data):
+    """Create a draft product in MongoDB together with its pending Shopify create"""
+    try:
+        product = Product(
+            title=product_data['title'],
+            description=product_data['description'],
+            price=product_data['price'],
+            sku=product_data['sku'],
+            image_url=product_data.get('image_url')
+        )
+        document = add_search_tokens(product.to_dict())
+        document['outbox'] = {
+            'op': 'upsert',
+            'fields': SYNCED_FIELDS,
+            'version': 1,
+            'attempts': 0,
+            'next_attempt_at': product.created_at,
+            'dead': False,
+            'error': None
+        }
+        result = mongo.products.insert_one(document)
+        invalidate_product_counts()
+        product._id = result.inserted_id
+        return product
+    except Exception as e:
+        raise Exception(f"MongoDB creation failed: {str(e)}")
+
+
+def update_mongo_product_with_outbox(mongo, product_id, update_fields):
+    """Update a product in MongoDB and queue the changed fields for Shopify"""
+    try:
+        updated_product = mongo.products.find_one_and_update(
+            {'_id': ObjectId(product_id), 'is_deleted': False},
+            outbox_update(update_fields, datetime.now(timezone.utc)),
+            return_document=ReturnDocument.AFTER
+        )
+        invalidate_product_counts()
+        invalidate_cached_product(ObjectId(product_id))
+        if not updated_product:
+            raise Exception("Product not found")
+        return Product.from_dict(updated_product)
+    except Exception as e:
+        raise Exception(f"MongoDB update failed: {str(e)}")
+
+
+def delete_mongo_product_with_outbox(mongo, product_id):
+    """Soft delete a product in MongoDB and queue its removal from Shopify"""
+    try:
+        deleted_product = mongo.products.find_one_and_update(
+            {'_id': ObjectId(product_id), 'is_deleted': False},
+            outbox_delete(datetime.now(timezone.utc)),
+            return_document=ReturnDocument.AFTER
+        )
+        invalidate_product_counts()
+        invalidate_cached_product(ObjectId(product_id))
+        if not deleted_product:
+            raise Exception("Product not found")
+        return Product.from_dict(deleted_product)
+    except Exception as e:
+        raise Exception(f"MongoDB deletion failed: {str(e)}")
+
+
+def outbox_due_query(now):
+    """Filter for outbox entries that are due and not leased to a live worker"""
+    return {
+        'outbox.dead': False,
+        'outbox.next_attempt_at': {'$lte': now},
+        '$or': [
+            {'outbox.locked_until': None},
+            {'outbox.locked_until': {'$lt': now}}
+        ]
+    }
+
+
+def claim_outbox_product(mongo, worker_id):
+    """Lease the next due outbox entry so no other worker picks it up"""
+    now = datetime.now(timezone.utc)
+    return mongo.products.find_one_and_update(
+        outbox_due_query(now),
+        {'$set': {
+            'outbox.locked_by': worker_id,
+            'outbox.locked_until': now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        }},
+        sort=[('outbox.next_attempt_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _complete(mongo, document, shopify_id):
+    now = datetime.now(timezone.utc)
+    synced_fields = {'shopify_id': shopify_id, 'last_sync': now}
+    result = mongo.products.update_one(
+        {'_id': document['_id'], 'outbox.version': document['outbox']['version']},
+        {'$set': dict(synced_fields, status='synced'), '$unset': {'outbox': ''}}
+    )
+    invalidate_cached_product(document['_id'])
+    if result.matched_count == 0:
+        # Written again while we were syncing: keep the new entry queued, but
+        # remember the Shopify ID so the follow-up sync updates instead of creating
+        mongo.products.update_one(
+            {'_id': document['_id']},
+            {'$set': dict(synced_fields, **{'outbox.locked_until': None})}
+        )
+
+
+def _fail(mongo, document, error):
+    attempts = document['outbox'].get('attempts', 0) + 1
+    dead = attempts >= OUTBOX_MAX_ATTEMPTS
+    delay = min(OUTBOX_BACKOFF_BASE * (2 ** attempts), OUTBOX_BACKOFF_MAX)
+    update = {
+        'outbox.attempts': attempts,
+        'outbox.error': error,
+        'outbox.dead': dead,
+        'outbox.locked_until': None,
+        'outbox.next_attempt_at': datetime.now(timezone.utc) + timedelta(seconds=random.uniform(delay / 2, delay))
+    }
+    if dead:
+        update['status'] = 'failed'
+    result = mongo.products.update_one(
+        {'_id': document['_id'], 'outbox.version': document['outbox']['version']},
+        {'$set': update}
+    )
+    invalidate_cached_product(document['_id'])
+    if result.matched_count == 0:
+        # A newer write superseded this attempt; release it for an immediate retry
+        mongo.products.update_one({'_id': document['_id']}, {'$set': {'outbox.locked_until': None}})
+        return
+    if dead:
+        logger.error(f"Giving up on Shopify sync for product {document['_id']}: {error}")
+
+
+def _defer(mongo, document, seconds):
+    """Release the lease and retry later without spending an attempt"""
+    mongo.products.update_one(
+        {'_id': document['_id'], 'outbox.version': document['outbox']['version']},
+        {'$set': {
+            'outbox.locked_until': None,
+            'outbox.next_attempt_at': datetime.now(timezone.utc) + timedelta(seconds=seconds)
+        }}
+    )
+
+
+def process_outbox_product(mongo, document):
+    """Push one leased outbox entry to Shopify and record the outcome"""
+    outbox = document['outbox']
+    shopify_id = document.get('shopify_id')
+    deadline = Deadline(OUTBOX_SYNC_BUDGET)
+    try:
+        if outbox['op'] == 'delete':
+            if shopify_id and not delete_shopify_product(shopify_id, deadline=deadline):
+                raise Exception("Failed to delete product from Shopify")
+        elif shopify_id:
+            fields = {f: document.get(f) for f in outbox.get('fields', []) if f in SYNCED_FIELDS}
+            if fields and not update_shopify_product(shopify_id, fields, deadline=deadline):
+                raise Exception("Failed to update product in Shopify")
+        else:
+            shopify_product = create_shopify_product(document, deadline=deadline)
+            if not shopify_product:
+                raise Exception("Failed to create product in Shopify")
+            shopify_id = shopify_product['id']
+    except CircuitOpenError:
+        # Shopify is down, not this product's fault
+        _defer(mongo, document, SHOPIFY_BREAKER_RESET)
+        return False
+    except Exception as e:
+        _fail(mongo, document, str(e))
+        return False
+
+    _complete(mongo, document, shopify_id)
+    return True
+
+
+def run_sync_worker(mongo, stop_event, worker_id=None, poll_interval=OUTBOX_POLL_INTERVAL):
+    """Drain the outbox until stop_event is set, sleeping while it is empty"""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    while not stop_event.is_set():
+        # Leave entries queued while the circuit breaker is open
+        if not shopify_available():
+            stop_event.wait(poll_interval)
+            continue
+
+        try:
+            document = claim_outbox_product(mongo, worker_id)
+        except Exception as e:
+            logger.error(f"Outbox claim failed: {str(e)}")
+            document = None
+
+        if document is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        process_outbox_product(mongo, document)
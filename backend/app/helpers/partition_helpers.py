@@ -0,0 +1,251 @@
+import os
+import re
+from datetime import date, datetime, timezone, timedelta
+from flask import current_app
+from .. import db
+from ..models.event import Event
+from .archive_helpers import EVENT_ARCHIVE_ENABLED, archive_events
+
+EVENTS_TABLE = Event.__tablename__
+# Where the pre-partitioning table is kept while partition-events copies it
+UNPARTITIONED_EVENTS_TABLE = f'{EVENTS_TABLE}_unpartitioned'
+# Partitions are created this many months past the current one, so inserts
+# never arrive for a month that has none
+EVENT_PARTITION_MONTHS_AHEAD = int(os.getenv('EVENT_PARTITION_MONTHS_AHEAD', 3))
+# Events older than this are dropped a whole month at a time; 0 keeps everything
+EVENT_RETENTION_DAYS = int(os.getenv('EVENT_RETENTION_DAYS', 0))
+EVENT_MIGRATION_BATCH_SIZE = int(os.getenv('EVENT_MIGRATION_BATCH_SIZE', 50000))
+
+_PARTITION_NAME = re.compile(rf'^{EVENTS_TABLE}_(\d{{4}})_(\d{{2}})$')
+_EVENT_COLUMNS = 'id, user_id, user_name, product_id, product_title, event_type, timestamp'
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def event_partition_name(month):
+    return f'{EVENTS_TABLE}_{month.year:04d}_{month.month:02d}'
+
+
+def table_kind(conn, table):
+    """'p' for a partitioned table, 'r' for a plain one, None if it does not exist"""
+    return conn.exec_driver_sql(
+        "SELECT relkind FROM pg_class WHERE relname = %(table)s AND pg_table_is_visible(oid)",
+        {'table': table}
+    ).scalar()
+
+
+def list_partitions(conn, table):
+    """(name, detach_pending) for every partition of a table"""
+    return conn.exec_driver_sql(
+        "SELECT c.relname, i.inhdetachpending FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = %(table)s ORDER BY c.relname",
+        {'table': table}
+    ).all()
+
+
+def _event_partition_months(conn):
+    """(month, name, detach_pending) for the monthly partitions of identifier_events"""
+    months = []
+    for name, pending in list_partitions(conn, EVENTS_TABLE):
+        match = _PARTITION_NAME.match(name)
+        if match:
+            months.append((date(int(match.group(1)), int(match.group(2)), 1), name, pending))
+    return months
+
+
+def _create_event_partitions(conn, first_month, last_month):
+    """Create the monthly partitions from first_month through last_month that do not exist yet"""
+    created = []
+    existing = {month for month, _, _ in _event_partition_months(conn)}
+    month = first_month
+    while month <= last_month:
+        if month not in existing:
+            conn.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {event_partition_name(month)} PARTITION OF {EVENTS_TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            )
+            created.append(event_partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_event_partitions(months_ahead=EVENT_PARTITION_MONTHS_AHEAD, now=None):
+    """
+    Create the partitions for the current month and the next months_ahead.
+
+    Returns the names created; an empty list when they all exist or the
+    table has not been partitioned yet (see partition_events_table).
+    """
+    current = month_start(now or datetime.now(timezone.utc))
+    with db.engine.begin() as conn:
+        if table_kind(conn, EVENTS_TABLE) != 'p':
+            return []
+        created = _create_event_partitions(conn, current, add_months(current, months_ahead))
+    if created:
+        current_app.logger.info(f"Created event partitions: {', '.join(created)}")
+    return created
+
+
+def expired_event_partitions(conn, cutoff):
+    """(month, name, detach_pending, estimated rows) for partitions holding only events older than cutoff"""
+    cutoff_day = cutoff.date() if isinstance(cutoff, datetime) else cutoff
+    expired = []
+    for month, name, pending in _event_partition_months(conn):
+        # A partition expires once its last day is past the cutoff, so
+        # retention is month-granular and keeps up to a month extra
+        if add_months(month, 1) <= cutoff_day:
+            rows = conn.exec_driver_sql(
+                "SELECT reltuples FROM pg_class WHERE relname = %(name)s", {'name': name}
+            ).scalar()
+            expired.append((month, name, pending, max(int(rows or 0), 0)))
+    return expired
+
+
+def detach_event_partition(conn, name, pending=False):
+    """
+    Detach a partition from identifier_events without blocking queries on it.
+
+    DETACH ... CONCURRENTLY leaves the partition marked pending if it is
+    interrupted; FINALIZE completes such a detach.
+    """
+    mode = 'FINALIZE' if pending else 'CONCURRENTLY'
+    conn.exec_driver_sql(f"ALTER TABLE {EVENTS_TABLE} DETACH PARTITION {name} {mode}")
+
+
+def drop_expired_event_partitions(cutoff, archive=EVENT_ARCHIVE_ENABLED):
+    """
+    Detach and drop the partitions whose events are all older than cutoff.
+
+    Returns (names dropped, estimated number of events removed). Dropping a
+    partition removes its rows without a DELETE, table bloat or per-row WAL.
+    With archive, each partition is exported to the Parquet archive while it
+    is still attached, so a failed export leaves it in place.
+    """
+    dropped, removed = [], 0
+    # DETACH ... CONCURRENTLY cannot run inside a transaction block
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if table_kind(conn, EVENTS_TABLE) != 'p':
+            raise Exception(f"{EVENTS_TABLE} is not partitioned; run flask partition-events first")
+        for month, name, pending, rows in expired_event_partitions(conn, cutoff):
+            if archive:
+                archive_events(
+                    f"SELECT {_EVENT_COLUMNS} FROM {name} ORDER BY id",
+                    basename=name,
+                    until=datetime.combine(add_months(month, 1), datetime.min.time())
+                )
+            detach_event_partition(conn, name, pending)
+            conn.exec_driver_sql(f"DROP TABLE {name}")
+            dropped.append(name)
+            removed += rows
+    if dropped:
+        current_app.logger.info(f"Dropped expired event partitions: {', '.join(dropped)}")
+    return dropped, removed
+
+
+def maintain_event_partitions(retention_days=EVENT_RETENTION_DAYS, months_ahead=EVENT_PARTITION_MONTHS_AHEAD):
+    """Create upcoming partitions and, with a retention window, drop expired ones"""
+    report = {'created': ensure_event_partitions(months_ahead), 'dropped': [], 'removed_estimate': 0}
+    if retention_days:
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=retention_days)
+        report['dropped'], report['removed_estimate'] = drop_expired_event_partitions(cutoff)
+    return report
+
+
+def _swap_in_partitioned_table(conn, months_ahead):
+    """
+    Rename the plain table aside and create the partitioned one in its place.
+
+    Runs in one short transaction; from its commit new events go to the
+    partitioned table while older ones are still being copied.
+    """
+    conn.exec_driver_sql(f"LOCK TABLE {EVENTS_TABLE} IN ACCESS EXCLUSIVE MODE")
+    conn.exec_driver_sql(f"ALTER TABLE {EVENTS_TABLE} RENAME TO {UNPARTITIONED_EVENTS_TABLE}")
+    # Free the names the partitioned table's key, indexes and sequence will use
+    conn.exec_driver_sql(
+        f"ALTER TABLE {UNPARTITIONED_EVENTS_TABLE} RENAME CONSTRAINT {EVENTS_TABLE}_pkey TO {UNPARTITIONED_EVENTS_TABLE}_pkey"
+    )
+    for index in Event.__table__.indexes:
+        conn.exec_driver_sql(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_unpartitioned")
+    conn.exec_driver_sql(
+        f"ALTER SEQUENCE IF EXISTS {EVENTS_TABLE}_id_seq RENAME TO {UNPARTITIONED_EVENTS_TABLE}_id_seq"
+    )
+
+    Event.__table__.create(conn)
+    bounds = conn.exec_driver_sql(
+        f"SELECT max(id), min(timestamp), max(timestamp) FROM {UNPARTITIONED_EVENTS_TABLE}"
+    ).one()
+    # New ids continue after the copied ones, so the two never collide
+    conn.exec_driver_sql(
+        f"SELECT setval('{EVENTS_TABLE}_id_seq', %(next_id)s, false)", {'next_id': (bounds[0] or 0) + 1}
+    )
+    current = month_start(datetime.now(timezone.utc))
+    first = month_start(bounds[1]) if bounds[1] else current
+    last = max(add_months(current, months_ahead), month_start(bounds[2]) if bounds[2] else current)
+    _create_event_partitions(conn, min(first, current), last)
+
+
+def partition_events_table(batch_size=EVENT_MIGRATION_BATCH_SIZE, drop_old=False,
+                           months_ahead=EVENT_PARTITION_MONTHS_AHEAD):
+    """
+    Migrate a plain identifier_events table to monthly range partitions.
+
+    The table is swapped for an empty partitioned one under a brief lock,
+    then the old rows are copied across in id-ordered batches, one
+    transaction each, while the application keeps writing. It is safe to
+    rerun after an interruption: copying resumes after the last copied id.
+    With drop_old the old table is dropped once every row is accounted for.
+
+    Returns:
+        dict: copied and old row counts, and whether the old table was dropped
+    """
+    with db.engine.begin() as conn:
+        kind = table_kind(conn, EVENTS_TABLE)
+        old_kind = table_kind(conn, UNPARTITIONED_EVENTS_TABLE)
+        if kind == 'p' and old_kind is None:
+            return {'status': 'already partitioned'}
+        if kind == 'r':
+            if old_kind is not None:
+                raise Exception(f"Both {EVENTS_TABLE} and {UNPARTITIONED_EVENTS_TABLE} are plain tables")
+            _swap_in_partitioned_table(conn, months_ahead)
+        elif kind is None:
+            raise Exception(f"{EVENTS_TABLE} does not exist")
+
+    with db.engine.connect() as conn:
+        last_old_id = conn.exec_driver_sql(f"SELECT max(id) FROM {UNPARTITIONED_EVENTS_TABLE}").scalar() or 0
+        copied_up_to = conn.exec_driver_sql(
+            f"SELECT max(id) FROM {EVENTS_TABLE} WHERE id <= %(last)s", {'last': last_old_id}
+        ).scalar() or 0
+
+    while copied_up_to < last_old_id:
+        upper = copied_up_to + batch_size
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(
+                f"INSERT INTO {EVENTS_TABLE} ({_EVENT_COLUMNS}) "
+                f"SELECT {_EVENT_COLUMNS} FROM {UNPARTITIONED_EVENTS_TABLE} "
+                f"WHERE id > %(lower)s AND id <= %(upper)s AND timestamp IS NOT NULL "
+                f"ON CONFLICT DO NOTHING",
+                {'lower': copied_up_to, 'upper': upper}
+            )
+        copied_up_to = upper
+        current_app.logger.info(f"Copied events up to id {min(upper, last_old_id)} of {last_old_id}")
+
+    with db.engine.begin() as conn:
+        old_rows = conn.exec_driver_sql(
+            f"SELECT count(*) FROM {UNPARTITIONED_EVENTS_TABLE} WHERE timestamp IS NOT NULL"
+        ).scalar()
+        copied = conn.exec_driver_sql(
+            f"SELECT count(*) FROM {EVENTS_TABLE} WHERE id <= %(last)s", {'last': last_old_id}
+        ).scalar()
+        # Rows without a timestamp have no partition and stay behind in the old table
+        dropped = drop_old and copied == old_rows
+        if dropped:
+            conn.exec_driver_sql(f"DROP TABLE {UNPARTITIONED_EVENTS_TABLE}")
+    return {'status': 'migrated', 'copied': copied, 'old_rows': old_rows, 'old_table_dropped': dropped}
@@ -1,9 +1,52 @@
+import json
+import base64
 from flask import current_app
-from datetime import datetime, timezone, timedelta
-from sqlalchemy import and_, desc, func, cast, Date
-from ..models.event import Event
+from datetime import datetime, timezone, timedelta, time
+from collections import Counter
+from sqlalchemy import and_, or_, desc, func, cast, Date, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from ..models.event import Event, EventDailyCount
+from .partition_helpers import EVENTS_TABLE, table_kind, drop_expired_event_partitions
+from .archive_helpers import (EVENT_ARCHIVE_ENABLED, ARCHIVE_COLUMNS, archive_events, archived_events_until,
+                              count_archived_events, read_archived_events)
 from .. import db
 
+def stored_timestamp(value):
+    """
+    A datetime in the form identifier_events stores it: naive UTC.
+    
+    Comparing the column with a timezone-aware value goes through a
+    TimeZone-dependent cast, which keeps the planner from pruning monthly
+    partitions until execution.
+    """
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def event_date(timestamp):
+    """UTC calendar day of an event timestamp, matching cast(timestamp, Date) on the stored value"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date()
+
+def add_to_daily_counts(rows):
+    """
+    Add rows to event_daily_counts in the caller's transaction, one upsert
+    per (day, event_type) in the batch, so the rollup commits or rolls back
+    together with the events
+    """
+    counts = Counter((event_date(row['timestamp']), row['event_type']) for row in rows)
+    if not counts:
+        return
+    statement = pg_insert(EventDailyCount).values([
+        {'date': date, 'event_type': event_type, 'count': count}
+        for (date, event_type), count in sorted(counts.items())
+    ])
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[EventDailyCount.date, EventDailyCount.event_type],
+        set_={'count': EventDailyCount.count + statement.excluded['count']}
+    ))
+
 def create_event(user_id, product_id, event_type, user_name=None, product_title=None):
     """
     Create a new event record
@@ -24,10 +67,12 @@ def create_event(user_id, product_id, event_type, user_name=None, product_title=
             user_name=user_name,
             product_id=product_id,
             product_title=product_title,
-            event_type=event_type
+            event_type=event_type,
+            timestamp=stored_timestamp(datetime.now(timezone.utc))
         )
         
         db.session.add(event)
+        add_to_daily_counts([{'timestamp': event.timestamp, 'event_type': event_type}])
         db.session.commit()
         return event
     except Exception as e:
@@ -35,7 +80,122 @@ def create_event(user_id, product_id, event_type, user_name=None, product_title=
         current_app.logger.error(f"Failed to create event: {str(e)}")
         raise
 
-def get_user_events(user_id, event_type=None, start_date=None, end_date=None, page=1, per_page=20):
+def create_events(events):
+    """
+    Create many event records with a single multi-row INSERT
+    
+    Args:
+        events (list): Dictionaries with the same keys as create_event's arguments
+        
+    Returns:
+        int: Number of events written
+    """
+    if not events:
+        return 0
+    try:
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                'user_id': event['user_id'],
+                'user_name': event.get('user_name'),
+                'product_id': event['product_id'],
+                'product_title': event.get('product_title'),
+                'event_type': event['event_type'],
+                'timestamp': stored_timestamp(event.get('timestamp') or now)
+            }
+            for event in events
+        ]
+        db.session.execute(insert(Event), rows)
+        add_to_daily_counts(rows)
+        db.session.commit()
+        return len(rows)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to create events: {str(e)}")
+        raise
+
+def encode_event_cursor(event):
+    """Build the opaque cursor pointing just after an event dict in (timestamp, id) descending order"""
+    payload = {'t': event['timestamp'], 'id': event['id']}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_event_cursor(cursor):
+    """Return the (timestamp, id) a cursor points after; raises ValueError if it is invalid"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(payload['t']), int(payload['id'])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def estimate_event_count(query):
+    """Row count the planner expects a query to return, read from EXPLAIN without running it"""
+    statement = query.order_by(None).statement
+    compiled = statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def page_events(query, page=1, per_page=20, cursor=None, total_mode='exact', archive=None):
+    """
+    Fetch one page of a filtered event query, newest first.
+
+    With a cursor (from a previous response's next_cursor) the page starts
+    with an index seek on timestamp instead of an OFFSET scan over every
+    earlier row; page is ignored then. total_mode 'exact' runs a COUNT over
+    the filtered range, 'estimated' takes the planner's row estimate and
+    'none' skips counting.
+
+    archive is a (start_date, end_date, event_type) range of archived events
+    that follows the query's rows, which must all be newer; pages run on
+    into it once the query's rows are exhausted.
+    """
+    total, total_exact = None, False
+    if total_mode == 'exact':
+        total, total_exact = query.order_by(None).count(), True
+    elif total_mode == 'estimated':
+        total = estimate_event_count(query)
+    if archive and total is not None:
+        total += count_archived_events(*archive)
+
+    # id breaks ties so the order is total and cursors never skip or repeat rows
+    ordered = query.order_by(desc(Event.timestamp), desc(Event.id))
+    before, offset = None, 0
+    if cursor:
+        before = decode_event_cursor(cursor)
+        last_timestamp, last_id = before
+        # The bare timestamp bound is what the idx_events_* indexes can seek on
+        ordered = ordered.filter(
+            Event.timestamp <= last_timestamp,
+            or_(Event.timestamp < last_timestamp, Event.id < last_id)
+        )
+        page = None
+    else:
+        offset = (page - 1) * per_page
+        ordered = ordered.offset(offset)
+
+    # One extra row tells us whether there is a next page
+    rows = [event.to_dict() for event in ordered.limit(per_page + 1).all()]
+    if archive and len(rows) <= per_page:
+        # A page past the last query row skips the query rows before the archive
+        archive_offset = 0 if before or rows or not offset else max(offset - query.order_by(None).count(), 0)
+        rows += read_archived_events(*archive, before=before, offset=archive_offset, limit=per_page + 1 - len(rows))
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_event_cursor(rows[-1])
+
+    return {
+        'events': rows,
+        'total': total,
+        'total_exact': total_exact,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': (total + per_page - 1) // per_page if total is not None else None,
+        'next_cursor': next_cursor
+    }
+
+def get_user_events(user_id, event_type=None, start_date=None, end_date=None, page=1, per_page=20,
+                    cursor=None, total_mode='exact'):
     """
     Get events for a specific user with optional filtering
     
@@ -46,11 +206,15 @@ def get_user_events(user_id, event_type=None, start_date=None, end_date=None, pa
         end_date (datetime, optional): Filter events before this date
         page (int): Page number for pagination
         per_page (int): Number of items per page
+        cursor (str, optional): next_cursor of the previous page; page is ignored when given
+        total_mode (str): 'exact', 'estimated' or 'none'; see page_events
         
     Returns:
         dict: Dictionary with events and pagination info
     """
     try:
+        start_date, end_date = stored_timestamp(start_date), stored_timestamp(end_date)
+        
         # Start with user_id filter to utilize the composite index
         query = Event.query.filter_by(user_id=user_id)
         
@@ -78,33 +242,31 @@ def get_user_events(user_id, event_type=None, start_date=None, end_date=None, pa
             elif end_date:
                 query = query.filter(Event.timestamp <= end_date)
         
-        # Sort by timestamp descending - works with the composite index
-        query = query.order_by(desc(Event.timestamp))
-        
-        # Apply pagination with count optimization
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-        
-        return {
-            'events': [event.to_dict() for event in pagination.items],
-            'total': pagination.total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': pagination.pages
-        }
+        # Sorted by timestamp descending - works with the composite index
+        return page_events(query, page, per_page, cursor, total_mode)
+    except ValueError:
+        raise
     except Exception as e:
         current_app.logger.error(f"Failed to get events: {str(e)}")
         raise
 
-def get_events_by_timerange(start_date=None, end_date=None, event_type=None, page=1, per_page=20):
+def get_events_by_timerange(start_date=None, end_date=None, event_type=None, page=1, per_page=20,
+                            cursor=None, total_mode='exact'):
     """
     Get events within a time range, optionally filtered by event type
     
+    Events older than the archive's bound are read from the Parquet
+    archive instead of PostgreSQL, so a range reaching past the retention
+    window still returns them.
+    
     Args:
         start_date (datetime, optional): Filter events after this date
         end_date (datetime, optional): Filter events before this date
         event_type (str, optional): Filter by event type
         page (int): Page number for pagination
         per_page (int): Number of items per page
+        cursor (str, optional): next_cursor of the previous page; page is ignored when given
+        total_mode (str): 'exact', 'estimated' or 'none'; see page_events
         
     Returns:
         dict: Dictionary with events and pagination info
@@ -112,6 +274,7 @@ def get_events_by_timerange(start_date=None, end_date=None, event_type=None, pag
     try:
         # Log input parameters for monitoring
         current_app.logger.info(f"Fetching events with filters: start_date={start_date}, end_date={end_date}, event_type={event_type}")
+        start_date, end_date = stored_timestamp(start_date), stored_timestamp(end_date)
         
         # Choose the optimal query path based on filters
         if event_type:
@@ -121,6 +284,16 @@ def get_events_by_timerange(start_date=None, end_date=None, event_type=None, pag
             # Use the timestamp index
             query = Event.query
         
+        # Events before this are in the archive, not the table
+        archived_until = archived_events_until()
+        archive = None
+        if archived_until and (start_date is None or start_date < archived_until):
+            # The archive's end bound is exclusive, end_date is inclusive
+            archive_end = archived_until if end_date is None or end_date >= archived_until \
+                else end_date + timedelta(microseconds=1)
+            archive = (start_date, archive_end, event_type)
+            start_date = archived_until
+        
         # Apply date filters
         if start_date and end_date:
             query = query.filter(Event.timestamp.between(start_date, end_date))
@@ -129,22 +302,15 @@ def get_events_by_timerange(start_date=None, end_date=None, event_type=None, pag
         elif end_date:
             query = query.filter(Event.timestamp <= end_date)
         
-        # Sort by timestamp descending
-        query = query.order_by(desc(Event.timestamp))
-        
-        # Apply pagination
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        # Sorted by timestamp descending
+        result = page_events(query, page, per_page, cursor, total_mode, archive)
         
         # Log the result count for monitoring
-        current_app.logger.info(f"Found {pagination.total} events matching the criteria")
+        current_app.logger.info(f"Found {len(result['events'])} events on this page (total: {result['total']})")
         
-        return {
-            'events': [event.to_dict() for event in pagination.items],
-            'total': pagination.total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': pagination.pages
-        }
+        return result
+    except ValueError:
+        raise
     except Exception as e:
         current_app.logger.error(f"Failed to get events by timerange: {str(e)}")
         raise
@@ -153,34 +319,98 @@ def bulk_delete_old_events(days=30):
     """
     Delete events older than the specified number of days
     
+    On the partitioned table whole monthly partitions are detached and
+    dropped, so up to a month past the window is kept. A table not yet
+    migrated with flask partition-events falls back to a DELETE. Either way
+    the events are first exported to the Parquet archive when
+    EVENT_ARCHIVE_ENABLED is set.
+    
     Args:
         days (int): Number of days to keep events (delete everything older)
         
     Returns:
-        int: Number of events deleted
+        int: Number of events deleted; estimated from table statistics for dropped partitions
     """
     try:
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
+        cutoff_date = stored_timestamp(datetime.now(timezone.utc) - timedelta(days=days))
         
-        # Get count before deletion for return value
-        count_query = db.session.query(Event).filter(Event.timestamp < cutoff_date)
-        events_to_delete = count_query.count()
+        with db.engine.connect() as conn:
+            partitioned = table_kind(conn, EVENTS_TABLE) == 'p'
+        if partitioned:
+            _, events_deleted = drop_expired_event_partitions(cutoff_date)
+        else:
+            if EVENT_ARCHIVE_ENABLED:
+                # Rows archived by an earlier run whose DELETE failed are not exported twice
+                archived_until = archived_events_until() or datetime.min
+                archive_events(
+                    f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {EVENTS_TABLE} "
+                    f"WHERE timestamp >= %(after)s AND timestamp < %(cutoff)s ORDER BY id",
+                    basename=f"before-{cutoff_date:%Y%m%dT%H%M%S}",
+                    until=cutoff_date,
+                    params={'after': archived_until, 'cutoff': cutoff_date}
+                )
+            events_deleted = db.session.query(Event).filter(Event.timestamp < cutoff_date).delete()
+            db.session.commit()
         
-        # Use timestamp index for efficient deletion
-        db.session.query(Event).filter(Event.timestamp < cutoff_date).delete()
+        current_app.logger.info(f"Deleted {events_deleted} events older than {days} days")
+        return events_deleted
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to bulk delete events: {str(e)}")
+        raise
+
+def rebuild_event_daily_counts(since=None):
+    """
+    Recompute event_daily_counts from the raw events, for days from since
+    through today
+    
+    Args:
+        since (date, optional): First day to rebuild; defaults to every day
+            that still has its full set of raw events
+        
+    Returns:
+        int: Number of (day, event_type) rows written
+    """
+    try:
+        # Event writers upsert the rollup inside their insert transactions;
+        # they wait on this lock until the rebuild commits, so every event is
+        # counted exactly once
+        db.session.execute(text("LOCK TABLE event_daily_counts IN EXCLUSIVE MODE"))
+        if since is None:
+            first = db.session.query(func.min(Event.timestamp)).scalar()
+            if first is None:
+                db.session.commit()
+                return 0
+            since = event_date(first)
+            # bulk_delete_old_events cuts mid-day, so the oldest raw day may be
+            # partial; keep its rollup row when it already has one
+            if db.session.query(EventDailyCount.date).filter(EventDailyCount.date == since).first():
+                since += timedelta(days=1)
+        
+        day = cast(Event.timestamp, Date)
+        grouped = select(day, Event.event_type, func.count(Event.id)).where(
+            Event.timestamp >= datetime.combine(since, time.min)
+        ).group_by(day, Event.event_type)
+        db.session.query(EventDailyCount).filter(EventDailyCount.date >= since).delete(synchronize_session=False)
+        result = db.session.execute(
+            insert(EventDailyCount).from_select(['date', 'event_type', 'count'], grouped)
+        )
         db.session.commit()
         
-        current_app.logger.info(f"Deleted {events_to_delete} events older than {days} days")
-        return events_to_delete
+        current_app.logger.info(f"Rebuilt {result.rowcount} daily event counts since {since}")
+        return result.rowcount
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Failed to bulk delete events: {str(e)}")
+        current_app.logger.error(f"Failed to rebuild daily event counts: {str(e)}")
         raise
 
 def get_daily_event_counts(days=30):
     """
     Get daily counts of events by event_type for the specified number of past days
     
+    Earlier days come from the event_daily_counts rollup and only today is
+    counted from raw events, so the cost does not grow with event volume.
+    
     Args:
         days (int): Number of past days to analyze (default: 30)
         
@@ -191,22 +421,31 @@ def get_daily_event_counts(days=30):
             - counts: Dictionary with event_type keys, each containing a list of daily counts
     """
     try:
-        # Calculate the start date (30 days ago from now)
-        start_date = datetime.now(timezone.utc) - timedelta(days=days)
+        now = datetime.now(timezone.utc)
+        today = now.date()
+        start_day = (now - timedelta(days=days)).date()
         
-        # Query to get counts grouped by date and event_type
+        # Completed days, read from the rollup's (date, event_type) key
         results = db.session.query(
-            cast(Event.timestamp, Date).label('date'),
+            EventDailyCount.date,
+            EventDailyCount.event_type,
+            EventDailyCount.count
+        ).filter(
+            EventDailyCount.date >= start_day,
+            EventDailyCount.date < today,
+            EventDailyCount.count > 0
+        ).all()
+        
+        # Today's partial day, a short range on the timestamp index
+        today_counts = db.session.query(
             Event.event_type,
-            func.count(Event.id).label('count')
+            func.count(Event.id)
         ).filter(
-            Event.timestamp >= start_date
+            Event.timestamp >= datetime.combine(today, time.min)
         ).group_by(
-            cast(Event.timestamp, Date),
             Event.event_type
-        ).order_by(
-            cast(Event.timestamp, Date)
         ).all()
+        results += [(today, event_type, count) for event_type, count in today_counts]
         
         # Process results into the desired format
         dates_set = set()
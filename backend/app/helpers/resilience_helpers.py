@@ -0,0 +1,105 @@
+import time
+import random
+import threading
+from .metrics_helpers import increment, register_gauge
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class Deadline:
+    """Time budget for a whole request, shared by every remote call it makes"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def check(self):
+        if self.remaining() <= 0:
+            increment('deadline.exceeded')
+            raise DeadlineExceeded(f"Request budget of {self.seconds}s exhausted")
+
+    def timeout(self, cap):
+        """Per-call timeout: the configured cap, cut short by what is left of the budget"""
+        self.check()
+        return min(cap, self.remaining())
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Fails fast after failure_threshold consecutive failures. After reset_timeout
+    seconds a single trial call is let through; its outcome closes or re-opens
+    the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        register_gauge(f'{name}.breaker.state', lambda: self.state)
+        register_gauge(f'{name}.breaker.consecutive_failures', lambda: self._failures)
+
+    @property
+    def state(self):
+        return self._state
+
+    def is_open(self):
+        """True while calls would be rejected outright"""
+        with self._lock:
+            return self._state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        increment(f'{self.name}.breaker.rejected')
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """The trial call ended without saying anything about the upstream's health"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    increment(f'{self.name}.breaker.trips')
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
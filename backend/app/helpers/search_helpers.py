@@ -0,0 +1,80 @@
+import re
+from pymongo import UpdateOne
+from .cache_helpers import invalidate_product_counts, invalidate_cached_product
+
+# Substring search on SKUs goes through trigrams stored on the product
+# itself (sku_ngrams, multikey-indexed), so they are written in the same
+# single-document update as the SKU they describe and can never drift.
+SKU_NGRAM_SIZE = 3
+SEARCH_TEXT_WEIGHTS = {'title': 10, 'description': 1}
+SEARCH_MODES = ['indexed', 'regex']
+
+
+def sku_ngrams(sku):
+    """Distinct lowercase trigrams of a SKU; shorter SKUs are their own single token"""
+    sku = (sku or '').strip().lower()
+    if len(sku) <= SKU_NGRAM_SIZE:
+        return [sku] if sku else []
+    return sorted({sku[i:i + SKU_NGRAM_SIZE] for i in range(len(sku) - SKU_NGRAM_SIZE + 1)})
+
+
+def add_search_tokens(fields):
+    """Add the search tokens derived from any indexed fields being written"""
+    if 'sku' in fields:
+        fields['sku_ngrams'] = sku_ngrams(fields['sku'])
+    return fields
+
+
+def search_term(search_query):
+    """The search to run, or None when search_query is missing or only whitespace"""
+    if search_query is None or not search_query.strip():
+        return None
+    return search_query
+
+
+def build_search_query(search_query, search_mode='indexed'):
+    """Return the filter matching products for a search term; empty for a blank one"""
+    if search_term(search_query) is None:
+        return {}
+    if search_mode == 'regex':
+        # Unanchored and case-insensitive: no index can serve it
+        regex_pattern = {'$regex': search_query, '$options': 'i'}
+        return {'$or': [
+            {'title': regex_pattern},
+            {'sku': regex_pattern},
+            {'price_text': regex_pattern},
+            {'currency': regex_pattern}
+        ]}
+
+    term = search_query.strip()
+    if len(term) >= SKU_NGRAM_SIZE:
+        # Trigrams find the candidates through the index; the regex only
+        # rechecks those few that the grams appear in out of order
+        sku_clause = {
+            'sku_ngrams': {'$all': sku_ngrams(term)},
+            'sku': {'$regex': re.escape(term), '$options': 'i'}
+        }
+    else:
+        # SKUs are upper case, so an anchored prefix can walk the sku index
+        sku_clause = {'sku': {'$regex': f'^{re.escape(term.upper())}'}}
+    # Quotes and a leading '-' are phrase/negation syntax to $text; search plain words
+    words = re.sub(r'["\-]', ' ', term)
+    # Every $or branch is indexed, as MongoDB requires alongside $text
+    return {'$or': [{'$text': {'$search': words}}, sku_clause]}
+
+
+def backfill_search_tokens(mongo, batch_size=1000):
+    """Write search tokens for products stored before they existed; returns the number updated"""
+    updated = 0
+    batch = []
+    for document in mongo.products.find({'sku_ngrams': {'$exists': False}}, {'sku': 1}):
+        batch.append(UpdateOne({'_id': document['_id']}, {'$set': add_search_tokens({'sku': document.get('sku')})}))
+        if len(batch) >= batch_size:
+            updated += mongo.products.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += mongo.products.bulk_write(batch, ordered=False).modified_count
+    if updated:
+        invalidate_product_counts()
+        invalidate_cached_product()
+    return updated
@@ -1,29 +1,49 @@
 import os
-from gql import gql, Client
+import json
+import logging
+import threading
+import time
+import requests
+from graphql import build_client_schema, get_introspection_query, validate, OperationType
+from gql import gql
+from gql.transport.exceptions import TransportQueryError, TransportServerError
 from gql.transport.requests import RequestsHTTPTransport
+from requests.adapters import HTTPAdapter
 from flask import current_app
+from .metrics_helpers import increment, observe
+from .throttle_helpers import get_cost_bucket, estimate_cost, record_cost, is_throttled, record_throttled
+from .resilience_helpers import CircuitBreaker, CircuitOpenError, DeadlineExceeded, backoff_delay
 
-def get_shopify_client():
-    store_url = os.getenv('SHOPIFY_STORE_URL')
-    if not store_url:
-        raise ValueError("SHOPIFY_STORE_URL environment variable is required")
-        
-    transport = RequestsHTTPTransport(
-        url=f'https://{store_url}/admin/api/2024-01/graphql.json',
-        headers={
-            'X-Shopify-Access-Token': os.getenv('SHOPIFY_ACCESS_TOKEN'),
-            'Content-Type': 'application/json'
-        },
-        verify=True
-    )
-    return Client(transport=transport, fetch_schema_from_transport=True)
-
-def create_shopify_product(product_data):
-    """Create a product in Shopify"""
-    client = get_shopify_client()
-    
-    # First create the product without images
-    mutation = gql("""
+logger = logging.getLogger(__name__)
+
+SHOPIFY_API_VERSION = os.getenv('SHOPIFY_API_VERSION', '2024-01')
+SHOPIFY_POOL_SIZE = int(os.getenv('SHOPIFY_POOL_SIZE', 10))
+SHOPIFY_THROTTLE_RETRIES = int(os.getenv('SHOPIFY_THROTTLE_RETRIES', 3))
+# Per-call transport timeout; a request's deadline can only shorten it
+SHOPIFY_TIMEOUT = float(os.getenv('SHOPIFY_TIMEOUT', 10))
+# Total budget for the Shopify work done on behalf of one API request
+SHOPIFY_REQUEST_BUDGET = float(os.getenv('SHOPIFY_REQUEST_BUDGET', 15))
+SHOPIFY_MAX_RETRIES = int(os.getenv('SHOPIFY_MAX_RETRIES', 2))
+SHOPIFY_RETRY_BASE_DELAY = float(os.getenv('SHOPIFY_RETRY_BASE_DELAY', 0.2))
+SHOPIFY_RETRY_MAX_DELAY = float(os.getenv('SHOPIFY_RETRY_MAX_DELAY', 2))
+SHOPIFY_BREAKER_THRESHOLD = int(os.getenv('SHOPIFY_BREAKER_THRESHOLD', 5))
+SHOPIFY_BREAKER_RESET = float(os.getenv('SHOPIFY_BREAKER_RESET', 30))
+SHOPIFY_PRODUCT_FIELDS = ['title', 'description', 'price', 'sku', 'image_url']
+BULK_POLL_INTERVAL = float(os.getenv('SHOPIFY_BULK_POLL_INTERVAL', 2))
+BULK_POLL_TIMEOUT = float(os.getenv('SHOPIFY_BULK_POLL_TIMEOUT', 2 * 60 * 60))
+# (connect, read) timeout for staged uploads and result downloads; the read
+# timeout bounds each wait for data, not the whole transfer
+BULK_FILE_TIMEOUT = (SHOPIFY_TIMEOUT, float(os.getenv('SHOPIFY_BULK_FILE_TIMEOUT', 60)))
+SHOPIFY_SCHEMA_CACHE_DIR = os.getenv(
+    'SHOPIFY_SCHEMA_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '.shopify_cache')
+)
+
+# Every document sent to Shopify lives here so it is parsed once per process
+# and validated once against the Admin API schema when the client is built;
+# a document the schema rejects disables only that operation.
+OPERATION_SOURCES = {
+    'productCreate': """
         mutation productCreate($input: ProductInput!) {
             productCreate(input: $input) {
                 product {
@@ -45,20 +65,498 @@ def create_shopify_product(product_data):
                 }
             }
         }
-    """)
+    """,
+    'productUpdate': """
+        mutation productUpdate($input: ProductInput!) {
+            productUpdate(input: $input) {
+                product {
+                    id
+                    title
+                    descriptionHtml
+                    variants(first: 1) {
+                        edges {
+                            node {
+                                price
+                                sku
+                            }
+                        }
+                    }
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    'productDelete': """
+        mutation productDelete($input: ProductDeleteInput!) {
+            productDelete(input: $input) {
+                deletedProductId
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    'productCreateMedia': """
+        mutation productCreateMedia($productId: ID!, $media: [CreateMediaInput!]!) {
+            productCreateMedia(productId: $productId, media: $media) {
+                media {
+                    ... on MediaImage {
+                        image {
+                            url
+                        }
+                    }
+                }
+                mediaUserErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    # Shopify deletes only the images it is given, so update_shopify_product
+    # looks them up first
+    'productImages': """
+        query productImages($id: ID!) {
+            product(id: $id) {
+                images(first: 250) {
+                    edges {
+                        node {
+                            id
+                        }
+                    }
+                }
+            }
+        }
+    """,
+    'productDeleteImages': """
+        mutation productDeleteImages($productId: ID!, $imageIds: [ID!]!) {
+            productDeleteImages(id: $productId, imageIds: $imageIds) {
+                deletedImageIds
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    # Combined documents used by update_shopify_product; top-level mutation
+    # fields run serially, so images are removed before the new one is added
+    'productReplaceImage': """
+        mutation productReplaceImage($productId: ID!, $imageIds: [ID!]!, $media: [CreateMediaInput!]!) {
+            productDeleteImages(id: $productId, imageIds: $imageIds) {
+                deletedImageIds
+                userErrors {
+                    field
+                    message
+                }
+            }
+            productCreateMedia(productId: $productId, media: $media) {
+                mediaUserErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    'productUpdateRemoveImage': """
+        mutation productUpdateRemoveImage($input: ProductInput!, $productId: ID!, $imageIds: [ID!]!) {
+            productUpdate(input: $input) {
+                product {
+                    id
+                    title
+                    descriptionHtml
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+            productDeleteImages(id: $productId, imageIds: $imageIds) {
+                deletedImageIds
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    'productUpdateReplaceImage': """
+        mutation productUpdateReplaceImage($input: ProductInput!, $productId: ID!, $imageIds: [ID!]!, $media: [CreateMediaInput!]!) {
+            productUpdate(input: $input) {
+                product {
+                    id
+                    title
+                    descriptionHtml
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+            productDeleteImages(id: $productId, imageIds: $imageIds) {
+                deletedImageIds
+                userErrors {
+                    field
+                    message
+                }
+            }
+            productCreateMedia(productId: $productId, media: $media) {
+                mediaUserErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    # For a product that has no images yet
+    'productUpdateAddImage': """
+        mutation productUpdateAddImage($input: ProductInput!, $productId: ID!, $media: [CreateMediaInput!]!) {
+            productUpdate(input: $input) {
+                product {
+                    id
+                    title
+                    descriptionHtml
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+            productCreateMedia(productId: $productId, media: $media) {
+                mediaUserErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    'stagedUploadsCreate': """
+        mutation stagedUploadsCreate($input: [StagedUploadInput!]!) {
+            stagedUploadsCreate(input: $input) {
+                stagedTargets {
+                    url
+                    resourceUrl
+                    parameters {
+                        name
+                        value
+                    }
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    'bulkOperationRunMutation': """
+        mutation bulkOperationRunMutation($mutation: String!, $stagedUploadPath: String!) {
+            bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $stagedUploadPath) {
+                bulkOperation {
+                    id
+                    status
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    'bulkOperationRunQuery': """
+        mutation bulkOperationRunQuery($query: String!) {
+            bulkOperationRunQuery(query: $query) {
+                bulkOperation {
+                    id
+                    status
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+    'bulkOperation': """
+        query bulkOperation($id: ID!) {
+            node(id: $id) {
+                ... on BulkOperation {
+                    id
+                    status
+                    errorCode
+                    objectCount
+                    url
+                    partialDataUrl
+                }
+            }
+        }
+    """,
+    # Sent as a string to bulkOperationRunMutation, once per line of the staged file
+    'bulkProductCreate': """
+        mutation bulkProductCreate($input: ProductInput!, $media: [CreateMediaInput!]) {
+            productCreate(input: $input, media: $media) {
+                product {
+                    id
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+    """,
+}
+
+# Bulk queries cannot take variables, so the search filter is formatted in.
+# Nested connections come back as separate JSONL lines carrying __parentId.
+BULK_PRODUCT_EXPORT_QUERY = """
+    query bulkProductExport {
+        products%s {
+            edges {
+                node {
+                    id
+                    title
+                    descriptionHtml
+                    variants {
+                        edges {
+                            node {
+                                price
+                                sku
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+"""
+# Validated with the other documents; the search argument does not change its shape
+OPERATION_SOURCES['bulkProductExport'] = BULK_PRODUCT_EXPORT_QUERY % ''
+
+OPERATIONS = {name: gql(source) for name, source in OPERATION_SOURCES.items()}
+MUTATIONS = {
+    name for name, document in OPERATIONS.items()
+    if document.definitions[0].operation == OperationType.MUTATION
+}
+
+# Status codes Shopify returns before doing any work, so resending is safe
+RETRYABLE_STATUS_CODES = {429, 503}
+# Server and gateway errors: the origin may already have applied the request
+# (a 504 can arrive after the mutation ran), so like a read timeout they are
+# only resent for queries
+QUERY_RETRYABLE_STATUS_CODES = {500, 502, 504}
+# Failures that say Shopify is unhealthy, as opposed to a bad request
+UPSTREAM_FAILURES = (TransportServerError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+shopify_breaker = CircuitBreaker(
+    'shopify',
+    failure_threshold=SHOPIFY_BREAKER_THRESHOLD,
+    reset_timeout=SHOPIFY_BREAKER_RESET
+)
+
+
+def is_transient_error(error, is_mutation):
+    """Whether a failed call may be resent without risking a duplicate write"""
+    if isinstance(error, TransportServerError):
+        return error.code in RETRYABLE_STATUS_CODES or (not is_mutation and error.code in QUERY_RETRYABLE_STATUS_CODES)
+    if isinstance(error, requests.exceptions.ConnectionError):
+        # Covers ConnectTimeout: the request never reached Shopify
+        return True
+    if isinstance(error, requests.exceptions.Timeout):
+        # A read timeout may hide a mutation that was applied; only queries are resent
+        return not is_mutation
+    return False
+
+
+def shopify_available():
+    """False while the circuit breaker is rejecting Shopify calls"""
+    return not shopify_breaker.is_open()
+
+
+def shopify_error_status(error):
+    """HTTP status for a failed Shopify call"""
+    if isinstance(error, CircuitOpenError):
+        return 503
+    if isinstance(error, DeadlineExceeded):
+        return 504
+    return 500
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+class ShopifyClient:
+    """Long-lived Admin API client sharing one keep-alive connection pool"""
+
+    def __init__(self, store_url, access_token, api_version=SHOPIFY_API_VERSION,
+                 pool_size=SHOPIFY_POOL_SIZE, schema_cache_dir=SHOPIFY_SCHEMA_CACHE_DIR):
+        self.api_version = api_version
+        self.cost_bucket = get_cost_bucket(store_url)
+        self.schema_cache_path = os.path.join(schema_cache_dir, f'admin-{api_version}.json')
+        self.transport = RequestsHTTPTransport(
+            url=os.getenv('SHOPIFY_API_URL') or f'https://{store_url}/admin/api/{api_version}/graphql.json',
+            headers={
+                'X-Shopify-Access-Token': access_token,
+                'Content-Type': 'application/json'
+            },
+            verify=True,
+            timeout=SHOPIFY_TIMEOUT
+        )
+        self.transport.connect()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.transport.session.mount('https://', adapter)
+
+        self.schema = build_client_schema(self._load_introspection())
+        self.disabled_operations = {}
+        for name, document in OPERATIONS.items():
+            errors = validate(self.schema, document)
+            if errors:
+                self.disabled_operations[name] = errors[0].message
+                increment('shopify.disabled_operations')
+                logger.error(f"Shopify operation {name} is invalid for API {api_version} and is disabled: {errors[0].message}")
+
+    def _load_introspection(self):
+        """Read the cached schema for this API version, fetching it once if missing"""
+        try:
+            with open(self.schema_cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        result = self.transport.execute(gql(get_introspection_query(descriptions=False)))
+        if result.errors:
+            raise TransportQueryError(str(result.errors[0]), errors=result.errors, data=result.data)
+
+        try:
+            os.makedirs(os.path.dirname(self.schema_cache_path), exist_ok=True)
+            tmp_path = f'{self.schema_cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(result.data, f)
+            os.replace(tmp_path, self.schema_cache_path)
+        except OSError as e:
+            logger.warning(f"Could not persist Shopify schema cache: {str(e)}")
+        return result.data
+
+    def _send(self, name, variables, deadline):
+        """One round trip within the shared cost budget, resending only when throttled"""
+        for _ in range(SHOPIFY_THROTTLE_RETRIES + 1):
+            max_wait = deadline.remaining() if deadline else None
+            observe('shopify.queue_seconds', self.cost_bucket.acquire(estimate_cost(name), max_wait=max_wait))
+
+            timeout = deadline.timeout(SHOPIFY_TIMEOUT) if deadline else SHOPIFY_TIMEOUT
+            started = time.monotonic()
+            result = self.transport.execute(OPERATIONS[name], variable_values=variables, timeout=timeout)
+            observe(f'shopify.request_seconds.{name}', time.monotonic() - started)
+            increment('shopify.requests')
+
+            cost = (result.extensions or {}).get('cost')
+            if cost:
+                record_cost(name, cost)
+                self.cost_bucket.update(cost['throttleStatus'])
+
+            if not is_throttled(result.errors):
+                break
+            # The bucket now mirrors Shopify's, so the next acquire waits just long enough
+            record_throttled(name)
+        return result
+
+    def execute(self, name, variables=None, deadline=None):
+        """
+        Run a registered operation and return its data.
+
+        Transient failures are retried with jittered backoff while the deadline
+        leaves room; the circuit breaker rejects calls outright once Shopify
+        keeps failing.
+        """
+        if name in self.disabled_operations:
+            raise ValueError(
+                f"Shopify operation {name} is disabled for API {self.api_version}: {self.disabled_operations[name]}"
+            )
+        for attempt in range(SHOPIFY_MAX_RETRIES + 1):
+            if not shopify_breaker.allow():
+                raise CircuitOpenError("Shopify is unavailable, circuit breaker is open")
+            try:
+                result = self._send(name, variables, deadline)
+            except DeadlineExceeded:
+                shopify_breaker.release_trial()
+                raise
+            except Exception as e:
+                if isinstance(e, UPSTREAM_FAILURES):
+                    shopify_breaker.record_failure()
+                else:
+                    shopify_breaker.release_trial()
+                if not is_transient_error(e, name in MUTATIONS):
+                    raise
+                delay = backoff_delay(attempt, SHOPIFY_RETRY_BASE_DELAY, SHOPIFY_RETRY_MAX_DELAY)
+                if attempt == SHOPIFY_MAX_RETRIES or (deadline and deadline.remaining() <= delay):
+                    raise
+                increment('shopify.retries')
+                logger.warning(f"Retrying Shopify {name} in {delay:.2f}s after: {str(e)}")
+                time.sleep(delay)
+                continue
+
+            shopify_breaker.record_success()
+            if result.errors:
+                raise TransportQueryError(str(result.errors[0]), errors=result.errors, data=result.data)
+            return result.data
+
+    def close(self):
+        self.transport.close()
+
+
+def get_shopify_client():
+    """Return the process-wide Shopify client, building it on first use"""
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        # Forked workers must not share the parent's sockets
+        if _client is None or _client_pid != pid:
+            store_url = os.getenv('SHOPIFY_STORE_URL')
+            if not store_url:
+                raise ValueError("SHOPIFY_STORE_URL environment variable is required")
+            _client = ShopifyClient(store_url, os.getenv('SHOPIFY_ACCESS_TOKEN'))
+            _client_pid = pid
+    return _client
+
+def reset_shopify_client():
+    """Drop the cached client, e.g. after rotating the access token"""
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+def build_product_input(product_data):
+    """Map a validated product payload to a Shopify ProductInput"""
+    return {
+        "title": product_data['title'],
+        "descriptionHtml": product_data['description'],
+        "variants": [{
+            "price": str(product_data['price']),
+            "sku": product_data['sku']
+        }]
+    }
+
+def create_shopify_product(product_data, deadline=None):
+    """Create a product in Shopify, within the caller's deadline if given"""
+    client = get_shopify_client()
     
     variables = {
-        "input": {
-            "title": product_data['title'],
-            "descriptionHtml": product_data['description'],
-            "variants": [{
-                "price": str(product_data['price']),
-                "sku": product_data['sku']
-            }]
-        }
+        "input": build_product_input(product_data)
     }
     
-    result = client.execute(mutation, variable_values=variables)
+    result = client.execute('productCreate', variables, deadline=deadline)
     
     if result['productCreate']['userErrors']:
         return None
@@ -68,25 +566,6 @@ def create_shopify_product(product_data):
     # If we have an image URL, add it as a separate step
     if product_data.get('image_url'):
         try:
-            # Create a new mutation to add the image
-            image_mutation = gql("""
-                mutation productCreateMedia($productId: ID!, $media: [CreateMediaInput!]!) {
-                    productCreateMedia(productId: $productId, media: $media) {
-                        media {
-                            ... on MediaImage {
-                                image {
-                                    url
-                                }
-                            }
-                        }
-                        mediaUserErrors {
-                            field
-                            message
-                        }
-                    }
-                }
-            """)
-            
             image_variables = {
                 "productId": product['id'],
                 "media": [{
@@ -95,7 +574,7 @@ def create_shopify_product(product_data):
                 }]
             }
             
-            image_result = client.execute(image_mutation, variable_values=image_variables)
+            image_result = client.execute('productCreateMedia', image_variables, deadline=deadline)
             if image_result['productCreateMedia']['mediaUserErrors']:
                 # Log the error but don't fail the whole operation
                 current_app.logger.error(f"Failed to add image: {image_result['productCreateMedia']['mediaUserErrors']}")
@@ -106,9 +585,40 @@ def create_shopify_product(product_data):
     
     return product
 
-def update_shopify_product(shopify_id, product_data):
-    """Update a product in Shopify"""
-    client = get_shopify_client()
+def diff_product_fields(old_product_data, product_data):
+    """Return the Shopify-relevant fields of product_data that differ from the stored product"""
+    changes = {}
+    for field in SHOPIFY_PRODUCT_FIELDS:
+        if field not in product_data:
+            continue
+        new_value, old_value = product_data[field], old_product_data.get(field)
+        if field == 'price':
+            unchanged = new_value is not None and old_value is not None and float(new_value) == float(old_value)
+        elif field == 'image_url':
+            unchanged = (new_value or '').strip() == (old_value or '').strip()
+        else:
+            unchanged = new_value == old_value
+        if not unchanged:
+            changes[field] = new_value
+    return changes
+
+def get_shopify_product_image_ids(shopify_id, deadline=None):
+    """IDs of a product's images in Shopify"""
+    result = get_shopify_client().execute('productImages', {'id': shopify_id}, deadline=deadline)
+    images = (result.get('product') or {}).get('images') or {}
+    return [edge['node']['id'] for edge in images.get('edges', [])]
+
+def update_shopify_product(shopify_id, product_data, old_product_data=None, deadline=None):
+    """
+    Update a product in Shopify with a single request.
+    
+    When old_product_data (the stored MongoDB document) is given, only fields
+    that actually changed are sent, and the image is left alone unless it changed.
+    """
+    if old_product_data is not None:
+        product_data = diff_product_fields(old_product_data, product_data)
+        if not product_data:
+            return {"id": shopify_id}
     
     # Prepare the update input
     update_input = {
@@ -133,140 +643,160 @@ def update_shopify_product(shopify_id, product_data):
         
         update_input["variants"] = [variant_data]
     
-    # Handle image explicitly
-    # Images need to be handled differently in update vs create
-    # For update, we need to use the media field or a different approach
+    has_field_changes = len(update_input) > 1
+    replace_image = 'image_url' in product_data
+    new_image_url = (product_data.get('image_url') or '').strip()
     
-    mutation = gql("""
-        mutation productUpdate($input: ProductInput!) {
-            productUpdate(input: $input) {
-                product {
-                    id
-                    title
-                    descriptionHtml
-                    variants(first: 1) {
-                        edges {
-                            node {
-                                price
-                                sku
-                            }
-                        }
-                    }
-                }
-                userErrors {
-                    field
-                    message
-                }
-            }
-        }
-    """)
+    # productDeleteImages needs the image IDs, so an image change costs one
+    # extra read; field-only updates are still a single request
+    image_ids = get_shopify_product_image_ids(shopify_id, deadline) if replace_image else []
     
-    variables = {
-        "input": update_input
-    }
+    # Pick the pre-registered document that covers exactly the needed mutations;
+    # they run in order inside one request
+    if new_image_url:
+        if image_ids:
+            operation = 'productUpdateReplaceImage' if has_field_changes else 'productReplaceImage'
+        else:
+            operation = 'productUpdateAddImage' if has_field_changes else 'productCreateMedia'
+    elif image_ids:
+        operation = 'productUpdateRemoveImage' if has_field_changes else 'productDeleteImages'
+    elif replace_image and not has_field_changes:
+        # Removing the image of a product that has none
+        return {"id": shopify_id}
+    else:
+        operation = 'productUpdate'
+    
+    variables = {}
+    if has_field_changes or operation == 'productUpdate':
+        variables["input"] = update_input
+    if operation != 'productUpdate':
+        variables["productId"] = shopify_id
+    if image_ids:
+        variables["imageIds"] = image_ids
+    if new_image_url:
+        variables["media"] = [{
+            "mediaContentType": "IMAGE",
+            "originalSource": new_image_url
+        }]
     
     # Log the input for debugging
-    current_app.logger.info(f"Sending to Shopify: {variables}")
+    current_app.logger.info(f"Sending {operation} to Shopify: {variables}")
     
-    result = client.execute(mutation, variable_values=variables)
+    result = get_shopify_client().execute(operation, variables, deadline=deadline)
     
-    # Log any errors for debugging
-    if result['productUpdate']['userErrors']:
-        current_app.logger.error(f"Shopify update errors: {result['productUpdate']['userErrors']}")
-        return None
+    product = {"id": shopify_id}
+    if 'productUpdate' in result:
+        # Log any errors for debugging
+        if result['productUpdate']['userErrors']:
+            current_app.logger.error(f"Shopify update errors: {result['productUpdate']['userErrors']}")
+            return None
+        product = result['productUpdate']['product']
     
-    product = result['productUpdate']['product']
+    # Image failures are logged but don't fail the whole update
+    if 'productDeleteImages' in result and result['productDeleteImages']['userErrors']:
+        current_app.logger.error(f"Error deleting images: {result['productDeleteImages']['userErrors']}")
+    if 'productCreateMedia' in result and result['productCreateMedia']['mediaUserErrors']:
+        current_app.logger.error(f"Error adding image: {result['productCreateMedia']['mediaUserErrors']}")
     
-    # If we need to update the image and it was in the original request, 
-    # handle it as a separate operation after updating the other fields
-    if 'image_url' in product_data:
-        try:
-            # First, we may need to delete existing images
-            delete_images_mutation = gql("""
-                mutation productDeleteImages($productId: ID!) {
-                    productDeleteImages(productId: $productId) {
-                        deletedImageIds
-                        userErrors {
-                            field
-                            message
-                        }
-                    }
-                }
-            """)
-            
-            delete_variables = {
-                "productId": shopify_id
-            }
-            
-            # Delete existing images
-            delete_result = client.execute(delete_images_mutation, variable_values=delete_variables)
-            
-            if delete_result['productDeleteImages']['userErrors']:
-                current_app.logger.error(f"Error deleting images: {delete_result['productDeleteImages']['userErrors']}")
-            
-            # If there's a new image, add it
-            if product_data['image_url'] and product_data['image_url'].strip():
-                current_app.logger.info(f"Adding new image: {product_data['image_url']}")
-                
-                # Add new image using the media API
-                image_mutation = gql("""
-                    mutation productCreateMedia($productId: ID!, $media: [CreateMediaInput!]!) {
-                        productCreateMedia(productId: $productId, media: $media) {
-                            media {
-                                ... on MediaImage {
-                                    image {
-                                        url
-                                    }
-                                }
-                            }
-                            mediaUserErrors {
-                                field
-                                message
-                            }
-                        }
-                    }
-                """)
-                
-                image_variables = {
-                    "productId": shopify_id,
-                    "media": [{
-                        "mediaContentType": "IMAGE",
-                        "originalSource": product_data['image_url']
-                    }]
-                }
-                
-                image_result = client.execute(image_mutation, variable_values=image_variables)
-                
-                if image_result['productCreateMedia']['mediaUserErrors']:
-                    current_app.logger.error(f"Error adding image: {image_result['productCreateMedia']['mediaUserErrors']}")
-                
-        except Exception as e:
-            current_app.logger.error(f"Error handling images: {str(e)}")
-            # Don't fail the whole update if image handling fails
-            
     return product
 
-def delete_shopify_product(shopify_id):
-    """Delete a product in Shopify"""
+def delete_shopify_product(shopify_id, deadline=None):
+    """Delete a product in Shopify, within the caller's deadline if given"""
     client = get_shopify_client()
     
-    mutation = gql("""
-        mutation productDelete($input: ProductDeleteInput!) {
-            productDelete(input: $input) {
-                deletedProductId
-                userErrors {
-                    field
-                    message
-                }
-            }
-        }
-    """)
-    
     variables = {
         "input": {
             "id": shopify_id
         }
     }
     
-    result = client.execute(mutation, variable_values=variables)
-    return result['productDelete']['deletedProductId'] if not result['productDelete']['userErrors'] else None 
\ No newline at end of file
+    result = client.execute('productDelete', variables, deadline=deadline)
+    return result['productDelete']['deletedProductId'] if not result['productDelete']['userErrors'] else None
+
+def build_bulk_create_line(product_data):
+    """Serialize one product as a line of the bulk productCreate variables file"""
+    variables = {"input": build_product_input(product_data)}
+    if product_data.get('image_url'):
+        variables["media"] = [{
+            "mediaContentType": "IMAGE",
+            "originalSource": product_data['image_url']
+        }]
+    return json.dumps(variables, separators=(',', ':')) + '\n'
+
+def stage_bulk_variables(file_path):
+    """Upload a JSONL variables file to Shopify's staged storage and return its path"""
+    client = get_shopify_client()
+    
+    variables = {
+        "input": [{
+            "resource": "BULK_MUTATION_VARIABLES",
+            "filename": os.path.basename(file_path),
+            "mimeType": "text/jsonl",
+            "httpMethod": "POST"
+        }]
+    }
+    
+    result = client.execute('stagedUploadsCreate', variables)
+    if result['stagedUploadsCreate']['userErrors']:
+        raise Exception(f"Staged upload failed: {result['stagedUploadsCreate']['userErrors']}")
+    
+    target = result['stagedUploadsCreate']['stagedTargets'][0]
+    parameters = {p['name']: p['value'] for p in target['parameters']}
+    
+    with open(file_path, 'rb') as f:
+        response = requests.post(target['url'], data=parameters, files={'file': f}, timeout=BULK_FILE_TIMEOUT)
+    response.raise_for_status()
+    
+    return parameters['key']
+
+def run_bulk_mutation(operation_name, staged_upload_path):
+    """Start a bulk mutation for a registered operation and return the bulk operation ID"""
+    client = get_shopify_client()
+    
+    variables = {
+        "mutation": OPERATION_SOURCES[operation_name],
+        "stagedUploadPath": staged_upload_path
+    }
+    
+    result = client.execute('bulkOperationRunMutation', variables)
+    if result['bulkOperationRunMutation']['userErrors']:
+        raise Exception(f"Bulk mutation failed to start: {result['bulkOperationRunMutation']['userErrors']}")
+    
+    return result['bulkOperationRunMutation']['bulkOperation']['id']
+
+def run_bulk_product_export(search=None):
+    """Start a bulk export of products matching a Shopify search and return the bulk operation ID"""
+    client = get_shopify_client()
+    
+    product_filter = f'(query: {json.dumps(search)})' if search else ''
+    result = client.execute('bulkOperationRunQuery', {"query": BULK_PRODUCT_EXPORT_QUERY % product_filter})
+    if result['bulkOperationRunQuery']['userErrors']:
+        raise Exception(f"Bulk query failed to start: {result['bulkOperationRunQuery']['userErrors']}")
+    
+    return result['bulkOperationRunQuery']['bulkOperation']['id']
+
+def wait_for_bulk_operation(operation_id, poll_interval=BULK_POLL_INTERVAL, timeout=BULK_POLL_TIMEOUT):
+    """Poll a bulk operation until it finishes and return its final state"""
+    client = get_shopify_client()
+    deadline = time.monotonic() + timeout
+    interval = poll_interval
+    
+    while True:
+        operation = client.execute('bulkOperation', {"id": operation_id})['node']
+        if operation['status'] not in ('CREATED', 'RUNNING'):
+            return operation
+        if time.monotonic() > deadline:
+            raise Exception(f"Bulk operation {operation_id} did not finish within {timeout} seconds")
+        time.sleep(interval)
+        # Back off gradually; large operations take minutes, not seconds
+        interval = min(interval * 1.5, 30)
+
+def iter_bulk_results(url):
+    """Stream the JSONL result file of a bulk operation one parsed line at a time"""
+    if not url:
+        return
+    with requests.get(url, stream=True, timeout=BULK_FILE_TIMEOUT) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
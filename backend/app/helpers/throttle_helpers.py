@@ -0,0 +1,145 @@
+import os
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from .metrics_helpers import increment, observe, set_gauge
+from .resilience_helpers import DeadlineExceeded
+
+# Defaults for a standard plan until the first response reports the real bucket
+DEFAULT_MAXIMUM_AVAILABLE = float(os.getenv('SHOPIFY_COST_MAXIMUM', 1000))
+DEFAULT_RESTORE_RATE = float(os.getenv('SHOPIFY_COST_RESTORE_RATE', 50))
+DEFAULT_OPERATION_COST = 10
+THROTTLE_STATE_DIR = os.getenv('SHOPIFY_THROTTLE_STATE_DIR', tempfile.gettempdir())
+
+# available, maximum, restore_rate, updated_at
+_STATE = struct.Struct('<dddd')
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_cost_estimates = {}
+
+
+class CostBucket:
+    """
+    Leaky bucket mirroring Shopify's query cost budget for one store.
+
+    The state lives in a small file guarded by flock so every web process and
+    sync worker on the host draws from the same budget.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def _read(self, now):
+        data = os.pread(self._fd, _STATE.size, 0)
+        if len(data) < _STATE.size:
+            return DEFAULT_MAXIMUM_AVAILABLE, DEFAULT_MAXIMUM_AVAILABLE, DEFAULT_RESTORE_RATE, now
+        return _STATE.unpack(data)
+
+    def _write(self, available, maximum, restore_rate, updated_at):
+        os.pwrite(self._fd, _STATE.pack(available, maximum, restore_rate, updated_at), 0)
+
+    def _locked(self, update):
+        # flock is per open file, so threads in this process also need a mutex
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                available, maximum, restore_rate, updated_at = self._read(now)
+                available = min(maximum, available + max(0.0, now - updated_at) * restore_rate)
+                return update(now, available, maximum, restore_rate)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def acquire(self, cost, max_wait=None):
+        """
+        Block until cost points are available, take them and return the seconds waited.
+        Raises DeadlineExceeded instead of waiting longer than max_wait seconds.
+        """
+        started = time.monotonic()
+        while True:
+            def take(now, available, maximum, restore_rate):
+                needed = min(cost, maximum)
+                if available >= needed:
+                    self._write(available - needed, maximum, restore_rate, now)
+                    return 0.0
+                self._write(available, maximum, restore_rate, now)
+                return (needed - available) / restore_rate
+
+            wait = self._locked(take)
+            if wait <= 0:
+                return time.monotonic() - started
+            if max_wait is not None and time.monotonic() - started + wait > max_wait:
+                increment('deadline.exceeded')
+                raise DeadlineExceeded(f"Shopify cost budget would not refill within {max_wait:.2f}s")
+            time.sleep(wait)
+
+    def update(self, throttle_status):
+        """Resynchronize with the throttleStatus Shopify returned"""
+        def apply(now, available, maximum, restore_rate):
+            self._write(
+                float(throttle_status['currentlyAvailable']),
+                float(throttle_status['maximumAvailable']),
+                float(throttle_status['restoreRate']),
+                now
+            )
+        self._locked(apply)
+        set_gauge('shopify.cost.available', throttle_status['currentlyAvailable'])
+
+
+def _store_state_path(store_url, kind, extension):
+    digest = hashlib.sha1(store_url.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(THROTTLE_STATE_DIR, f'shopify-{kind}-{digest}.{extension}')
+
+
+def get_cost_bucket(store_url):
+    """Return the shared cost bucket for a store"""
+    # Keyed by pid too: a forked child must not share its parent's flock
+    key = (store_url, os.getpid())
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = CostBucket(_store_state_path(store_url, 'cost', 'bin'))
+        return bucket
+
+
+@contextmanager
+def store_lock(store_url, name):
+    """
+    Hold an exclusive lock named name for a store, shared by every process on
+    the host through flock. Each entry opens the file afresh, so threads in one
+    process exclude each other too. Processes on other hosts are not covered.
+    """
+    fd = os.open(_store_state_path(store_url, name, 'lock'), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the file releases the flock
+        os.close(fd)
+
+
+def estimate_cost(operation_name):
+    """Expected cost of an operation, learned from the last requestedQueryCost"""
+    return _cost_estimates.get(operation_name, DEFAULT_OPERATION_COST)
+
+
+def record_cost(operation_name, cost):
+    """Remember what an operation cost for the next estimate"""
+    _cost_estimates[operation_name] = cost['requestedQueryCost']
+    observe('shopify.cost.actual', cost.get('actualQueryCost') or 0)
+
+
+def is_throttled(errors):
+    return any((error.get('extensions') or {}).get('code') == 'THROTTLED' for error in errors or [])
+
+
+def record_throttled(operation_name):
+    increment('shopify.throttled')
+    increment(f'shopify.throttled.{operation_name}')
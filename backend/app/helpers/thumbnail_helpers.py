@@ -0,0 +1,252 @@
+import os
+import io
+import time
+import socket
+import hashlib
+import logging
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urljoin, urlsplit
+from bson.objectid import ObjectId
+import requests
+from PIL import Image
+from .metrics_helpers import increment, observe, register_gauge, get_counter
+from .cache_helpers import invalidate_cached_product
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = os.getenv(
+    'THUMBNAIL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '.thumbnails')
+)
+THUMBNAIL_BASE_URL = os.getenv('THUMBNAIL_BASE_URL', '/api/thumbnails')
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 4))
+THUMBNAIL_FETCH_TIMEOUT = float(os.getenv('THUMBNAIL_FETCH_TIMEOUT', 10))
+THUMBNAIL_MAX_SOURCE_BYTES = int(os.getenv('THUMBNAIL_MAX_SOURCE_BYTES', 20 * 1024 * 1024))
+THUMBNAIL_MAX_REDIRECTS = int(os.getenv('THUMBNAIL_MAX_REDIRECTS', 3))
+# A known URL is reused without a request for this long, then revalidated
+# with If-None-Match/If-Modified-Since so a replaced image is picked up
+THUMBNAIL_REVALIDATE_SECONDS = int(os.getenv('THUMBNAIL_REVALIDATE_SECONDS', 24 * 60 * 60))
+# Longest edge in pixels; 'table' is what the products table shows
+THUMBNAIL_SIZES = {'table': 96, 'card': 320}
+TABLE_SIZE = 'table'
+
+_pipeline = None
+_pipeline_pid = None
+_pipeline_lock = threading.Lock()
+
+
+def check_image_url(image_url):
+    """
+    Raise ValueError unless the URL is http(s) and its host resolves only to
+    public addresses, so product images cannot be used to reach internal
+    services or cloud metadata endpoints
+    """
+    parts = urlsplit(image_url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError("Image URL must be an http or https URL")
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        addresses = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except (ValueError, socket.gaierror) as e:
+        raise ValueError(f"Image host cannot be resolved: {str(e)}")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        # is_global excludes private, loopback, link-local and reserved ranges
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"Image host {parts.hostname} resolves to a non-public address")
+
+
+class ThumbnailPipeline:
+    """
+    Fetches each source image once and writes resized JPEGs named by the
+    SHA-256 of the source bytes, so identical images are resized only once
+    no matter how many URLs or products point at them.
+    """
+
+    def __init__(self, mongo=None, output_dir=THUMBNAIL_DIR, base_url=THUMBNAIL_BASE_URL,
+                 sizes=THUMBNAIL_SIZES, workers=THUMBNAIL_WORKERS, session=None):
+        self.mongo = mongo
+        self.output_dir = output_dir
+        self.base_url = base_url.rstrip('/')
+        self.sizes = sizes
+        self.session = session or requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        # Striped locks so two URLs with the same bytes are not resized twice at once
+        self._render_locks = [threading.Lock() for _ in range(64)]
+
+    def _relative_path(self, content_hash, size_name):
+        return f"{content_hash[:2]}/{content_hash}_{size_name}.jpg"
+
+    def _urls(self, content_hash):
+        return {name: f"{self.base_url}/{self._relative_path(content_hash, name)}" for name in self.sizes}
+
+    def _fetch(self, image_url, known=None):
+        """
+        Download an image, checking the URL and every redirect target first.
+
+        With known (the stored mapping) the request is conditional; returns
+        None when the server answers 304, otherwise (bytes, validators).
+        """
+        headers = {}
+        if known:
+            if known.get('etag'):
+                headers['If-None-Match'] = known['etag']
+            if known.get('last_modified'):
+                headers['If-Modified-Since'] = known['last_modified']
+
+        url = image_url
+        for _ in range(THUMBNAIL_MAX_REDIRECTS + 1):
+            check_image_url(url)
+            with self.session.get(url, headers=headers, stream=True, allow_redirects=False,
+                                  timeout=THUMBNAIL_FETCH_TIMEOUT) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers['Location'])
+                    continue
+                if response.status_code == 304:
+                    return None
+                response.raise_for_status()
+                buffer = io.BytesIO()
+                for chunk in response.iter_content(64 * 1024):
+                    buffer.write(chunk)
+                    if buffer.tell() > THUMBNAIL_MAX_SOURCE_BYTES:
+                        raise ValueError(f"Image larger than {THUMBNAIL_MAX_SOURCE_BYTES} bytes")
+                validators = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+            return buffer.getvalue(), validators
+        raise ValueError(f"Image URL redirected more than {THUMBNAIL_MAX_REDIRECTS} times")
+
+    def _render(self, content_hash, source):
+        image = Image.open(io.BytesIO(source))
+        image.load()
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for name, edge in self.sizes.items():
+            path = os.path.join(self.output_dir, self._relative_path(content_hash, name))
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            thumbnail = image.copy()
+            thumbnail.thumbnail((edge, edge), Image.LANCZOS)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            thumbnail.save(tmp_path, 'JPEG', quality=85, optimize=True)
+            os.replace(tmp_path, path)
+
+    def _is_rendered(self, content_hash):
+        return all(
+            os.path.exists(os.path.join(self.output_dir, self._relative_path(content_hash, name)))
+            for name in self.sizes
+        )
+
+    def process(self, image_url):
+        """Return thumbnail URLs for an image, generating them if needed"""
+        started = time.monotonic()
+
+        # A URL we've seen recently maps straight to its content hash: no download
+        known = self.mongo.thumbnails.find_one({'_id': image_url}) if self.mongo is not None else None
+        if known and not self._is_rendered(known['hash']):
+            known = None
+        if known and self._is_fresh(known):
+            increment('thumbnails.cache_hits')
+            return self._urls(known['hash'])
+
+        fetched = self._fetch(image_url, known)
+        if fetched is None:
+            # 304: the image is unchanged, so its thumbnails still are too
+            increment('thumbnails.revalidated')
+            self.mongo.thumbnails.update_one(
+                {'_id': image_url}, {'$set': {'checked_at': datetime.now(timezone.utc)}}
+            )
+            return self._urls(known['hash'])
+
+        source, validators = fetched
+        content_hash = hashlib.sha256(source).hexdigest()
+        with self._render_locks[int(content_hash[:8], 16) % len(self._render_locks)]:
+            if self._is_rendered(content_hash):
+                increment('thumbnails.cache_hits')
+            else:
+                increment('thumbnails.cache_misses')
+                self._render(content_hash, source)
+                observe('thumbnails.process_seconds', time.monotonic() - started)
+
+        if self.mongo is not None:
+            self.mongo.thumbnails.update_one(
+                {'_id': image_url},
+                {
+                    '$set': dict(validators, hash=content_hash, checked_at=datetime.now(timezone.utc)),
+                    '$setOnInsert': {'created_at': datetime.now(timezone.utc)}
+                },
+                upsert=True
+            )
+        return self._urls(content_hash)
+
+    def _is_fresh(self, known):
+        checked_at = known.get('checked_at')
+        if checked_at is None:
+            return False
+        # Stored datetimes come back naive unless the client is tz_aware; both are UTC
+        age = datetime.now(timezone.utc) - checked_at.replace(tzinfo=timezone.utc)
+        return age < timedelta(seconds=THUMBNAIL_REVALIDATE_SECONDS)
+
+    def submit(self, image_url):
+        """Queue an image; concurrent requests for the same URL share one job"""
+        with self._in_flight_lock:
+            future = self._in_flight.get(image_url)
+            if future is None:
+                future = self.executor.submit(self.process, image_url)
+                self._in_flight[image_url] = future
+                future.add_done_callback(lambda f: self._forget(image_url))
+        return future
+
+    def _forget(self, image_url):
+        with self._in_flight_lock:
+            self._in_flight.pop(image_url, None)
+
+
+def _hit_ratio():
+    hits, misses = get_counter('thumbnails.cache_hits'), get_counter('thumbnails.cache_misses')
+    return hits / (hits + misses) if hits + misses else None
+
+
+register_gauge('thumbnails.cache_hit_ratio', _hit_ratio)
+
+
+def get_thumbnail_pipeline(mongo):
+    """Return the process-wide thumbnail pipeline"""
+    global _pipeline, _pipeline_pid
+
+    pid = os.getpid()
+    with _pipeline_lock:
+        if _pipeline is None or _pipeline_pid != pid:
+            _pipeline = ThumbnailPipeline(mongo)
+            _pipeline_pid = pid
+    return _pipeline
+
+
+def schedule_product_thumbnail(mongo, product_id, image_url):
+    """Generate a product's thumbnail in the background and store its URL when ready"""
+    if not image_url or not image_url.strip():
+        return None
+
+    def store(future):
+        try:
+            urls = future.result()
+            # Skip if the product's image changed while we were working
+            mongo.products.update_one(
+                {'_id': ObjectId(product_id), 'image_url': image_url},
+                {'$set': {'thumbnail_url': urls[TABLE_SIZE]}}
+            )
+            invalidate_cached_product(ObjectId(product_id))
+        except Exception as e:
+            increment('thumbnails.failures')
+            logger.error(f"Thumbnail generation failed for {image_url}: {str(e)}")
+
+    future = get_thumbnail_pipeline(mongo).submit(image_url)
+    future.add_done_callback(store)
+    return future
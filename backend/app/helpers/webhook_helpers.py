@@ -0,0 +1,173 @@
+import os
+import hmac
+import base64
+import socket
+import hashlib
+import logging
+from datetime import datetime, timezone, timedelta
+from dateutil import parser as date_parser
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .metrics_helpers import increment, observe
+from .search_helpers import add_search_tokens
+from .cache_helpers import invalidate_product_counts, invalidate_cached_product
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_TOPICS = ('products/update', 'products/delete')
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 500))
+WEBHOOK_LEASE_SECONDS = int(os.getenv('WEBHOOK_LEASE_SECONDS', 60))
+WEBHOOK_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', 0.5))
+# Shopify retries failed deliveries for 48 hours, so keep IDs a little longer to dedupe
+WEBHOOK_RETENTION_SECONDS = int(os.getenv('WEBHOOK_RETENTION_SECONDS', 3 * 24 * 60 * 60))
+
+
+def verify_webhook_hmac(body, received_hmac, secret=None):
+    """Check the X-Shopify-Hmac-Sha256 header against the raw request body"""
+    secret = secret or os.getenv('SHOPIFY_WEBHOOK_SECRET')
+    if not secret or not received_hmac:
+        return False
+    digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode('ascii'), received_hmac)
+
+
+def _product_gid(payload):
+    return payload.get('admin_graphql_api_id') or f"gid://shopify/Product/{payload['id']}"
+
+
+def _extract_change(topic, payload):
+    """Keep only what the apply stage needs, so queued documents stay small"""
+    if topic == 'products/delete':
+        return {'shopify_id': _product_gid(payload), 'deleted': True}
+
+    change = {
+        'shopify_id': _product_gid(payload),
+        'deleted': False,
+        'fields': {'title': payload.get('title'), 'description': payload.get('body_html') or ''},
+        'shopify_updated_at': date_parser.isoparse(payload['updated_at']) if payload.get('updated_at') else None
+    }
+    variants = payload.get('variants') or []
+    if variants:
+        price = float(variants[0]['price'])
+        change['fields'].update({'price': price, 'price_text': f"{price:.2f}", 'sku': variants[0].get('sku')})
+    return change
+
+
+def enqueue_webhook(mongo, webhook_id, topic, payload):
+    """
+    Queue a verified webhook for the apply stage.
+
+    Returns:
+        bool: False when the webhook ID was already received (a Shopify retry)
+    """
+    increment('webhooks.received')
+    try:
+        mongo.webhook_events.insert_one({
+            'webhook_id': webhook_id,
+            'topic': topic,
+            'change': _extract_change(topic, payload),
+            'status': 'pending',
+            'received_at': datetime.now(timezone.utc)
+        })
+        return True
+    except DuplicateKeyError:
+        increment('webhooks.duplicates')
+        return False
+
+
+def webhook_due_query(now):
+    """Filter for webhook events that are pending or whose worker's lease has run out"""
+    return {'$or': [
+        {'status': 'pending'},
+        {'status': 'processing', 'claimed_at': {'$lt': now - timedelta(seconds=WEBHOOK_LEASE_SECONDS)}}
+    ]}
+
+
+def _claim_batch(mongo, worker_id):
+    now = datetime.now(timezone.utc)
+    due = webhook_due_query(now)
+    ids = [doc['_id'] for doc in mongo.webhook_events.find(due, {'_id': 1}).sort('received_at', 1).limit(WEBHOOK_BATCH_SIZE)]
+    if not ids:
+        return []
+    mongo.webhook_events.update_many(
+        {'_id': {'$in': ids}, **due},
+        {'$set': {'status': 'processing', 'claimed_by': worker_id, 'claimed_at': now}}
+    )
+    return list(mongo.webhook_events.find({'_id': {'$in': ids}, 'claimed_by': worker_id, 'status': 'processing'}).sort('received_at', 1))
+
+
+def coalesce_changes(events):
+    """Collapse a batch of webhook events to the final change per product"""
+    latest = {}
+    for event in events:
+        change = event['change']
+        current = latest.get(change['shopify_id'])
+        if current is None or change['deleted'] or (
+            not current['deleted']
+            and (change.get('shopify_updated_at') or datetime.min) >= (current.get('shopify_updated_at') or datetime.min)
+        ):
+            latest[change['shopify_id']] = change
+    return list(latest.values())
+
+
+def apply_webhook_changes(mongo, changes):
+    """Write coalesced changes to products keyed by shopify_id in one bulk_write"""
+    now = datetime.now(timezone.utc)
+    operations = []
+    for change in changes:
+        # Products with a pending local write keep it; the outbox will push it to Shopify
+        query = {'shopify_id': change['shopify_id'], 'outbox': {'$exists': False}}
+        if change['deleted']:
+            operations.append(UpdateOne(query, {'$set': {'is_deleted': True, 'updated_at': now}}))
+            continue
+
+        fields = add_search_tokens(dict(change['fields'], updated_at=now))
+        if change.get('shopify_updated_at'):
+            # Never let an older delivery overwrite a newer one
+            fields['shopify_updated_at'] = change['shopify_updated_at']
+            query['$or'] = [
+                {'shopify_updated_at': {'$exists': False}},
+                {'shopify_updated_at': {'$lt': change['shopify_updated_at']}}
+            ]
+        operations.append(UpdateOne(query, {'$set': fields}))
+
+    if not operations:
+        return 0
+    modified = mongo.products.bulk_write(operations, ordered=False).modified_count
+    if modified:
+        invalidate_product_counts()
+        invalidate_cached_product()
+    return modified
+
+
+def process_webhook_batch(mongo, worker_id):
+    """Claim, coalesce and apply one batch of queued webhooks; returns the batch size"""
+    events = _claim_batch(mongo, worker_id)
+    if not events:
+        return 0
+
+    changes = coalesce_changes(events)
+    applied = apply_webhook_changes(mongo, changes)
+    mongo.webhook_events.update_many(
+        {'_id': {'$in': [event['_id'] for event in events]}},
+        {'$set': {'status': 'done'}}
+    )
+
+    increment('webhooks.processed', len(events))
+    increment('webhooks.coalesced', len(events) - len(changes))
+    increment('webhooks.applied', applied)
+    observe('webhooks.lag_seconds', (datetime.now(timezone.utc) - events[0]['received_at'].replace(tzinfo=timezone.utc)).total_seconds())
+    return len(events)
+
+
+def run_webhook_worker(mongo, stop_event, poll_interval=WEBHOOK_POLL_INTERVAL):
+    """Apply queued webhooks until stop_event is set"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    while not stop_event.is_set():
+        try:
+            processed = process_webhook_batch(mongo, worker_id)
+        except Exception as e:
+            logger.error(f"Webhook batch failed: {str(e)}")
+            processed = 0
+        if not processed:
+            stop_event.wait(poll_interval)
@@ -4,19 +4,22 @@ from datetime import datetime, timezone
 class Event(db.Model):
     __tablename__ = 'identifier_events'
     
-    id = db.Column(db.Integer, primary_key=True)
+    # The table is range-partitioned by month on timestamp, and a partitioned
+    # table's primary key must include the partition key
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.String(120), nullable=False)  # MongoDB user ID
     user_name = db.Column(db.String(255))  # User's name for readability
     product_id = db.Column(db.String(120), nullable=False)  # MongoDB product ID
     product_title = db.Column(db.String(255))  # Product title for readability
     event_type = db.Column(db.String(50), nullable=False)  # create/update/delete
-    timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    timestamp = db.Column(db.DateTime, primary_key=True, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
     
     # Define optimized indexes for filtering
     __table_args__ = (
         db.Index('idx_events_user_timestamp', user_id, timestamp.desc()),
         db.Index('idx_events_type_timestamp', event_type, timestamp.desc()),
-        db.Index('idx_events_timestamp', timestamp.desc()),    
+        db.Index('idx_events_timestamp', timestamp.desc()),
+        {'postgresql_partition_by': 'RANGE (timestamp)'}
     )
     
     def to_dict(self):
@@ -28,4 +31,12 @@ class Event(db.Model):
             'product_title': self.product_title,
             'event_type': self.event_type,
             'timestamp': self.timestamp.isoformat()
-        } 
\ No newline at end of file
+        } 
+
+class EventDailyCount(db.Model):
+    """Events per UTC day and event type, kept up to date as events are written"""
+    __tablename__ = 'event_daily_counts'
+    
+    date = db.Column(db.Date, primary_key=True)
+    event_type = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
@@ -1,43 +1,85 @@
 from datetime import datetime, timezone
-from bson import ObjectId
+
+# Marks a thumbnail_url that was never set, as distinct from one set to None
+_UNSET = object()
 
 class Product:
+    # Stored fields each serialized view needs; used as the Mongo projection so
+    # unused fields (like long descriptions) are never sent or decoded
+    VIEW_FIELDS = {
+        'table': ['title', 'sku', 'price', 'currency', 'thumbnail_url', 'image_url', 'status'],
+        'modal': ['title', 'description', 'price', 'currency', 'image_url']
+    }
+    
+    # Fixed attribute layout: no per-instance __dict__, and a list page of
+    # products costs a fraction of the memory
+    __slots__ = (
+        'title', 'description', 'price', 'currency', 'sku', 'image_url', 'shopify_id', 'status',
+        'created_at', 'updated_at', 'last_sync', 'is_deleted', '_id', '_price_text', '_thumbnail_url'
+    )
+    
     def __init__(self, title, description, price, sku, image_url=None, shopify_id=None, status='draft', currency='USD'):
+        now = datetime.now(timezone.utc)
         self.title = title
         self.description = description
         self.price = float(price)  # Ensure price is stored as float
         self.currency = currency
-        self.price_text = f"{float(price):.2f}"  # Store price as string without currency
+        self._price_text = None  # Derived from price on first use
         self.sku = sku
         self.image_url = image_url
-        self.thumbnail_url = image_url  # Can be processed version of main image
+        self._thumbnail_url = _UNSET  # Falls back to image_url until a thumbnail is set
         self.shopify_id = shopify_id
         self.status = status  # draft, synced, failed
-        self.created_at = datetime.now(timezone.utc)
-        self.updated_at = datetime.now(timezone.utc)
+        self.created_at = now
+        self.updated_at = now
         self.last_sync = None
         self.is_deleted = False  # Soft delete flag
+        self._id = None
     
     @staticmethod
     def from_dict(data):
-        product = Product(
-            data['title'],
-            data['description'],
-            data['price'],
-            data['sku'],
-            data.get('image_url'),
-            data.get('shopify_id'),
-            data.get('status', 'draft'),
-            data.get('currency', 'USD')
-        )
-        product.thumbnail_url = data.get('thumbnail_url', data.get('image_url'))
-        product.created_at = data.get('created_at', datetime.now(timezone.utc))
-        product.updated_at = data.get('updated_at', datetime.now(timezone.utc))
-        product.last_sync = data.get('last_sync')
-        product.is_deleted = data.get('is_deleted', False)
-        product._id = data.get('_id')
+        """
+        Rehydrate a stored product document.
+        
+        Documents come from our own writes, so fields are copied as they are
+        without re-running the constructor's conversions or defaults for
+        timestamps; fields a narrower view projected away read as None.
+        """
+        get = data.get
+        product = Product.__new__(Product)
+        product.title = get('title')
+        product.description = get('description')
+        price = get('price')
+        product.price = float(price) if price is not None else None
+        product.currency = get('currency', 'USD')
+        product._price_text = get('price_text')
+        product.sku = get('sku')
+        product.image_url = get('image_url')
+        product._thumbnail_url = get('thumbnail_url', _UNSET)
+        product.shopify_id = get('shopify_id')
+        product.status = get('status', 'draft')
+        product.created_at = get('created_at')
+        product.updated_at = get('updated_at')
+        product.last_sync = get('last_sync')
+        product.is_deleted = get('is_deleted', False)
+        product._id = get('_id')
         return product
     
+    @property
+    def price_text(self):
+        """Price as a string without currency, e.g. '12.50'"""
+        if self._price_text is None and self.price is not None:
+            self._price_text = f"{self.price:.2f}"
+        return self._price_text
+    
+    @property
+    def thumbnail_url(self):
+        return self.image_url if self._thumbnail_url is _UNSET else self._thumbnail_url
+    
+    @thumbnail_url.setter
+    def thumbnail_url(self, value):
+        self._thumbnail_url = value
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -81,20 +123,30 @@ class Product:
             'image_url': self.image_url
         }
     
+    @staticmethod
+    def projection(view='full'):
+        """Mongo projection for a view, or None when the full document is needed"""
+        fields = Product.VIEW_FIELDS.get(view)
+        return {field: 1 for field in fields} if fields else None
+    
+    def to_view_dict(self, view='full'):
+        """Serialize for the given view: 'table', 'modal' or 'full'"""
+        if view == 'table':
+            return self.to_table_dict()
+        if view == 'modal':
+            return self.to_modal_dict()
+        return self.to_dict()
+    
     @property
     def id(self):
-        if hasattr(self, '_id'):
-            if isinstance(self._id, ObjectId):
-                return str(self._id)
-            return str(self._id)
-        return None
+        return str(self._id) if self._id is not None else None
     
     def update(self, data):
         self.title = data.get('title', self.title)
         self.description = data.get('description', self.description)
         if 'price' in data:
             self.price = float(data['price'])
-            self.price_text = f"{self.price:.2f}"
+            self._price_text = None
         if 'currency' in data:
             self.currency = data['currency']
         self.sku = data.get('sku', self.sku)
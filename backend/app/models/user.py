@@ -3,12 +3,15 @@ from .. import bcrypt
 from bson import ObjectId
 
 class User:
+    __slots__ = ('email', 'password_hash', 'name', 'created_at', 'last_login', '_id')
+    
     def __init__(self, email, password=None, name=None):
         self.email = email
         self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8') if password else None
         self.name = name
         self.created_at = datetime.now(timezone.utc)
         self.last_login = None
+        self._id = None
     
     def set_password(self, password):
         if not password:
@@ -17,13 +20,15 @@ class User:
     
     @staticmethod
     def from_dict(data):
+        """Rehydrate a stored user document without going through the hashing constructor"""
         if not data.get('email'):
             raise ValueError("Email is required")
             
-        user = User(data['email'], '')  # Temporary password
+        user = User.__new__(User)
+        user.email = data['email']
         user.password_hash = data.get('password_hash')  # Make password_hash optional
         user.name = data.get('name')
-        user.created_at = data.get('created_at', datetime.now(timezone.utc))
+        user.created_at = data.get('created_at')
         user.last_login = data.get('last_login')
         
         _id = data.get('_id')
@@ -60,4 +65,4 @@ class User:
     
     @property
     def id(self):
-        return str(self._id) if hasattr(self, '_id') else None 
\ No newline at end of file
+        return str(self._id) if self._id is not None else None 
\ No newline at end of file
@@ -7,6 +7,9 @@ from .. import db
 
 events_bp = Blueprint('events', __name__)
 
+# include_total values and the counting each one asks of the event queries
+INCLUDE_TOTAL_MODES = {'true': 'exact', 'estimated': 'estimated', 'false': 'none'}
+
 @events_bp.route('', methods=['GET'])
 @jwt_required()
 def get_events():
@@ -15,6 +18,11 @@ def get_events():
     event_type = request.args.get('event_type')
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 20))
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', 'true').lower()
+    if include_total not in INCLUDE_TOTAL_MODES:
+        return jsonify({'error': f"include_total must be one of: {', '.join(INCLUDE_TOTAL_MODES)}"}), 400
+    total_mode = INCLUDE_TOTAL_MODES[include_total]
     
     # Parse date parameters if provided
     start_date = None
@@ -46,7 +54,8 @@ def get_events():
     # Log the query parameters
     current_app.logger.info(f"Query parameters: start_date={start_date}, end_date={end_date}, user_id={user_id}, event_type={event_type}")
 
-    # Choose the appropriate query method based on parameters
+    # Choose the appropriate query method based on parameters; a cursor
+    # from the previous page's next_cursor replaces page
     try:
         if user_id:
             # If user_id is provided, use the user-specific query method
@@ -56,7 +65,9 @@ def get_events():
                 start_date=start_date,
                 end_date=end_date,
                 page=page,
-                per_page=per_page
+                per_page=per_page,
+                cursor=cursor,
+                total_mode=total_mode
             )
         else:
             # Without user_id, use the time range query method
@@ -65,12 +76,16 @@ def get_events():
                 end_date=end_date,
                 event_type=event_type,
                 page=page,
-                per_page=per_page
+                per_page=per_page,
+                cursor=cursor,
+                total_mode=total_mode
             )
         
         # Log the result
         current_app.logger.info(f"Query result: {result}")
         return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Error fetching events: {str(e)}")
         return jsonify({'error': 'Failed to fetch events'}), 500
@@ -0,0 +1,11 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required
+from ..helpers.metrics_helpers import snapshot
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('', methods=['GET'])
+@jwt_required()
+def get_metrics():
+    """Get counters, gauges and timings of the process serving this request"""
+    return jsonify(snapshot()), 200
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response
 from flask_jwt_extended import jwt_required
 from ..validations.product import ProductValidator
 from ..helpers.mongo_helpers import (
@@ -6,19 +6,55 @@ from ..helpers.mongo_helpers import (
     update_mongo_product, 
     delete_mongo_product,
     get_mongo_products,
-    get_mongo_product_by_id
+    get_mongo_product_by_id,
+    get_mongo_product_document,
+    iter_mongo_products
+)
+from ..helpers.shopify_helpers import (
+    create_shopify_product,
+    update_shopify_product,
+    delete_shopify_product,
+    shopify_available,
+    shopify_error_status,
+    SHOPIFY_REQUEST_BUDGET
+)
+from ..helpers.resilience_helpers import Deadline
+from ..helpers.event_writer_helpers import record_event
+from ..helpers.bulk_helpers import (
+    stage_bulk_import,
+    start_bulk_import,
+    product_update_fields,
+    apply_bulk_update,
+    apply_bulk_delete,
+    BULK_EDIT_MAX_ITEMS
+)
+from ..helpers.mongo_helpers import get_mongo_bulk_job
+from ..helpers.thumbnail_helpers import schedule_product_thumbnail
+from ..helpers.outbox_helpers import (
+    create_mongo_product_with_outbox,
+    update_mongo_product_with_outbox,
+    delete_mongo_product_with_outbox
 )
-from ..helpers.shopify_helpers import create_shopify_product, update_shopify_product, delete_shopify_product
-from ..helpers.postgres_helpers import create_event
 from ..helpers.jwt_helpers import get_user_identity_from_token
+from ..helpers.json_helpers import products_to_json, json_object_with
+from ..helpers.export_helpers import stream_product_export, EXPORT_MIMETYPES, PRODUCT_EXPORT_BATCH_SIZE
 from bson.objectid import ObjectId
 
 shopify_bp = Blueprint('shopify', __name__)
 
+def queue_shopify_sync():
+    """Whether this write should go through the outbox instead of calling Shopify inline"""
+    if current_app.config['SHOPIFY_SYNC_MODE'] == 'outbox':
+        return True
+    # While the circuit breaker is open, queue rather than fail only when
+    # configured to: the outbox needs a sync worker to drain it
+    return current_app.config['SHOPIFY_BREAKER_FALLBACK'] == 'outbox' and not shopify_available()
+
 @shopify_bp.route('', methods=['POST'])
 @jwt_required()
 def create_product():
     """Create a new product"""
+    deadline = Deadline(SHOPIFY_REQUEST_BUDGET)
     try:
         # Get user information using utility function
         user_id, user_name = get_user_identity_from_token()
@@ -30,6 +66,26 @@ def create_product():
         if validation_errors:
             return jsonify({'errors': validation_errors}), 400
         
+        # Outbox mode: commit the product and its pending sync, let workers call Shopify
+        if queue_shopify_sync():
+            try:
+                mongo_product = create_mongo_product_with_outbox(current_app.mongo, data)
+            except Exception as mongo_error:
+                return jsonify({'error': f'MongoDB creation failed: {str(mongo_error)}'}), 500
+            schedule_product_thumbnail(current_app.mongo, str(mongo_product._id), mongo_product.image_url)
+            
+            try:
+                record_event(
+                    user_id=user_id,
+                    user_name=user_name,
+                    product_id=str(mongo_product._id),
+                    product_title=mongo_product.title,
+                    event_type='create'
+                )
+            except Exception as event_error:
+                current_app.logger.error(f"Failed to record event: {str(event_error)}")
+            return jsonify(mongo_product.to_dict()), 202
+        
         # Step 1: Create in MongoDB (without shopify_id initially)
         try:
             mongo_product = create_mongo_product(current_app.mongo, data)
@@ -38,7 +94,7 @@ def create_product():
         
         # Step 2: Create in Shopify
         try:
-            shopify_product = create_shopify_product(data)
+            shopify_product = create_shopify_product(data, deadline=deadline)
             if not shopify_product:
                 # Rollback MongoDB creation
                 delete_mongo_product(current_app.mongo, str(mongo_product._id))
@@ -47,10 +103,11 @@ def create_product():
             # Update MongoDB with shopify_id
             update_mongo_product(current_app.mongo, str(mongo_product._id), {'shopify_id': shopify_product['id']})
             mongo_product.shopify_id = shopify_product['id']
+            schedule_product_thumbnail(current_app.mongo, str(mongo_product._id), mongo_product.image_url)
             
             # Create event record using data from request and JWT
             try:
-                create_event(
+                record_event(
                     user_id=user_id,
                     user_name=user_name,
                     product_id=str(mongo_product._id),
@@ -58,17 +115,109 @@ def create_product():
                     event_type='create'
                 )
             except Exception as event_error:
-                current_app.logger.error(f"Failed to create event: {str(event_error)}")
+                current_app.logger.error(f"Failed to record event: {str(event_error)}")
             return jsonify(mongo_product.to_dict()), 201
             
         except Exception as shopify_error:
             # Rollback MongoDB creation
             delete_mongo_product(current_app.mongo, str(mongo_product._id))
-            return jsonify({'error': f'Shopify creation failed: {str(shopify_error)}'}), 500
+            return jsonify({'error': f'Shopify creation failed: {str(shopify_error)}'}), shopify_error_status(shopify_error)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@shopify_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_import_products():
+    """Import a JSONL product catalog through a Shopify bulk mutation"""
+    try:
+        # Get user information using utility function
+        user_id, user_name = get_user_identity_from_token()
+        
+        # Step 1: Validate and insert into MongoDB in batches while streaming the body
+        try:
+            summary = stage_bulk_import(current_app.mongo, request.stream)
+        except Exception as mongo_error:
+            return jsonify({'error': f'Bulk import failed: {str(mongo_error)}'}), 500
+        
+        # Step 2: Hand the staged files to a background Shopify bulk operation
+        job = start_bulk_import(current_app._get_current_object(), summary, user_id, user_name)
+        
+        return jsonify({
+            'job_id': str(job['_id']),
+            'status': job['status'],
+            'accepted': summary['accepted'],
+            'rejected': summary['rejected'],
+            'errors': summary['errors']
+        }), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def bulk_response(results, queued):
+    """Per-item results with totals; 202 when the Shopify side was queued"""
+    succeeded = sum(1 for result in results if result['status'] < 300)
+    return jsonify({
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded
+    }), 202 if queued else 200
+
+@shopify_bp.route('/bulk', methods=['PATCH'])
+@jwt_required()
+def bulk_update_products():
+    """Update many products in one request"""
+    try:
+        # Get user information using utility function
+        user_id, user_name = get_user_identity_from_token()
+        
+        data = request.get_json(silent=True) or {}
+        items = data.get('products') if isinstance(data, dict) else None
+        validation_errors = ProductValidator.validate_bulk_items(items, 'products', BULK_EDIT_MAX_ITEMS)
+        if validation_errors:
+            return jsonify({'errors': validation_errors}), 400
+        
+        queued = queue_shopify_sync()
+        results = apply_bulk_update(current_app._get_current_object(), items, user_id, user_name, queued)
+        return bulk_response(results, queued)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@shopify_bp.route('/bulk', methods=['DELETE'])
+@jwt_required()
+def bulk_delete_products():
+    """Delete many products in one request"""
+    try:
+        # Get user information using utility function
+        user_id, user_name = get_user_identity_from_token()
+        
+        data = request.get_json(silent=True) or {}
+        product_ids = data.get('ids') if isinstance(data, dict) else None
+        validation_errors = ProductValidator.validate_bulk_items(product_ids, 'ids', BULK_EDIT_MAX_ITEMS)
+        if validation_errors:
+            return jsonify({'errors': validation_errors}), 400
+        
+        queued = queue_shopify_sync()
+        results = apply_bulk_delete(current_app._get_current_object(), product_ids, user_id, user_name, queued)
+        return bulk_response(results, queued)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@shopify_bp.route('/bulk/<job_id>', methods=['GET'])
+@jwt_required()
+def get_bulk_job(job_id):
+    """Get the progress of a bulk product job"""
+    try:
+        if not ObjectId.is_valid(job_id):
+            return jsonify({'errors': ['Invalid job ID format']}), 400
+        
+        job = get_mongo_bulk_job(current_app.mongo, job_id)
+        job['id'] = str(job.pop('_id'))
+        return jsonify(job), 200
+    except Exception as e:
+        if str(e).endswith("Bulk job not found"):
+            return jsonify({'error': 'Bulk job not found'}), 404
+        return jsonify({'error': str(e)}), 500
+
 @shopify_bp.route('', methods=['GET', 'OPTIONS'])
 @jwt_required()
 def get_products():
@@ -88,23 +237,76 @@ def get_products():
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
         search_query = request.args.get('q')
+        cursor = request.args.get('cursor')
+        search_mode = request.args.get('search_mode', 'indexed')
+        total_mode = request.args.get('total_mode', 'exact')
+        view = request.args.get('view', 'full')
         
-        result = get_mongo_products(
-            current_app.mongo,
-            sort_field=sort_field,
-            sort_order=sort_order,
-            page=page,
-            per_page=per_page,
-            search_query=search_query
-        )
+        try:
+            result = get_mongo_products(
+                current_app.mongo,
+                sort_field=sort_field,
+                sort_order=sort_order,
+                page=page,
+                per_page=per_page,
+                search_query=search_query,
+                cursor=cursor,
+                search_mode=search_mode,
+                total_mode=total_mode,
+                view=view,
+                raw=True
+            )
+        except ValueError as query_error:
+            return jsonify({'errors': [str(query_error)]}), 400
         
-        return jsonify({
-            'products': [p.to_dict() for p in result['products']],
+        # Rows are transcoded from raw BSON straight to JSON bytes
+        body = json_object_with('products', products_to_json(result['products'], view), {
             'total': result['total'],
+            'total_exact': result['total_exact'],
             'page': result['page'],
             'per_page': result['per_page'],
-            'total_pages': result['total_pages']
-        }), 200
+            'total_pages': result['total_pages'],
+            'next_cursor': result['next_cursor']
+        })
+        return Response(body, status=200, mimetype='application/json')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@shopify_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_products():
+    """Stream every product matching the list filters as NDJSON or CSV"""
+    try:
+        # Same filters as the list endpoint; page and per_page are ignored
+        validation_errors = ProductValidator.validate_export_params(request.args)
+        if validation_errors:
+            return jsonify({'errors': validation_errors}), 400
+        
+        export_format = request.args.get('format', 'ndjson')
+        compress = request.args.get('gzip', 'false').lower() == 'true'
+        view = request.args.get('view', 'full')
+        
+        try:
+            cursor = iter_mongo_products(
+                current_app.mongo,
+                sort_field=request.args.get('sort_by', 'created_at'),
+                sort_order=request.args.get('order', 'desc'),
+                search_query=request.args.get('q'),
+                search_mode=request.args.get('search_mode', 'indexed'),
+                view=view,
+                batch_size=PRODUCT_EXPORT_BATCH_SIZE
+            )
+        except ValueError as query_error:
+            return jsonify({'errors': [str(query_error)]}), 400
+        chunks = stream_product_export(cursor, export_format, view=view, compress=compress)
+        
+        filename = f"products.{export_format}" + ('.gz' if compress else '')
+        return Response(
+            chunks,
+            status=200,
+            mimetype='application/gzip' if compress else EXPORT_MIMETYPES[export_format],
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -115,11 +317,13 @@ def get_product(product_id):
     try:
         # Validate product ID
         validation_errors = ProductValidator.validate_product_id(product_id)
+        validation_errors.extend(ProductValidator.validate_query_params(request.args))
         if validation_errors:
             return jsonify({'errors': validation_errors}), 400
         
-        product = get_mongo_product_by_id(current_app.mongo, product_id)
-        return jsonify(product.to_dict()), 200
+        view = request.args.get('view', 'full')
+        product = get_mongo_product_by_id(current_app.mongo, product_id, view=view)
+        return jsonify(product.to_view_dict(view)), 200
     except Exception as e:
         if str(e) == "Product not found":
             return jsonify({'error': str(e)}), 404
@@ -129,6 +333,7 @@ def get_product(product_id):
 @jwt_required()
 def update_product(product_id):
     """Update an existing product"""
+    deadline = Deadline(SHOPIFY_REQUEST_BUDGET)
     try:
         # Get user information using utility function
         user_id, user_name = get_user_identity_from_token()
@@ -145,29 +350,39 @@ def update_product(product_id):
         if validation_errors:
             return jsonify({'errors': validation_errors}), 400
         
-        # Find existing product and store old data for potential rollback
-        old_product_data = current_app.mongo.products.find_one({
-            '_id': ObjectId(product_id),
-            'is_deleted': False
-        })
+        # Find existing product and store old data for potential rollback. Read from
+        # MongoDB, not the cache: this is the diff baseline and the rollback image
+        old_product_data = get_mongo_product_document(current_app.mongo, product_id, cached=False)
         
-        if not old_product_data:
+        if not old_product_data or old_product_data.get('is_deleted'):
             return jsonify({'error': 'Product not found'}), 404
         
         # Prepare update fields
-        update_fields = {}
-        updatable_fields = ['title', 'description', 'price', 'sku', 'image_url', 'status']
-        
-        for field in updatable_fields:
-            if field in data:
-                if field == 'price' and data[field] is not None:
-                    update_fields[field] = float(data[field])
-                else:
-                    update_fields[field] = data[field]
-        
+        update_fields = product_update_fields(data)
         if not update_fields:
             return jsonify({'message': 'No fields to update'}), 400
         
+        # Outbox mode: commit the update and its pending sync, let workers call Shopify
+        if queue_shopify_sync():
+            try:
+                mongo_product = update_mongo_product_with_outbox(current_app.mongo, product_id, update_fields)
+            except Exception as mongo_error:
+                return jsonify({'error': f'MongoDB update failed: {str(mongo_error)}'}), 500
+            if 'image_url' in update_fields:
+                schedule_product_thumbnail(current_app.mongo, product_id, update_fields['image_url'])
+            
+            try:
+                record_event(
+                    user_id=user_id,
+                    user_name=user_name,
+                    product_id=str(mongo_product._id),
+                    product_title=mongo_product.title,
+                    event_type='update'
+                )
+            except Exception as event_error:
+                current_app.logger.error(f"Failed to record event: {str(event_error)}")
+            return jsonify(mongo_product.to_dict()), 202
+        
         # Step 1: Update in MongoDB
         try:
             mongo_product = update_mongo_product(current_app.mongo, product_id, update_fields)
@@ -177,7 +392,9 @@ def update_product(product_id):
         # Step 2: Update in Shopify if shopify_id exists
         if old_product_data.get('shopify_id'):
             try:
-                shopify_product = update_shopify_product(old_product_data['shopify_id'], data)
+                shopify_product = update_shopify_product(
+                    old_product_data['shopify_id'], update_fields, old_product_data, deadline=deadline
+                )
                 if not shopify_product:
                     # Rollback MongoDB update using old data
                     update_mongo_product(current_app.mongo, product_id, old_product_data)
@@ -186,11 +403,14 @@ def update_product(product_id):
             except Exception as shopify_error:
                 # Rollback MongoDB update using old data
                 update_mongo_product(current_app.mongo, product_id, old_product_data)
-                return jsonify({'error': f'Shopify update failed: {str(shopify_error)}'}), 500
+                return jsonify({'error': f'Shopify update failed: {str(shopify_error)}'}), shopify_error_status(shopify_error)
+        
+        if 'image_url' in update_fields:
+            schedule_product_thumbnail(current_app.mongo, product_id, update_fields['image_url'])
         
         # Create event record using data from request/MongoDB and JWT
         try:
-            create_event(
+            record_event(
                 user_id=user_id,
                 user_name=user_name,
                 product_id=str(mongo_product._id),
@@ -198,7 +418,7 @@ def update_product(product_id):
                 event_type='update'
             )
         except Exception as event_error:
-            current_app.logger.error(f"Failed to create event: {str(event_error)}")
+            current_app.logger.error(f"Failed to record event: {str(event_error)}")
         
         return jsonify(mongo_product.to_dict()), 200
             
@@ -209,6 +429,7 @@ def update_product(product_id):
 @jwt_required()
 def delete_product(product_id):
     """Delete a product"""
+    deadline = Deadline(SHOPIFY_REQUEST_BUDGET)
     try:
         # Get user information using utility function
         user_id, user_name = get_user_identity_from_token()
@@ -218,12 +439,32 @@ def delete_product(product_id):
         if validation_errors:
             return jsonify({'errors': validation_errors}), 400
         
-        # Find product
-        mongo_product = get_mongo_product_by_id(current_app.mongo, product_id)
+        # Find product, from MongoDB rather than the cache: a stale shopify_id would
+        # send the delete to the wrong place
+        mongo_product = get_mongo_product_by_id(current_app.mongo, product_id, cached=False)
         
         if not mongo_product:
             return jsonify({'error': 'Product not found'}), 404
         
+        # Outbox mode: commit the soft delete and its pending sync, let workers call Shopify
+        if queue_shopify_sync():
+            try:
+                delete_mongo_product_with_outbox(current_app.mongo, product_id)
+            except Exception as mongo_error:
+                return jsonify({'error': f'MongoDB deletion failed: {str(mongo_error)}'}), 500
+            
+            try:
+                record_event(
+                    user_id=user_id,
+                    user_name=user_name,
+                    product_id=str(mongo_product._id),
+                    product_title=mongo_product.title,
+                    event_type='delete'
+                )
+            except Exception as event_error:
+                current_app.logger.error(f"Failed to record event: {str(event_error)}")
+            return jsonify({'message': 'Product deletion queued'}), 202
+        
         # Step 1: Soft delete in MongoDB
         try:
             delete_mongo_product(current_app.mongo, product_id)
@@ -233,7 +474,7 @@ def delete_product(product_id):
         # Step 2: Delete from Shopify if shopify_id exists
         if mongo_product.shopify_id:
             try:
-                deleted_id = delete_shopify_product(mongo_product.shopify_id)
+                deleted_id = delete_shopify_product(mongo_product.shopify_id, deadline=deadline)
                 if not deleted_id:
                     # Rollback MongoDB soft delete
                     update_mongo_product(current_app.mongo, product_id, {'is_deleted': False})
@@ -242,11 +483,11 @@ def delete_product(product_id):
             except Exception as shopify_error:
                 # Rollback MongoDB soft delete
                 update_mongo_product(current_app.mongo, product_id, {'is_deleted': False})
-                return jsonify({'error': f'Shopify deletion failed: {str(shopify_error)}'}), 500
+                return jsonify({'error': f'Shopify deletion failed: {str(shopify_error)}'}), shopify_error_status(shopify_error)
         
         # Create event record using data from MongoDB and JWT
         try:
-            create_event(
+            record_event(
                 user_id=user_id,
                 user_name=user_name,
                 product_id=str(mongo_product._id),
@@ -254,7 +495,7 @@ def delete_product(product_id):
                 event_type='delete'
             )
         except Exception as event_error:
-            current_app.logger.error(f"Failed to create event: {str(event_error)}")
+            current_app.logger.error(f"Failed to record event: {str(event_error)}")
         
         return jsonify({'message': 'Product deleted successfully'}), 200
             
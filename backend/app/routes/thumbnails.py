@@ -0,0 +1,12 @@
+from flask import Blueprint, send_from_directory
+from ..helpers.thumbnail_helpers import THUMBNAIL_DIR
+
+thumbnails_bp = Blueprint('thumbnails', __name__)
+
+# One year: file names are content hashes, so a URL never changes content
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+@thumbnails_bp.route('/<path:filename>', methods=['GET'])
+def get_thumbnail(filename):
+    """Serve a generated thumbnail"""
+    return send_from_directory(THUMBNAIL_DIR, filename, max_age=THUMBNAIL_MAX_AGE)
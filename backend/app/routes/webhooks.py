@@ -0,0 +1,26 @@
+from flask import Blueprint, request, jsonify, current_app
+from ..helpers.webhook_helpers import WEBHOOK_TOPICS, verify_webhook_hmac, enqueue_webhook
+
+webhooks_bp = Blueprint('webhooks', __name__)
+
+@webhooks_bp.route('', methods=['POST'])
+def receive_webhook():
+    """Verify and queue a Shopify product webhook; applying it happens in `flask webhook-worker`"""
+    body = request.get_data()
+    if not verify_webhook_hmac(body, request.headers.get('X-Shopify-Hmac-Sha256')):
+        return jsonify({'error': 'Invalid webhook signature'}), 401
+    
+    topic = request.headers.get('X-Shopify-Topic')
+    webhook_id = request.headers.get('X-Shopify-Webhook-Id')
+    if topic not in WEBHOOK_TOPICS or not webhook_id:
+        # Acknowledge anything we don't handle so Shopify stops retrying it
+        return '', 200
+    
+    try:
+        payload = request.get_json(force=True)
+        enqueue_webhook(current_app.mongo, webhook_id, topic, payload)
+    except Exception as e:
+        current_app.logger.error(f"Failed to queue webhook {webhook_id}: {str(e)}")
+        return jsonify({'error': 'Failed to queue webhook'}), 500
+    
+    return '', 200
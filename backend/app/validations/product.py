@@ -218,12 +218,24 @@ class ProductValidator:
     @staticmethod
     def validate_query_params(params: Dict[str, Any]) -> List[str]:
         errors = []
-        allowed_sort_fields = ['title', 'price', 'created_at', 'updated_at', 'sku']
+        allowed_sort_fields = ['title', 'price', 'created_at', 'updated_at', 'sku', 'relevance']
         allowed_orders = ['asc', 'desc']
+        allowed_search_modes = ['indexed', 'regex']
+        allowed_total_modes = ['exact', 'estimated', 'none']
+        allowed_views = ['table', 'modal', 'full']
         
         if 'sort_by' in params and params['sort_by'] not in allowed_sort_fields:
             errors.append(f"Sort field must be one of: {', '.join(allowed_sort_fields)}")
             
+        if 'search_mode' in params and params['search_mode'] not in allowed_search_modes:
+            errors.append(f"Search mode must be one of: {', '.join(allowed_search_modes)}")
+            
+        if 'total_mode' in params and params['total_mode'] not in allowed_total_modes:
+            errors.append(f"Total mode must be one of: {', '.join(allowed_total_modes)}")
+            
+        if 'view' in params and params['view'] not in allowed_views:
+            errors.append(f"View must be one of: {', '.join(allowed_views)}")
+            
         if 'order' in params and params['order'] not in allowed_orders:
             errors.append(f"Sort order must be one of: {', '.join(allowed_orders)}")
             
@@ -243,6 +255,30 @@ class ProductValidator:
             
         return errors
 
+    @classmethod
+    def validate_export_params(cls, params: Dict[str, Any]) -> List[str]:
+        errors = cls.validate_query_params(params)
+        allowed_formats = ['ndjson', 'csv']
+        
+        if params.get('format', 'ndjson') not in allowed_formats:
+            errors.append(f"Export format must be one of: {', '.join(allowed_formats)}")
+            
+        if params.get('gzip', 'false').lower() not in ['true', 'false']:
+            errors.append("gzip must be true or false")
+            
+        return errors
+
+    @staticmethod
+    def validate_bulk_items(items: Any, key: str, max_items: int) -> List[str]:
+        errors = []
+        
+        if not isinstance(items, list) or not items:
+            errors.append(f"Request body must contain a non-empty '{key}' list")
+        elif len(items) > max_items:
+            errors.append(f"Cannot process more than {max_items} {key} at once")
+            
+        return errors
+
     @staticmethod
     def validate_product_id(product_id: str) -> List[str]:
         errors = []
@@ -0,0 +1,160 @@
+"""
+Compare rehydrating stored documents into the slotted Product and User
+models against the dict-backed classes they replaced (reproduced below as
+the baseline): time per object and memory held per object.
+
+No database is needed; documents are built the way MongoDB returns them.
+
+    python -m benchmarks.bench_models --objects 100000
+"""
+import gc
+import time
+import argparse
+import tracemalloc
+from datetime import datetime, timezone, timedelta
+from bson import ObjectId
+from app.models.product import Product
+from app.models.user import User
+
+
+class DictProduct:
+    """Product before __slots__: from_dict ran the full constructor, then overwrote it"""
+
+    def __init__(self, title, description, price, sku, image_url=None, shopify_id=None, status='draft', currency='USD'):
+        self.title = title
+        self.description = description
+        self.price = float(price)
+        self.currency = currency
+        self.price_text = f"{float(price):.2f}"
+        self.sku = sku
+        self.image_url = image_url
+        self.thumbnail_url = image_url
+        self.shopify_id = shopify_id
+        self.status = status
+        self.created_at = datetime.now(timezone.utc)
+        self.updated_at = datetime.now(timezone.utc)
+        self.last_sync = None
+        self.is_deleted = False
+
+    @staticmethod
+    def from_dict(data):
+        product = DictProduct(
+            data['title'],
+            data.get('description'),
+            data['price'],
+            data.get('sku'),
+            data.get('image_url'),
+            data.get('shopify_id'),
+            data.get('status', 'draft'),
+            data.get('currency', 'USD')
+        )
+        product.thumbnail_url = data.get('thumbnail_url', data.get('image_url'))
+        product.created_at = data.get('created_at', datetime.now(timezone.utc))
+        product.updated_at = data.get('updated_at', datetime.now(timezone.utc))
+        product.last_sync = data.get('last_sync')
+        product.is_deleted = data.get('is_deleted', False)
+        product._id = data.get('_id')
+        return product
+
+
+class DictUser:
+    """User before __slots__: from_dict went through the constructor with a placeholder password"""
+
+    def __init__(self, email, password=None, name=None):
+        self.email = email
+        # The real constructor hashes a truthy password with bcrypt; from_dict passed ''
+        self.password_hash = None
+        self.name = name
+        self.created_at = datetime.now(timezone.utc)
+        self.last_login = None
+
+    @staticmethod
+    def from_dict(data):
+        if not data.get('email'):
+            raise ValueError("Email is required")
+        user = DictUser(data['email'], '')
+        user.password_hash = data.get('password_hash')
+        user.name = data.get('name')
+        user.created_at = data.get('created_at', datetime.now(timezone.utc))
+        user.last_login = data.get('last_login')
+        _id = data.get('_id')
+        user._id = ObjectId(_id) if _id and isinstance(_id, str) else _id
+        return user
+
+
+def product_document(i):
+    created = datetime(2024, 1, 1) + timedelta(minutes=i)
+    price = round(10 + i % 500 + 0.99, 2)
+    return {
+        '_id': ObjectId(),
+        'title': f'Benchmark product {i}',
+        'description': 'A short product description',
+        'price': price,
+        'currency': 'USD',
+        'price_text': f'{price:.2f}',
+        'sku': f'BENCH-{i:06d}',
+        'image_url': f'https://cdn.shopify.com/p/{i}.jpg',
+        'thumbnail_url': f'/api/thumbnails/ab/{i}_table.jpg',
+        'shopify_id': f'gid://shopify/Product/{i}',
+        'status': 'synced',
+        'created_at': created,
+        'updated_at': created,
+        'last_sync': created,
+        'is_deleted': False
+    }
+
+
+def user_document(i):
+    return {
+        '_id': ObjectId(),
+        'email': f'user{i}@example.com',
+        'password_hash': '$2b$12$' + 'x' * 53,
+        'name': f'User {i}',
+        'created_at': datetime(2024, 1, 1) + timedelta(minutes=i),
+        'last_login': None
+    }
+
+
+def measure(from_dict, documents, repeat):
+    """Best rehydration time for all documents, and bytes the resulting objects hold"""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        objects = [from_dict(document) for document in documents]
+        best = min(best, time.perf_counter() - started)
+        del objects
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [from_dict(document) for document in documents]
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objects
+    return best, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--objects', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs; the best is reported')
+    args = parser.parse_args()
+
+    cases = [
+        ('Product', product_document, DictProduct.from_dict, Product.from_dict),
+        ('User', user_document, DictUser.from_dict, User.from_dict),
+    ]
+    print(f"{'model':>8}{'objects':>9}{'dict us/obj':>13}{'slots us/obj':>14}{'speedup':>9}"
+          f"{'dict B/obj':>12}{'slots B/obj':>13}{'saved':>8}")
+    for name, make_document, old, new in cases:
+        documents = [make_document(i) for i in range(args.objects)]
+        old_time, old_bytes = measure(old, documents, args.repeat)
+        new_time, new_bytes = measure(new, documents, args.repeat)
+        n = args.objects
+        print(f"{name:>8}{n:>9}{old_time / n * 1e6:>13.2f}{new_time / n * 1e6:>14.2f}{old_time / new_time:>8.1f}x"
+              f"{old_bytes / n:>12.0f}{new_bytes / n:>13.0f}{1 - new_bytes / old_bytes:>7.0%}")
+
+
+if __name__ == '__main__':
+    main()
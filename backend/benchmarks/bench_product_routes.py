@@ -0,0 +1,113 @@
+"""
+Load-test the product write routes against the fake Shopify Admin API and
+report p50/p95/p99 latency and throughput per route.
+
+Needs the MongoDB and PostgreSQL from .env; Shopify is replaced by
+tools.fake_shopify running in-process.
+
+    python -m benchmarks.bench_product_routes --requests 300 --concurrency 8 --latency-ms 80
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from tools.fake_shopify import start_fake_shopify, add_fault_arguments, fault_options
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300, help='Product lifecycles (create, update, delete) to run')
+    parser.add_argument('--concurrency', type=int, default=8)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_fake_shopify(**fault_options(args))
+    host, port = server.server_address
+    # Must be set before the app modules read their configuration
+    os.environ['SHOPIFY_API_URL'] = f'http://{host}:{port}/admin/api/2024-01/graphql.json'
+    os.environ['SHOPIFY_STORE_URL'] = 'bench.myshopify.com'
+    os.environ['SHOPIFY_SCHEMA_CACHE_DIR'] = tempfile.mkdtemp(prefix='shopify-schema-')
+    os.environ['SHOPIFY_THROTTLE_STATE_DIR'] = tempfile.mkdtemp(prefix='shopify-throttle-')
+
+    from flask_jwt_extended import get_csrf_token
+    from app import create_app
+    from app.helpers.jwt_helpers import create_user_tokens
+    from app.helpers.metrics_helpers import snapshot
+
+    app = create_app()
+    with app.app_context():
+        access_token, _ = create_user_tokens('benchmark', 'Benchmark')
+        csrf_token = get_csrf_token(access_token)
+
+    latencies = defaultdict(list)
+    failures = defaultdict(int)
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def timed(name, call, expected):
+        started = time.perf_counter()
+        response = call()
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies[name].append(elapsed)
+            if response.status_code not in expected:
+                failures[name] += 1
+        return response
+
+    def worker():
+        client = app.test_client()
+        client.set_cookie('access_token_cookie', access_token)
+        headers = {'X-CSRF-TOKEN': csrf_token}
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            created = timed('POST /api/products', lambda: client.post('/api/products', headers=headers, json={
+                'title': f'Benchmark product {i}',
+                'description': 'Created by the product route benchmark',
+                'price': 19.99,
+                'sku': f'BENCH-{os.getpid()}-{i}'
+            }), (201, 202))
+            if created.status_code not in (201, 202):
+                continue
+            product_id = created.get_json()['id']
+            timed('PUT /api/products/<id>', lambda: client.put(
+                f'/api/products/{product_id}', headers=headers, json={'price': 24.99}
+            ), (200, 202))
+            timed('DELETE /api/products/<id>', lambda: client.delete(
+                f'/api/products/{product_id}', headers=headers
+            ), (200, 202))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"lifecycles={args.requests} concurrency={args.concurrency} "
+          f"shopify latency={args.latency_ms}ms error_rate={args.error_rate} bucket={args.bucket_size}/{args.restore_rate}")
+    print(f"{'route':<28}{'count':>7}{'fail':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, values in latencies.items():
+        print(f"{name:<28}{len(values):>7}{failures[name]:>6}"
+              f"{percentile(values, 0.50) * 1000:>9.1f}{percentile(values, 0.95) * 1000:>9.1f}{percentile(values, 0.99) * 1000:>9.1f}")
+    print(f"throughput={total / elapsed:.1f} req/s over {elapsed:.1f}s")
+    print(f"shopify throttled={snapshot()['counters'].get('shopify.throttled', 0):.0f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare the product list serialization paths on synthetic pages: decoded
+dicts through Product.from_dict/to_dict/jsonify against raw BSON transcoded
+by json_helpers.products_to_json.
+
+No database is needed; each page is encoded to the BSON a cursor batch
+would carry (projected to the view's fields, as the list query does) and
+decoded the way each path's cursor would.
+
+    python -m benchmarks.bench_product_serialization --pages 20 100 1000
+"""
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+import bson
+from bson import ObjectId
+from flask import Flask, jsonify
+from app.models.product import Product
+from app.helpers.json_helpers import RAW_CODEC_OPTIONS, products_to_json, json_object_with
+
+
+def make_document(i, description_length):
+    created = datetime(2024, 1, 1) + timedelta(minutes=i)
+    price = round(random.uniform(1, 500), 2)
+    return {
+        '_id': ObjectId(),
+        'title': f'Benchmark product {i}',
+        'description': 'x' * description_length,
+        'price': price,
+        'currency': 'USD',
+        'price_text': f'{price:.2f}',
+        'sku': f'BENCH-{i:06d}',
+        'sku_ngrams': ['ben', 'enc', 'nch'],
+        'image_url': f'https://cdn.shopify.com/p/{i}.jpg',
+        'thumbnail_url': f'/api/thumbnails/ab/{i}_table.jpg',
+        'shopify_id': f'gid://shopify/Product/{i}',
+        'status': 'synced',
+        'created_at': created,
+        'updated_at': created,
+        'last_sync': created,
+        'is_deleted': False
+    }
+
+
+def current_path(batch, view):
+    documents = bson.decode_all(batch)
+    products = [Product.from_dict(document) for document in documents]
+    return jsonify({'products': [p.to_view_dict(view) for p in products], 'total': len(products)}).get_data()
+
+
+def fast_path(batch, view):
+    documents = bson.decode_all(batch, RAW_CODEC_OPTIONS)
+    return json_object_with('products', products_to_json(documents, view), {'total': len(documents)})
+
+
+def timed(fn, batch, view, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn(batch, view)
+        best = min(best, time.perf_counter() - started)
+    return best, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[20, 100, 1000], help='Page sizes to measure')
+    parser.add_argument('--views', nargs='+', default=['full', 'table'], choices=['full', 'table', 'modal'])
+    parser.add_argument('--description-length', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=50, help='Runs per measurement; the best is reported')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    print(f"{'rows':>6}{'view':>7}{'current ms':>12}{'fast ms':>10}{'speedup':>9}{'bytes':>10}")
+    with app.app_context():
+        for rows in args.pages:
+            documents = [make_document(i, args.description_length) for i in range(rows)]
+            for view in args.views:
+                projection = Product.projection(view)
+                batch = b''.join(
+                    bson.encode({k: v for k, v in document.items() if projection is None or k in projection or k == '_id'})
+                    for document in documents
+                )
+                current, _ = timed(current_path, batch, view, args.repeat)
+                fast, size = timed(fast_path, batch, view, args.repeat)
+                print(f"{rows:>6}{view:>7}{current * 1000:>12.2f}{fast * 1000:>10.2f}{current / fast:>8.1f}x{size:>10}")
+
+
+if __name__ == '__main__':
+    main()
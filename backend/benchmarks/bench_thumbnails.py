@@ -0,0 +1,47 @@
+"""
+Drive the thumbnail pipeline against the local image server stand-in and
+report cache hit ratio and processing time.
+
+    python -m benchmarks.bench_thumbnails --urls 200 --distinct 40
+"""
+import time
+import argparse
+import tempfile
+from app.helpers.metrics_helpers import snapshot
+from app.helpers.thumbnail_helpers import ThumbnailPipeline
+from tools.image_server import start_image_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--urls', type=int, default=200, help='Number of product image URLs')
+    parser.add_argument('--distinct', type=int, default=40, help='Number of distinct images behind them')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    server = start_image_server()
+    host, port = server.server_address
+    output_dir = tempfile.mkdtemp(prefix='thumbnails-')
+    pipeline = ThumbnailPipeline(output_dir=output_dir, workers=args.workers)
+
+    # Several URLs share each image, as when variants reuse a product photo
+    urls = [f"http://{host}:{port}/p{i}/{i % args.distinct}.png" for i in range(args.urls)]
+
+    started = time.monotonic()
+    for future in [pipeline.submit(url) for url in urls]:
+        future.result()
+    elapsed = time.monotonic() - started
+
+    metrics = snapshot()
+    hits = metrics['counters'].get('thumbnails.cache_hits', 0)
+    misses = metrics['counters'].get('thumbnails.cache_misses', 0)
+    process = metrics['timings'].get('thumbnails.process_seconds', {})
+    print(f"urls={args.urls} distinct={args.distinct} workers={args.workers}")
+    print(f"hits={hits:.0f} misses={misses:.0f} hit_ratio={hits / (hits + misses):.2%}")
+    print(f"render avg={process.get('avg', 0) * 1000:.1f}ms max={process.get('max', 0) * 1000:.1f}ms")
+    print(f"wall={elapsed:.2f}s throughput={args.urls / elapsed:.1f} images/s output={output_dir}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
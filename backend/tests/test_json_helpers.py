@@ -0,0 +1,30 @@
+import json
+from datetime import datetime
+import bson
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from flask import Flask, jsonify
+from app.helpers.json_helpers import products_to_json
+from app.models.product import Product
+
+
+def test_product_list_dates_match_jsonify():
+    document = {
+        '_id': ObjectId(),
+        'title': 'Tea pot',
+        'description': 'Cast iron',
+        'price': 12.5,
+        'currency': 'USD',
+        'sku': 'TEA-1',
+        'created_at': datetime(2024, 1, 1, 0, 1, 0, 123000),
+        'updated_at': datetime(2024, 1, 2, 12, 0, 0),
+        'last_sync': None,
+        'is_deleted': False,
+    }
+    with Flask(__name__).app_context():
+        expected = jsonify(Product.from_dict(dict(document)).to_dict()).get_json()
+    row = json.loads(products_to_json([RawBSONDocument(bson.encode(document))]))[0]
+
+    for field in ('created_at', 'updated_at', 'last_sync'):
+        assert row[field] == expected[field]
+    assert row['created_at'] == 'Mon, 01 Jan 2024 00:01:00 GMT'
@@ -0,0 +1,16 @@
+from app.helpers.search_helpers import build_search_query, search_term
+from app.helpers.mongo_helpers import product_list_query
+
+
+def test_blank_search_is_no_search():
+    for blank in ['', ' ', '\t\n']:
+        assert search_term(blank) is None
+        assert build_search_query(blank) == {}
+        assert build_search_query(blank, 'regex') == {}
+        assert product_list_query(blank) == {'is_deleted': False}
+
+
+def test_short_term_searches_sku_prefix():
+    query = build_search_query(' ab ')
+    assert query['$or'][1] == {'sku': {'$regex': '^AB'}}
+    assert query['$or'][0] == {'$text': {'$search': 'ab'}}
@@ -0,0 +1,542 @@
+"""
+Local stand-in for the Shopify Admin GraphQL API.
+
+Implements the product mutations used by app/helpers/shopify_helpers.py on an
+in-memory store, answers schema introspection, and returns Shopify-style
+query cost extensions from a leaky bucket. Latency, throttling and failures
+can be injected to load-test product writes without a real store.
+
+    python -m tools.fake_shopify --port 8082 --latency-ms 80 --error-rate 0.01
+
+Point the backend at it with SHOPIFY_API_URL=http://127.0.0.1:8082/admin/api/2024-01/graphql.json
+
+Requests are validated against the real Admin API schema when one is
+available: pass --schema with an introspection result, such as the
+.shopify_cache/admin-<version>.json the backend saves after talking to a real
+store, or set SHOPIFY_ADMIN_SCHEMA. Without one the fake falls back to
+SCHEMA_SDL, a hand-copied subset that can drift from Shopify.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from graphql import build_schema, build_client_schema, graphql_sync, parse, OperationDefinitionNode, OperationType
+
+DEFAULT_SCHEMA_PATH = os.getenv('SHOPIFY_ADMIN_SCHEMA', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '.shopify_cache', 'admin-2024-01.json'
+))
+
+# Fallback subset of the Admin API 2024-01 schema, copied from Shopify's reference
+SCHEMA_SDL = """
+scalar Money
+scalar URL
+
+interface Node {
+    id: ID!
+}
+
+type Image {
+    id: ID
+    url: URL!
+}
+
+type ImageEdge {
+    node: Image!
+}
+
+type ImageConnection {
+    edges: [ImageEdge!]!
+}
+
+interface Media {
+    id: ID!
+}
+
+type MediaImage implements Node & Media {
+    id: ID!
+    image: Image
+}
+
+type ProductVariant {
+    price: Money!
+    sku: String
+}
+
+type ProductVariantEdge {
+    node: ProductVariant!
+}
+
+type ProductVariantConnection {
+    edges: [ProductVariantEdge!]!
+}
+
+type Product implements Node {
+    id: ID!
+    title: String!
+    descriptionHtml: String!
+    variants(first: Int): ProductVariantConnection!
+    images(first: Int): ImageConnection!
+}
+
+type ProductEdge {
+    node: Product!
+}
+
+type ProductConnection {
+    edges: [ProductEdge!]!
+}
+
+enum BulkOperationStatus {
+    CANCELED
+    CANCELING
+    COMPLETED
+    CREATED
+    EXPIRED
+    FAILED
+    RUNNING
+}
+
+type BulkOperation implements Node {
+    id: ID!
+    status: BulkOperationStatus!
+    errorCode: String
+    objectCount: String!
+    url: URL
+    partialDataUrl: URL
+}
+
+type UserError {
+    field: [String!]
+    message: String!
+}
+
+type MediaUserError {
+    field: [String!]
+    message: String!
+}
+
+type StagedUploadParameter {
+    name: String!
+    value: String!
+}
+
+type StagedMediaUploadTarget {
+    url: URL
+    resourceUrl: URL
+    parameters: [StagedUploadParameter!]!
+}
+
+input ProductVariantInput {
+    price: Money
+    sku: String
+}
+
+input ProductInput {
+    id: ID
+    title: String
+    descriptionHtml: String
+    variants: [ProductVariantInput!]
+}
+
+input ProductDeleteInput {
+    id: ID!
+}
+
+enum MediaContentType {
+    EXTERNAL_VIDEO
+    IMAGE
+    MODEL_3D
+    VIDEO
+}
+
+input CreateMediaInput {
+    mediaContentType: MediaContentType!
+    originalSource: String!
+    alt: String
+}
+
+enum StagedUploadTargetGenerateUploadResource {
+    BULK_MUTATION_VARIABLES
+    IMAGE
+}
+
+enum StagedUploadHttpMethodType {
+    POST
+    PUT
+}
+
+input StagedUploadInput {
+    resource: StagedUploadTargetGenerateUploadResource!
+    filename: String!
+    mimeType: String!
+    httpMethod: StagedUploadHttpMethodType
+}
+
+type ProductCreatePayload {
+    product: Product
+    userErrors: [UserError!]!
+}
+
+type ProductUpdatePayload {
+    product: Product
+    userErrors: [UserError!]!
+}
+
+type ProductDeletePayload {
+    deletedProductId: ID
+    userErrors: [UserError!]!
+}
+
+type ProductCreateMediaPayload {
+    media: [Media!]
+    mediaUserErrors: [MediaUserError!]!
+}
+
+type ProductDeleteImagesPayload {
+    deletedImageIds: [ID!]
+    product: Product
+    userErrors: [UserError!]!
+}
+
+type StagedUploadsCreatePayload {
+    stagedTargets: [StagedMediaUploadTarget!]
+    userErrors: [UserError!]!
+}
+
+type BulkOperationRunMutationPayload {
+    bulkOperation: BulkOperation
+    userErrors: [UserError!]!
+}
+
+type BulkOperationRunQueryPayload {
+    bulkOperation: BulkOperation
+    userErrors: [UserError!]!
+}
+
+type Query {
+    node(id: ID!): Node
+    product(id: ID!): Product
+    products(first: Int, query: String): ProductConnection!
+}
+
+type Mutation {
+    productCreate(input: ProductInput!, media: [CreateMediaInput!]): ProductCreatePayload
+    productUpdate(input: ProductInput!): ProductUpdatePayload
+    productDelete(input: ProductDeleteInput!): ProductDeletePayload
+    productCreateMedia(productId: ID!, media: [CreateMediaInput!]!): ProductCreateMediaPayload
+    productDeleteImages(id: ID!, imageIds: [ID!]!): ProductDeleteImagesPayload
+    stagedUploadsCreate(input: [StagedUploadInput!]!): StagedUploadsCreatePayload
+    bulkOperationRunMutation(mutation: String!, stagedUploadPath: String!): BulkOperationRunMutationPayload
+    bulkOperationRunQuery(query: String!): BulkOperationRunQueryPayload
+}
+"""
+
+UNSUPPORTED = [{'field': None, 'message': 'Not supported by the fake Shopify server'}]
+
+
+class ProductStore:
+    """In-memory products keyed by GID"""
+
+    def __init__(self):
+        self.products = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _gid(self, kind):
+        return f"gid://shopify/{kind}/{next(self._ids)}"
+
+    @staticmethod
+    def _view(product):
+        return {
+            'id': product['id'],
+            'title': product['title'],
+            'descriptionHtml': product['descriptionHtml'],
+            'variants': {'edges': [{'node': dict(product['variant'])}]},
+            'images': {'edges': [{'node': media['image']} for media in product['images']]}
+        }
+
+    @staticmethod
+    def _apply_input(product, product_input):
+        for field in ('title', 'descriptionHtml'):
+            if field in product_input:
+                product[field] = product_input[field]
+        if product_input.get('variants'):
+            product['variant'].update({k: v for k, v in product_input['variants'][0].items() if v is not None})
+
+    def _add_media(self, product, media):
+        created = []
+        for item in media or []:
+            image = {
+                '__typename': 'MediaImage',
+                'id': self._gid('MediaImage'),
+                'image': {'id': self._gid('ProductImage'), 'url': item['originalSource']}
+            }
+            product['images'].append(image)
+            created.append(image)
+        return created
+
+    def create(self, product_input, media=None):
+        if not product_input.get('title'):
+            return {'product': None, 'userErrors': [{'field': ['title'], 'message': "Title can't be blank"}]}
+        with self.lock:
+            product = {
+                'id': self._gid('Product'),
+                'title': '',
+                'descriptionHtml': '',
+                'variant': {'price': '0.00', 'sku': None},
+                'images': []
+            }
+            self._apply_input(product, product_input)
+            self._add_media(product, media)
+            self.products[product['id']] = product
+            return {'product': self._view(product), 'userErrors': []}
+
+    def update(self, product_input):
+        with self.lock:
+            product = self.products.get(product_input.get('id'))
+            if product is None:
+                return {'product': None, 'userErrors': [{'field': ['id'], 'message': 'Product does not exist'}]}
+            self._apply_input(product, product_input)
+            return {'product': self._view(product), 'userErrors': []}
+
+    def delete(self, product_id):
+        with self.lock:
+            if self.products.pop(product_id, None) is None:
+                return {'deletedProductId': None, 'userErrors': [{'field': ['id'], 'message': 'Product does not exist'}]}
+            return {'deletedProductId': product_id, 'userErrors': []}
+
+    def create_media(self, product_id, media):
+        with self.lock:
+            product = self.products.get(product_id)
+            if product is None:
+                return {'media': None, 'mediaUserErrors': [{'field': ['productId'], 'message': 'Product does not exist'}]}
+            return {'media': self._add_media(product, media), 'mediaUserErrors': []}
+
+    def delete_images(self, product_id, image_ids):
+        with self.lock:
+            product = self.products.get(product_id)
+            if product is None:
+                return {'deletedImageIds': None, 'userErrors': [{'field': ['id'], 'message': 'Product does not exist'}]}
+            wanted = set(image_ids)
+            deleted = [media['image']['id'] for media in product['images'] if media['image']['id'] in wanted]
+            product['images'] = [media for media in product['images'] if media['image']['id'] not in wanted]
+            return {'deletedImageIds': deleted, 'product': self._view(product), 'userErrors': []}
+
+    def get(self, product_id):
+        with self.lock:
+            product = self.products.get(product_id)
+            return self._view(product) if product else None
+
+
+class CostBucket:
+    """Server-side leaky bucket matching Shopify's throttleStatus semantics"""
+
+    def __init__(self, maximum, restore_rate):
+        self.maximum = maximum
+        self.restore_rate = restore_rate
+        self.available = maximum
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def spend(self, cost):
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.maximum, self.available + (now - self.updated_at) * self.restore_rate)
+            self.updated_at = now
+            allowed = self.available >= cost
+            if allowed:
+                self.available -= cost
+            return allowed, {
+                'maximumAvailable': self.maximum,
+                'currentlyAvailable': int(self.available),
+                'restoreRate': self.restore_rate
+            }
+
+
+def estimate_query_cost(document):
+    """Approximate Shopify's cost: 10 per mutation field, 1 per object plus connection sizes"""
+    cost = 0
+    for definition in document.definitions:
+        if not isinstance(definition, OperationDefinitionNode):
+            continue
+        if definition.operation == OperationType.MUTATION:
+            cost += 10 * len(definition.selection_set.selections)
+        else:
+            cost += 1 + len(definition.selection_set.selections)
+    return max(cost, 1)
+
+
+def load_schema(path=DEFAULT_SCHEMA_PATH):
+    """The Admin API schema from an introspection result at path, else the bundled subset"""
+    if path and os.path.exists(path):
+        with open(path) as f:
+            introspection = json.load(f)
+        return build_client_schema(introspection.get('data', introspection))
+    return build_schema(SCHEMA_SDL)
+
+
+class FakeShopify:
+    def __init__(self, latency_ms=50.0, latency_sigma=0.4, error_rate=0.0, stall_rate=0.0,
+                 stall_seconds=30.0, bucket_size=1000, restore_rate=50, seed=None, schema_path=DEFAULT_SCHEMA_PATH):
+        self.schema = load_schema(schema_path)
+        self.store = ProductStore()
+        self.bucket = CostBucket(bucket_size, restore_rate)
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.root = self._root_value()
+
+    def _root_value(self):
+        store = self.store
+        # The real schema has optional arguments the bundled one lacks, hence **_
+        return {
+            'node': lambda info, id, **_: store.get(id),
+            'product': lambda info, id=None, **_: store.get(id),
+            'products': lambda info, **_: {'edges': []},
+            'productCreate': lambda info, input, media=None, **_: store.create(input, media),
+            'productUpdate': lambda info, input, **_: store.update(input),
+            'productDelete': lambda info, input, **_: store.delete(input['id']),
+            'productCreateMedia': lambda info, productId, media, **_: store.create_media(productId, media),
+            'productDeleteImages': lambda info, id, imageIds, **_: store.delete_images(id, imageIds),
+            'stagedUploadsCreate': lambda info, input, **_: {'stagedTargets': None, 'userErrors': UNSUPPORTED},
+            'bulkOperationRunMutation': lambda info, **_: {'bulkOperation': None, 'userErrors': UNSUPPORTED},
+            'bulkOperationRunQuery': lambda info, **_: {'bulkOperation': None, 'userErrors': UNSUPPORTED},
+        }
+
+    def _sample(self):
+        with self.random_lock:
+            latency = self.random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+            return latency, self.random.random() < self.error_rate, self.random.random() < self.stall_rate
+
+    def handle(self, payload):
+        """Return (http_status, response_body) for one GraphQL request; raw bytes are sent as HTML"""
+        latency, fail, stall = self._sample()
+        time.sleep(self.stall_seconds if stall else latency)
+        if fail:
+            # Shopify's edge answers gateway errors with an HTML page, not GraphQL JSON
+            return 502, b'<html><body><h1>502 Bad Gateway</h1></body></html>'
+
+        query = payload.get('query', '')
+        try:
+            document = parse(query)
+        except Exception as e:
+            return 200, {'errors': [{'message': str(e)}]}
+
+        is_introspection = '__schema' in query
+        cost = estimate_query_cost(document)
+        extensions = None
+        if not is_introspection:
+            allowed, throttle_status = self.bucket.spend(cost)
+            extensions = {'cost': {
+                'requestedQueryCost': cost,
+                'actualQueryCost': cost if allowed else None,
+                'throttleStatus': throttle_status
+            }}
+            if not allowed:
+                return 200, {
+                    'errors': [{'message': 'Throttled', 'extensions': {'code': 'THROTTLED'}}],
+                    'extensions': extensions
+                }
+
+        result = graphql_sync(
+            self.schema,
+            query,
+            root_value=self.root,
+            variable_values=payload.get('variables'),
+            operation_name=payload.get('operationName'),
+            type_resolver=lambda value, info, abstract_type: value.get('__typename', 'Product')
+        )
+        body = {'data': result.data}
+        if result.errors:
+            body['errors'] = [{'message': error.message} for error in result.errors]
+        if extensions:
+            body['extensions'] = extensions
+        return 200, body
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                payload = {}
+            status, body = fake.handle(payload)
+            if isinstance(body, bytes):
+                data, content_type = body, 'text/html'
+            else:
+                data, content_type = json.dumps(body).encode('utf-8'), 'application/json'
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up (timed out) while we were stalling
+                self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_fake_shopify(host='127.0.0.1', port=0, **options):
+    """Start the fake server in a background thread; port 0 picks a free port"""
+    fake = FakeShopify(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.fake = fake
+    return server
+
+
+def add_fault_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Median response latency')
+    parser.add_argument('--latency-sigma', type=float, default=0.4, help='Log-normal spread of latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 502')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='Fraction of requests that hang')
+    parser.add_argument('--stall-seconds', type=float, default=30.0)
+    parser.add_argument('--bucket-size', type=int, default=1000, help='Cost points in the throttle bucket')
+    parser.add_argument('--restore-rate', type=int, default=50, help='Cost points restored per second')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--schema', default=DEFAULT_SCHEMA_PATH,
+                        help='Admin API introspection JSON to validate against; the bundled subset if missing')
+
+
+def fault_options(args):
+    return {
+        'latency_ms': args.latency_ms,
+        'latency_sigma': args.latency_sigma,
+        'error_rate': args.error_rate,
+        'stall_rate': args.stall_rate,
+        'stall_seconds': args.stall_seconds,
+        'bucket_size': args.bucket_size,
+        'restore_rate': args.restore_rate,
+        'seed': args.seed,
+        'schema_path': args.schema
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeShopify(**fault_options(args))))
+    server.daemon_threads = True
+    print(f"Fake Shopify Admin API on http://{args.host}:{args.port}/admin/api/<version>/graphql.json")
+    server.serve_forever()
@@ -0,0 +1,74 @@
+"""
+Local stand-in for a product image CDN.
+
+GET /<seed>.png returns a deterministic PNG for that seed, so different URLs
+with the same seed serve identical bytes (useful to exercise content-hash
+deduplication). Query parameters: w, h (pixels) and delay (seconds).
+
+    python -m tools.image_server --port 8081
+"""
+import io
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from PIL import Image
+
+
+def render_image(seed, width, height):
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(8):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        box = (x0, y0, min(width, x0 + rng.randrange(1, width)), min(height, y0 + rng.randrange(1, height)))
+        image.paste(tuple(rng.randrange(256) for _ in range(3)), box)
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    cache = {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        seed = url.path.rsplit('/', 1)[-1].split('.', 1)[0]
+        width = int(params.get('w', [1200])[0])
+        height = int(params.get('h', [1200])[0])
+        delay = float(params.get('delay', [0])[0])
+        if delay:
+            time.sleep(delay)
+
+        key = (seed, width, height)
+        body = self.cache.get(key)
+        if body is None:
+            body = self.cache[key] = render_image(seed, width, height)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_image_server(host='127.0.0.1', port=0):
+    """Start the server in a background thread and return it; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), ImageHandler)
+    print(f"Serving images on http://{args.host}:{args.port}/<seed>.png")
+    server.serve_forever()
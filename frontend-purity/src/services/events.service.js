@@ -7,6 +7,8 @@ const eventsService = {
       ...(params.event_type && { event_type: params.event_type }),
       ...(params.start_date && { start_date: params.start_date }),
       ...(params.end_date && { end_date: params.end_date }),
+      ...(params.cursor && { cursor: params.cursor }),
+      ...(params.include_total && { include_total: params.include_total }),
       page: params.page || 1,
       per_page: params.per_page || 20
     };